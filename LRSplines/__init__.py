@@ -1,6 +1,16 @@
+from LRSplines.assembly import *
 from LRSplines.aux_split_functions import *
 from LRSplines.b_spline import *
+from LRSplines.delta import *
 from LRSplines.element import *
+from LRSplines.frozen_lr_spline import *
+from LRSplines.instrumentation import *
+from LRSplines.journal import *
+from LRSplines.lr_reader import *
 from LRSplines.lr_spline import *
 from LRSplines.meshline import *
+from LRSplines.multigrid import *
+from LRSplines.quasi_interpolation import *
 from LRSplines.statistics import *
+from LRSplines.storage import *
+from LRSplines.tiling import *
@@ -0,0 +1,269 @@
+"""
+Incremental assembly of Galerkin matrices over an LR-spline. An AssemblyCache keeps the local matrix of every element,
+and listens to the refinement deltas of the LR-spline (see LRSpline.subscribe). After an insertion, only the local
+matrices of the elements that were split or created, or whose supported basis functions changed, are recomputed.
+
+Local matrices are computed by an element_matrix callable, taking an element and returning a square array indexed
+as element.supported_b_splines. mass_matrix and stiffness_matrix compute the standard ones by Gauss quadrature.
+
+Assembling global matrices requires scipy.
+"""
+import typing
+
+import numpy as np
+
+from LRSplines.element import Element
+from LRSplines.evaluation import univariate_values
+
+if False:
+    from LRSplines.delta import RefinementDelta
+    from LRSplines.lr_spline import LRSpline
+
+
+def _quadrature(element: Element, order: typing.Optional[int]) -> typing.Tuple[np.ndarray, np.ndarray,
+                                                                                np.ndarray]:
+    """
+    Returns Gauss-Legendre points in u and v, and the tensor product weights (including the Jacobian) on the
+    element. The default order integrates products of two basis functions exactly.
+    """
+    b = element.supported_b_splines[0]
+    if order is None:
+        order = max(b.degree_u, b.degree_v) + 1
+    x, w = np.polynomial.legendre.leggauss(order)
+    hu, hv = 0.5 * (element.u_max - element.u_min), 0.5 * (element.v_max - element.v_min)
+    u = element.u_min + hu * (x + 1)
+    v = element.v_min + hv * (x + 1)
+    return u, v, np.outer(w * hu, w * hv).ravel()
+
+
+def _basis_at_quadrature(element: Element, u: np.ndarray, v: np.ndarray, ru: int, rv: int) -> np.ndarray:
+    """
+    Evaluates the (ru, rv) partial derivative of the supported B-splines of the element at the tensor grid u x v.
+
+    :return: array of shape (k, len(u) * len(v))
+    """
+    functions = element.supported_b_splines
+    b = functions[0]
+    Fu = univariate_values(u, np.array([f.knots_u for f in functions]), np.array([f.end_u for f in functions]),
+                           b.degree_u, ru)
+    Fv = univariate_values(v, np.array([f.knots_v for f in functions]), np.array([f.end_v for f in functions]),
+                           b.degree_v, rv)
+    weights = np.array([f.weight for f in functions], dtype=np.float64)
+    return weights[:, None] * (Fu[:, :, None] * Fv[:, None, :]).reshape(len(functions), -1)
+
+
+def mass_matrix(element: Element, order: int = None) -> np.ndarray:
+    """
+    Returns the local mass matrix, the integrals of B_i * B_j over the element, for the supported B-splines.
+
+    :param element: element to integrate over
+    :param order: number of Gauss points per direction
+    :return: array of shape (k, k)
+    """
+    u, v, w = _quadrature(element, order)
+    B = _basis_at_quadrature(element, u, v, 0, 0)
+    return (B * w) @ B.T
+
+
+def stiffness_matrix(element: Element, order: int = None) -> np.ndarray:
+    """
+    Returns the local stiffness matrix, the integrals of grad B_i . grad B_j over the element, for the supported
+    B-splines.
+
+    :param element: element to integrate over
+    :param order: number of Gauss points per direction
+    :return: array of shape (k, k)
+    """
+    u, v, w = _quadrature(element, order)
+    Bu = _basis_at_quadrature(element, u, v, 1, 0)
+    Bv = _basis_at_quadrature(element, u, v, 0, 1)
+    return (Bu * w) @ Bu.T + (Bv * w) @ Bv.T
+
+
+def _element_pairs(counts: np.ndarray, functions: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the row and column of every entry of the local matrices, in row major order, for elements supporting
+    counts[k] of the given functions each, listed element by element in functions.
+    """
+    offsets = np.repeat(np.cumsum(counts) - counts, counts ** 2)
+    local = np.arange(len(offsets)) - np.repeat(np.cumsum(counts ** 2) - counts ** 2, counts ** 2)
+    size = np.repeat(counts, counts ** 2)
+    return functions[offsets + local // size], functions[offsets + local % size]
+
+
+def overlap_pattern(element_indptr: np.ndarray, element_indices: np.ndarray,
+                    n: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the symmetric sparsity pattern of the pairs of basis functions supported on a common element, from the
+    CSR table mapping elements to their supported basis functions (see LRSpline._evaluation_arrays), in one pass
+    over the elements.
+
+    :param element_indptr: CSR row pointers of the element table, shape (m + 1, )
+    :param element_indices: positions of the supported basis functions, element by element
+    :param n: number of basis functions
+    :return: CSR row pointers, shape (n + 1, ), and column indices, sorted within each row
+    """
+    rows, columns = _element_pairs(np.diff(element_indptr), np.asarray(element_indices, dtype=np.intp))
+    keys = np.unique(rows.astype(np.int64) * n + columns)
+    indptr = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(np.bincount(keys // n, minlength=n), out=indptr[1:])
+    return indptr, (keys % n).astype(np.intp)
+
+
+def load_vector(f: typing.Callable, order: int = None) -> typing.Callable[[Element], np.ndarray]:
+    """
+    Returns an element_vector callable computing the integrals of f * B_i over the element.
+
+    :param f: right hand side, vectorized f(u, v)
+    :param order: number of Gauss points per direction
+    :return: element_vector callable
+    """
+
+    def element_vector(element: Element) -> np.ndarray:
+        u, v, w = _quadrature(element, order)
+        B = _basis_at_quadrature(element, u, v, 0, 0)
+        U, V = np.meshgrid(u, v, indexing='ij')
+        return B @ (w * f(U.ravel(), V.ravel()))
+
+    return element_vector
+
+
+class AssemblyCache(object):
+    """
+    Caches the local matrices (and optionally vectors) of all elements of an LR-spline, and keeps them up to date
+    through refinement. Global matrices are indexed by basis function id, or by position in LR.S with dense=True.
+
+    LR.compact renumbers the ids without publishing a delta, so a new cache has to be created after compacting.
+    """
+
+    def __init__(self, LR: 'LRSpline', element_matrix: typing.Callable[[Element], np.ndarray] = stiffness_matrix,
+                 element_vector: typing.Callable[[Element], np.ndarray] = None) -> None:
+        """
+        Initialize the cache, and subscribe to the refinement deltas of LR. No local matrices are computed until
+        they are needed.
+
+        :param LR: the LR-spline
+        :param element_matrix: computes the local matrix of an element
+        :param element_vector: computes the local vector of an element, optional
+        """
+        self.LR = LR
+        self.element_matrix = element_matrix
+        self.element_vector = element_vector
+        # per element position: ids of the supported B-splines, local matrix and local vector
+        self._ids: typing.List[typing.Optional[np.ndarray]] = [None] * len(LR.M)
+        self._matrices: typing.List[typing.Optional[np.ndarray]] = [None] * len(LR.M)
+        self._vectors: typing.List[typing.Optional[np.ndarray]] = [None] * len(LR.M)
+        self._elements_of_id: typing.Dict[int, typing.Set[int]] = {}
+        self._position = {id(e): k for k, e in enumerate(LR.M)}
+        self._dirty = set(range(len(LR.M)))
+        self._assembled = None
+        self.elements_recomputed = 0
+        LR.subscribe(self._on_refinement)
+
+    def close(self) -> None:
+        """
+        Stops listening to the refinement of the LR-spline.
+        """
+        self.LR.unsubscribe(self._on_refinement)
+
+    def _on_refinement(self, delta: 'RefinementDelta') -> None:
+        """
+        Marks the elements affected by a refinement as dirty.
+        """
+        LR = self.LR
+        for k in delta.new_elements:
+            self._position[id(LR.M[k])] = k
+        grow = len(LR.M) - len(self._ids)
+        self._ids += [None] * grow
+        self._matrices += [None] * grow
+        self._vectors += [None] * grow
+
+        dirty = self._dirty
+        dirty.update(delta.split_elements.tolist())
+        dirty.update(delta.new_elements.tolist())
+        for i in np.concatenate((delta.added, delta.modified)).tolist():
+            dirty.update(self._position[id(e)] for e in LR.basis_function(i).elements_of_support)
+        for i in np.concatenate((delta.removed, delta.modified)).tolist():
+            dirty.update(self._elements_of_id.get(i, ()))
+        if delta.changed:
+            self._assembled = None
+
+    @property
+    def dirty_elements(self) -> typing.List[int]:
+        """
+        Positions of the elements whose local matrices are out of date.
+        """
+        return sorted(self._dirty)
+
+    def update(self) -> int:
+        """
+        Recomputes the local matrices of the dirty elements.
+
+        :return: number of elements recomputed
+        """
+        dirty = sorted(self._dirty)
+        for k in dirty:
+            e = self.LR.M[k]
+            old_ids = self._ids[k]
+            if old_ids is not None:
+                for i in old_ids.tolist():
+                    self._elements_of_id[i].discard(k)
+            ids = np.array([b.id for b in e.supported_b_splines], dtype=np.intp)
+            for i in ids.tolist():
+                self._elements_of_id.setdefault(i, set()).add(k)
+            self._ids[k] = ids
+            self._matrices[k] = np.asarray(self.element_matrix(e), dtype=np.float64)
+            if self.element_vector is not None:
+                self._vectors[k] = np.asarray(self.element_vector(e), dtype=np.float64)
+        self._dirty.clear()
+        if dirty:
+            self._assembled = None
+        self.elements_recomputed += len(dirty)
+        return len(dirty)
+
+    def _triplets(self) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        self.update()
+        if self._assembled is None:
+            counts = np.array([len(ids) for ids in self._ids], dtype=np.intp)
+            rows, columns = _element_pairs(counts, np.concatenate(self._ids))
+            values = np.concatenate([m.ravel() for m in self._matrices])
+            self._assembled = (rows, columns, values)
+        return self._assembled
+
+    def _dense_index(self, dense: bool) -> typing.Tuple[typing.Optional[np.ndarray], int]:
+        if not dense:
+            return None, self.LR.id_capacity
+        position = np.full(self.LR.id_capacity, -1, dtype=np.intp)
+        position[self.LR.active_ids] = np.arange(len(self.LR.S))
+        return position, len(self.LR.S)
+
+    def matrix(self, dense: bool = False):
+        """
+        Returns the assembled global matrix, updating the dirty local matrices first.
+
+        :param dense: index by position in LR.S instead of by id
+        :return: scipy.sparse.csr_matrix of shape (id_capacity, id_capacity), or (len(S), len(S)) with dense
+        """
+        from scipy.sparse import coo_matrix
+
+        rows, columns, values = self._triplets()
+        position, n = self._dense_index(dense)
+        if position is not None:
+            rows, columns = position[rows], position[columns]
+        return coo_matrix((values, (rows, columns)), shape=(n, n)).tocsr()
+
+    def vector(self, dense: bool = False) -> np.ndarray:
+        """
+        Returns the assembled global vector, updating the dirty local vectors first.
+
+        :param dense: index by position in LR.S instead of by id
+        :return: array of shape (id_capacity, ), or (len(S), ) with dense
+        """
+        if self.element_vector is None:
+            raise ValueError('The assembly cache has no element_vector')
+        self.update()
+        ids = np.concatenate(self._ids)
+        position, n = self._dense_index(dense)
+        if position is not None:
+            ids = position[ids]
+        return np.bincount(ids, weights=np.concatenate(self._vectors), minlength=n)
@@ -26,6 +26,15 @@ def _split_weights(knots: np.ndarray, x: float) -> typing.Tuple[float, float]:
     return alpha_1, alpha_2
 
 
+def _copy_coefficient(coefficient):
+    """
+    Copies a scalar or vector valued coefficient, so that split B-splines do not share coefficient arrays.
+    """
+    if isinstance(coefficient, np.ndarray):
+        return coefficient.copy()
+    return coefficient
+
+
 def _split(alpha_1: float, alpha_2: float, b: BSpline, m: Meshline, new_knots: np.ndarray) -> typing.Tuple[
     BSpline, BSpline]:
     """
@@ -53,7 +62,8 @@ def _split(alpha_1: float, alpha_2: float, b: BSpline, m: Meshline, new_knots: n
         b2.south = b.south
 
         if b.end_u:
-            b1.end_u = False
+            # the left half only reaches the end of the domain if the last knot is repeated
+            b1.end_u = abs(b1.knots_u[-1] - b.knots_u[-1]) < 1.0e-14
             b2.end_u = True
 
         if b.east:
@@ -75,7 +85,8 @@ def _split(alpha_1: float, alpha_2: float, b: BSpline, m: Meshline, new_knots: n
         b2.west = b.west
 
         if b.end_v:
-            b1.end_v = False
+            # the lower half only reaches the end of the domain if the last knot is repeated
+            b1.end_v = abs(b1.knots_v[-1] - b.knots_v[-1]) < 1.0e-14
             b2.end_v = True
 
         if b.north:
@@ -83,6 +94,10 @@ def _split(alpha_1: float, alpha_2: float, b: BSpline, m: Meshline, new_knots: n
         if b.south:
             b1.south = True
 
+    # both halves inherit the coefficient, so that the spline is unchanged by the split.
+    b1.coefficient = _copy_coefficient(b.coefficient)
+    b2.coefficient = _copy_coefficient(b.coefficient)
+
     return b1, b2
 
 
@@ -1,3 +1,4 @@
+import functools
 import typing
 from math import factorial
 
@@ -10,20 +11,27 @@ Vector = typing.List['float']
 ElementVector = typing.List['Element']
 
 
-def memoize(f):
-    class MemoClass():
-        def __init__(self, f):
-            self.f = f
-            self.cache = {}
+def memoize(f, maxsize=2 ** 16):
+    """
+    Caches f(x, knots, degree, endpoint, r), keyed on the point, the knot values and the remaining parameters.
+    The cache is a bounded LRU cache (functools.lru_cache), which is safe to share between threads.
+
+    :param f: univariate evaluation function to cache
+    :param maxsize: maximum number of cached evaluations
+    :return: cached version of f, with cache_info and cache_clear attached
+    """
+
+    @functools.lru_cache(maxsize=maxsize)
+    def cached(x, knots, degree, endpoint, r):
+        return f(x, np.frombuffer(knots, dtype=np.float64), degree, endpoint, r)
 
-        def __call__(self, x, knots, degree, endpoint=False, r=0):
-            knots = np.array(knots)
-            key = '{} {} {} {}'.format(x, degree, endpoint, r) + str(knots.tostring())
-            if key not in self.cache:
-                self.cache[key] = f(x, knots, degree, endpoint, r)
-            return self.cache[key]
+    @functools.wraps(f)
+    def wrapper(x, knots, degree, endpoint=False, r=0):
+        return cached(float(x), np.asarray(knots, dtype=np.float64).tobytes(), degree, endpoint, r)
 
-    return MemoClass(f)
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
 
 
 @memoize
@@ -68,6 +76,144 @@ def _evaluate_univariate_b_spline(x: float, knots: typing.Union[Vector, np.ndarr
     return factorial(degree) * c.squeeze() / factorial(degree - r)
 
 
+def _safe_divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Elementwise a / b, with the convention that division by zero yields zero (as for repeated knots).
+    """
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape, dtype=np.float64), where=b != 0)
+
+
+def _evaluate_univariate_b_splines(x: np.ndarray, knots: np.ndarray, degree: int, endpoint=False,
+                                   r=0) -> np.ndarray:
+    """
+    Evaluates N univariate B-splines at N points in one vectorized pass, the i-th B-spline being defined by the
+    local knot vector knots[i] and evaluated at x[i].
+
+    The B-splines are evaluated as half open on their support, unless endpoint[i] is set, in which case the
+    i-th B-spline is evaluated as the limit from the left at the last knot. This agrees with
+    _evaluate_univariate_b_spline.
+
+    :param x: points of evaluation, shape (N, )
+    :param knots: local knot vectors, shape (N, degree + 2)
+    :param degree: polynomial degree
+    :param endpoint: bool or boolean array of shape (N, )
+    :param r: derivative
+    :return: array of shape (N, ) with B_i^(r)(x_i)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    t = np.asarray(knots, dtype=np.float64).reshape(len(x), degree + 2)
+    if r > degree:
+        return np.zeros(len(x))
+
+    X = x[:, None]
+    B = _degree_zero_b_splines(x, t, degree, endpoint)
+    for k in range(1, degree - r + 1):
+        B = _raise_degree(B, X, t, degree, k)
+    for k in range(degree - r + 1, degree + 1):
+        B = _raise_derivative(B, t, degree, k)
+
+    return B[:, 0]
+
+
+def _evaluate_univariate_b_spline_derivatives(x: np.ndarray, knots: np.ndarray, degree: int, endpoint=False,
+                                              order=1) -> np.ndarray:
+    """
+    Like _evaluate_univariate_b_splines, but evaluates all derivatives up to the given order at once. The value
+    recursion is shared between the derivatives, the derivative of order r branching off at degree - r.
+
+    :param x: points of evaluation, shape (N, )
+    :param knots: local knot vectors, shape (N, degree + 2)
+    :param degree: polynomial degree
+    :param endpoint: bool or boolean array of shape (N, )
+    :param order: highest derivative
+    :return: array of shape (order + 1, N) with B_i^(r)(x_i) in row r
+    """
+    x = np.asarray(x, dtype=np.float64)
+    t = np.asarray(knots, dtype=np.float64).reshape(len(x), degree + 2)
+    result = np.zeros((order + 1, len(x)))
+
+    X = x[:, None]
+    B = _degree_zero_b_splines(x, t, degree, endpoint)
+    for k in range(0, degree + 1):
+        if k > 0:
+            B = _raise_degree(B, X, t, degree, k)
+        r = degree - k
+        if r <= order:
+            D = B
+            for j in range(k + 1, degree + 1):
+                D = _raise_derivative(D, t, degree, j)
+            result[r] = D[:, 0]
+
+    return result
+
+
+def _integrate_univariate_b_splines(knots: np.ndarray, degree: int, a: float = None, b: float = None,
+                                    moment=0) -> np.ndarray:
+    """
+    Integrates N univariate B-splines, given by the rows of knots, times x ** moment for moment 0 or 1.
+
+    Over the whole support, the integral is (t_last - t_first) / (degree + 1), and the first moment the integral
+    times the average of the degree + 2 knots. Over an interval [a, b], the B-splines are integrated by
+    Gauss-Legendre quadrature on each knot interval clipped to [a, b], which is exact for the polynomial pieces.
+
+    :param knots: local knot vectors, shape (N, degree + 2)
+    :param degree: polynomial degree
+    :param a: left end of the interval of integration, the whole support if not given
+    :param b: right end of the interval of integration
+    :param moment: 0 for the integrals, 1 for the first moments
+    :return: array of shape (N, )
+    """
+    t = np.asarray(knots, dtype=np.float64).reshape(-1, degree + 2)
+    if a is None:
+        integrals = (t[:, -1] - t[:, 0]) / (degree + 1)
+        return integrals * t.mean(axis=1) if moment else integrals
+
+    x, w = np.polynomial.legendre.leggauss((degree + moment) // 2 + 1)
+    lower, upper = np.clip(t[:, :-1], a, b), np.clip(t[:, 1:], a, b)
+    h = 0.5 * (upper - lower)
+    points = lower[:, :, None] + h[:, :, None] * (x + 1)
+    values = _evaluate_univariate_b_splines(points.ravel(), np.repeat(t, points[0].size, axis=0), degree)
+    values = values.reshape(points.shape) * (points if moment else 1)
+    return np.einsum('ijk,ij,k->i', values, h, w)
+
+
+def _degree_zero_b_splines(x: np.ndarray, t: np.ndarray, degree: int, endpoint) -> np.ndarray:
+    """
+    Evaluates the degree zero B-splines on each of the degree + 1 local knot intervals, shape (N, degree + 1).
+    """
+    X = x[:, None]
+    B = ((t[:, :-1] <= X) & (X < t[:, 1:])).astype(np.float64)
+
+    at_end = np.logical_and(endpoint, x == t[:, -1])
+    if np.any(at_end):
+        # evaluate as the limit from the left, that is, on the last non-empty knot interval
+        rows = np.flatnonzero(at_end)
+        non_empty = t[rows, 1:] > t[rows, :-1]
+        last = degree - np.argmax(non_empty[:, ::-1], axis=1)
+        B[rows] = 0
+        B[rows, last] = 1
+    return B
+
+
+def _raise_degree(B: np.ndarray, X: np.ndarray, t: np.ndarray, degree: int, k: int) -> np.ndarray:
+    """
+    One step of the recurrence relation, from the B-splines of degree k - 1 to those of degree k.
+    """
+    left = _safe_divide(X - t[:, :degree + 1 - k], t[:, k:degree + 1] - t[:, :degree + 1 - k])
+    right = _safe_divide(t[:, k + 1:] - X, t[:, k + 1:] - t[:, 1:degree + 2 - k])
+    return left * B[:, :-1] + right * B[:, 1:]
+
+
+def _raise_derivative(B: np.ndarray, t: np.ndarray, degree: int, k: int) -> np.ndarray:
+    """
+    One step of the derivative formula, from (derivatives of) B-splines of degree k - 1 to the derivatives of
+    those of degree k.
+    """
+    left = _safe_divide(B[:, :-1], t[:, k:degree + 1] - t[:, :degree + 1 - k])
+    right = _safe_divide(B[:, 1:], t[:, k + 1:] - t[:, 1:degree + 2 - k])
+    return k * (left - right)
+
+
 def _augment_knots(knots: Vector, degree: int) -> np.ndarray:
     """
     Adds degree + 1 values to either end of the knot vector, in order to facilitate matrix based evaluation.
@@ -79,27 +225,30 @@ def _augment_knots(knots: Vector, degree: int) -> np.ndarray:
     return np.pad(knots, (degree + 1, degree + 1), 'constant', constant_values=(knots[0] - 1, knots[-1] + 1))
 
 
-def _find_knot_interval(x: float, knots: np.ndarray, endpoint=False) -> int:
+def _find_knot_interval(x: typing.Union[float, np.ndarray], knots: np.ndarray,
+                        endpoint=False) -> typing.Union[int, np.ndarray]:
     """
-    Finds the index i such that knots[i] <= x < knots[i+1]
+    Finds the index i such that knots[i] <= x < knots[i+1], by binary search in the sorted knot vector.
+    Points outside [knots[0], knots[-1]) give -1. With endpoint, points in [knots[-2], knots[-1]] give
+    len(knots) - 2, so that the last knot belongs to the last interval.
 
     :param endpoint:
-    :param x: point of interest
+    :param x: point of interest, a scalar or an array
     :param knots: knot vector
-    :return: index i
+    :return: index i, an int for scalar x, otherwise an array of the shape of x
     """
+    knots = np.asarray(knots)
+    x_array = np.asarray(x)
+    i = np.searchsorted(knots, x_array, side='right') - 1
 
-    # if we have requested end point, and are at the end, return corresponding index.
-    if endpoint and (knots[-2] <= x <= knots[-1]):
-        i = max(np.argmax(knots < x) - 1, 0)
-        return len(knots) - i - 2
+    # if we are outside the domain, return -1
+    i = np.where((x_array < knots[0]) | (x_array >= knots[-1]), -1, i)
 
-    # if we are utside the domain, return -1
-    if x < knots[0] or x >= knots[-1]:
-        return -1
-    # otherwise, return the corresponding index
+    # if we have requested end point, and are at the end, return corresponding index.
+    if endpoint:
+        i = np.where((knots[-2] <= x_array) & (x_array <= knots[-1]), len(knots) - 2, i)
 
-    return np.max(np.argmax(knots > x) - 1, 0)
+    return int(i) if np.ndim(x) == 0 else i
 
 
 def cached_univariate(degree: int, knots: typing.Union[typing.List[float], np.ndarray],
@@ -148,12 +297,40 @@ class BSpline(object):
         self.knots_u = np.array(knots_u, dtype=np.float64)
         self.knots_v = np.array(knots_v, dtype=np.float64)
         self.weight = weight
-        self.coefficient = 1
+        self._coefficient = 1
         self.end_u = end_u
         self.end_v = end_v
         self.elements_of_support: ElementVector = []
 
         self.id = None
+        # the LRSpline whose basis holds this B-spline, notified when the coefficient is set
+        self.owner = None
+
+    @property
+    def coefficient(self):
+        """
+        The coefficient of the B-spline, a scalar or a read-only array of shape (k, ). A vector valued coefficient
+        is changed by assigning a new array.
+
+        :return: coefficient
+        """
+        return self._coefficient
+
+    @coefficient.setter
+    def coefficient(self, value) -> None:
+        if isinstance(value, np.ndarray) and value.ndim > 0:
+            value = np.array(value, dtype=np.float64)
+            value.flags.writeable = False
+        self._coefficient = value
+        owner = self.owner
+        if owner is not None:
+            owner._coefficients_changed()
+
+    def __getstate__(self) -> dict:
+        # the owner restores the reference when it is unpickled
+        state = self.__dict__.copy()
+        state['owner'] = None
+        return state
 
     def __call__(self, u: float, v: float, r1=0, r2=0) -> float:
         """
@@ -243,7 +420,8 @@ class BSpline(object):
 
     def update_weights(self, other: "BSpline") -> None:
         """
-        Updates the weights during splitting.
+        Updates the weights during splitting. The coefficient may be a scalar or an array of shape (k, ), in
+        which case all k components are transferred at once.
         """
         w = self.weight + other.weight
         self.coefficient = (self.coefficient * self.weight + other.coefficient * other.weight) / w
@@ -0,0 +1,209 @@
+"""
+Refinement deltas. LRSpline.insert_line and LRSpline.insert_lines return a RefinementDelta describing how the basis
+and the mesh changed, and publish it to the callbacks registered with LRSpline.subscribe. This lets downstream
+solvers update assembled matrices, factorizations and coefficient vectors instead of rebuilding them.
+"""
+import typing
+
+import numpy as np
+
+from LRSplines.b_spline import BSpline
+
+if False:
+    from LRSplines.element import Element
+    from LRSplines.lr_spline import LRSpline
+    from LRSplines.meshline import Meshline
+
+
+class RefinementDelta(object):
+    """
+    Describes the change of an LR-spline caused by inserting one or more meshlines. Basis functions are referred to
+    by their stable ids (see LRSpline.basis_function), elements by their positions in LR.M. The elements keep their
+    positions, new elements are appended. Basis functions that are not listed kept their id, weight and coefficient.
+
+        removed: ids of the basis functions that were split, and no longer exist
+        added: ids of the basis functions that did not exist before
+        modified: ids of the old basis functions whose weight and coefficient changed by merging
+        split_elements: positions of the old elements that were split, and now cover a smaller area
+        new_elements: positions of the elements created by the insertion
+        meshlines: the meshlines that were inserted
+
+    Ids retired by an insertion are only recycled by later insertions, so `removed` and `added` are disjoint.
+    Arrays indexed by id need old_capacity and new_capacity entries before and after the insertion.
+    """
+
+    def __init__(self, old_ids: np.ndarray, new_dimension: int, old_capacity: int, new_capacity: int,
+                 removed: np.ndarray, added: np.ndarray, modified: np.ndarray, split_elements: np.ndarray,
+                 new_elements: np.ndarray, meshlines: typing.List['Meshline'], transfer_rows: np.ndarray,
+                 transfer_columns: np.ndarray, transfer_values: np.ndarray) -> None:
+        self.old_dimension = len(old_ids)
+        self.new_dimension = new_dimension
+        self.old_capacity = old_capacity
+        self.new_capacity = new_capacity
+        self.removed = removed
+        self.added = added
+        self.modified = modified
+        self.split_elements = split_elements
+        self.new_elements = new_elements
+        self.meshlines = meshlines
+        self._transfer = (transfer_rows, transfer_columns, transfer_values)
+        self._old_ids = old_ids
+
+    @property
+    def changed(self) -> bool:
+        """
+        False if none of the meshlines changed the LR-spline, i.e., they were all present already.
+        """
+        return bool(len(self.removed) or len(self.added) or len(self.split_elements) or len(self.new_elements))
+
+    def transfer_matrix(self):
+        """
+        Returns the sparse coefficient transfer matrix T of shape (new_capacity, old_capacity), mapping coefficients
+        c_old indexed by id before the insertion to coefficients c_new = T c_old indexed by id after the insertion,
+        such that the spline is unchanged. Only the rows of the added and modified ids differ from the identity;
+        their entries are the products of the knot insertion weights of aux_split_functions._split_weights, and sum
+        to one. Rows and columns of unused ids are zero.
+
+        Requires scipy.
+
+        :return: scipy.sparse.csr_matrix
+        """
+        from scipy.sparse import csr_matrix
+
+        rows, columns, values = self._transfer
+        keep = np.zeros(self.old_capacity, dtype=bool)
+        keep[self._old_ids] = True
+        keep[self.removed] = False
+        keep[self.modified] = False
+        identity = np.flatnonzero(keep)
+        return csr_matrix((np.concatenate((values, np.ones(len(identity)))),
+                           (np.concatenate((rows, identity)), np.concatenate((columns, identity)))),
+                          shape=(self.new_capacity, self.old_capacity))
+
+    def transfer(self, coefficients) -> np.ndarray:
+        """
+        Applies the transfer matrix to an array of coefficients indexed by id, of shape (old_capacity, ) or
+        (old_capacity, k), without requiring scipy. Only the rows of the added and modified ids are computed,
+        the others are copied.
+
+        :param coefficients: coefficients indexed by id before the insertion
+        :return: coefficients indexed by id after the insertion
+        """
+        coefficients = np.asarray(coefficients, dtype=np.float64)
+        if len(coefficients) != self.old_capacity:
+            raise ValueError('Expected {} coefficients, got {}'.format(self.old_capacity, len(coefficients)))
+        rows, columns, values = self._transfer
+
+        # insertions never shrink the id range
+        result = np.zeros((self.new_capacity,) + coefficients.shape[1:])
+        result[:self.old_capacity] = coefficients
+        result[self.removed] = 0
+        result[self.added] = 0
+        result[self.modified] = 0
+        np.add.at(result, rows, (values * coefficients[columns].T).T)
+        return result
+
+    def __repr__(self):
+        return 'RefinementDelta(removed={}, added={}, modified={}, split_elements={}, new_elements={})'.format(
+            len(self.removed), len(self.added), len(self.modified), len(self.split_elements), len(self.new_elements))
+
+
+class DeltaTracker(object):
+    """
+    Tracks the splitting and merging of basis functions and the splitting of elements during an insertion, and
+    builds the resulting RefinementDelta.
+
+    The provenance of every basis function touched by the insertion is kept as a dictionary mapping old ids to the
+    part of its weight inherited from that old function. The contributions always sum to the weight of the
+    function, as splitting scales the weight by the knot insertion weights, and merging adds the weights.
+    """
+
+    def __init__(self, LR: 'LRSpline') -> None:
+        self.old_ids = LR.active_ids
+        self.old_capacity = LR.id_capacity
+        self.old_elements = len(LR.M)
+        # keyed on id(), the function object is stored along so that the id is not reused while tracking
+        self._provenance: typing.Dict[int, typing.Tuple[BSpline, typing.Dict[int, float]]] = {}
+        self._appended: typing.Dict[int, BSpline] = {}
+        self._removed: typing.Dict[int, BSpline] = {}
+        self._split_elements: typing.List['Element'] = []
+        self.meshlines: typing.List['Meshline'] = []
+
+    def _contributions(self, b: BSpline) -> typing.Dict[int, float]:
+        entry = self._provenance.get(id(b))
+        if entry is not None:
+            return entry[1]
+        # an old function, untouched so far
+        return {b.id: b.weight}
+
+    def split(self, basis: BSpline, b1: BSpline, b2: BSpline, alpha_1: float, alpha_2: float) -> None:
+        """
+        Records that `basis` was split into b1 and b2 with knot insertion weights alpha_1 and alpha_2.
+        """
+        contributions = self._contributions(basis)
+        self._provenance[id(b1)] = (b1, {i: w * alpha_1 for i, w in contributions.items()})
+        self._provenance[id(b2)] = (b2, {i: w * alpha_2 for i, w in contributions.items()})
+
+    def merge(self, target: BSpline, source: BSpline) -> None:
+        """
+        Records that `source` is merged into the equal function `target`, before their weights are added.
+        """
+        contributions = dict(self._contributions(target))
+        for i, w in self._contributions(source).items():
+            contributions[i] = contributions.get(i, 0) + w
+        self._provenance[id(target)] = (target, contributions)
+
+    def append(self, b: BSpline) -> None:
+        """
+        Records that the new function b was added to LR.S.
+        """
+        self._appended[id(b)] = b
+
+    def remove(self, b: BSpline) -> None:
+        """
+        Records that the function b was removed from LR.S.
+        """
+        if self._appended.pop(id(b), None) is None:
+            self._removed[id(b)] = b
+
+    def split_element(self, element: 'Element') -> None:
+        """
+        Records that `element` was split.
+        """
+        self._split_elements.append(element)
+
+    def finish(self, LR: 'LRSpline') -> RefinementDelta:
+        """
+        Assigns ids to the added functions, retires the ids of the removed ones, and builds the delta.
+
+        :param LR: the LR-spline after the insertion
+        :return: the refinement delta
+        """
+        # allocate before releasing, so that ids retired by this insertion are not handed out again right away
+        added = np.array([LR._allocate_id(b) for b in self._appended.values()], dtype=np.intp)
+        removed = np.array([b.id for b in self._removed.values()], dtype=np.intp)
+        for i in removed:
+            LR._release_id(i)
+
+        modified = []
+        rows, columns, values = [], [], []
+        for b, contributions in self._provenance.values():
+            if b.id is None or id(b) in self._removed or LR._basis_by_id[b.id] is not b:
+                # split further, merged into another function, or removed
+                continue
+            if id(b) not in self._appended:
+                modified.append(b.id)
+            for i, w in contributions.items():
+                rows.append(b.id)
+                columns.append(i)
+                values.append(w / b.weight)
+
+        element_position = {id(e): k for k, e in enumerate(LR.M)}
+        split_elements = sorted({element_position[id(e)] for e in self._split_elements} - set(
+            range(self.old_elements, len(LR.M))))
+
+        return RefinementDelta(self.old_ids, len(LR.S), self.old_capacity, LR.id_capacity, np.sort(removed),
+                               np.sort(added), np.sort(np.array(modified, dtype=np.intp)),
+                               np.array(split_elements, dtype=np.intp), np.arange(self.old_elements, len(LR.M)),
+                               self.meshlines, np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp),
+                               np.array(values, dtype=np.float64))
@@ -4,11 +4,87 @@ of its lower left and upper right corner.
 """
 import typing
 
+import numpy as np
+
 from LRSplines.b_spline import BSpline
+from LRSplines.evaluation import univariate_values
 
 BasisFunctions = typing.List[BSpline]
 
 
+def _overlaps(a: 'Element', b: 'Element', axis: int) -> bool:
+    """
+    Returns True if the extents of the elements a and b in direction axis (0 for u, 1 for v) overlap with positive
+    length.
+    """
+    if axis == 0:
+        return min(a.u_max, b.u_max) > max(a.u_min, b.u_min)
+    return min(a.v_max, b.v_max) > max(a.v_min, b.v_min)
+
+
+def connect_elements(elements: typing.List['Element']) -> None:
+    """
+    Builds the edge adjacency of the elements of a mesh (see Element.neighbours) from the element bounds. Elements
+    are matched along every vertical and horizontal line of the mesh by a merge of the elements ending and starting
+    at the line, sorted along it.
+
+    :param elements: the elements of the mesh
+    """
+    for e in elements:
+        e.neighbours = [[], [], [], []]
+
+    for axis in range(2):
+        ending, starting = {}, {}
+        for e in elements:
+            ending.setdefault(e.u_max if axis == 0 else e.v_max, []).append(e)
+            starting.setdefault(e.u_min if axis == 0 else e.v_min, []).append(e)
+
+        def lower(e):
+            return e.v_min if axis == 0 else e.u_min
+
+        def upper(e):
+            return e.v_max if axis == 0 else e.u_max
+
+        for x, before in ending.items():
+            after = sorted(starting.get(x, []), key=lower)
+            before = sorted(before, key=lower)
+            i = j = 0
+            while i < len(before) and j < len(after):
+                a, b = before[i], after[j]
+                if _overlaps(a, b, 1 - axis):
+                    a.neighbours[2 * axis + 1].append(b)
+                    b.neighbours[2 * axis].append(a)
+                if upper(a) <= upper(b):
+                    i += 1
+                if upper(b) <= upper(a):
+                    j += 1
+
+
+def walk_to_point(start: 'Element', u: float, v: float) -> 'Element':
+    """
+    Finds the element containing the point (u, v) by walking the edge adjacency from the element start, first in u
+    direction, and then in v direction. The number of steps is the number of elements crossed, which makes this
+    cheap for streams of nearby points.
+
+    :param start: element to start from
+    :param u: first component
+    :param v: second component
+    :return: element containing (u, v)
+    """
+    e = start
+    while not e.contains(u, v):
+        if u < e.u_min or u > e.u_max:
+            side, x = (0 if u < e.u_min else 1), min(max(v, e.v_min), e.v_max)
+            candidates = (n for n in e.neighbours[side] if n.v_min <= x <= n.v_max)
+        else:
+            side, x = (2 if v < e.v_min else 3), u
+            candidates = (n for n in e.neighbours[side] if n.u_min <= x <= n.u_max)
+        e = next(candidates, None)
+        if e is None:
+            raise ValueError('({}, {}) is not in the domain'.format(u, v))
+    return e
+
+
 class Element(object):
 
     def __init__(self, u_min: float, v_min: float, u_max: float, v_max: float, level: int = 0) -> None:
@@ -30,13 +106,21 @@ class Element(object):
         self.supported_b_splines: BasisFunctions = []
         self.level = level
 
-    def fetch_neighbours(self):
+        # elements sharing an edge of positive length, on the sides u_min, u_max, v_min and v_max
+        self.neighbours: typing.List[typing.List['Element']] = [[], [], [], []]
+
+    def fetch_neighbours(self, side: int = None) -> typing.List['Element']:
         """
-        Returns a list of neighbouring elements based on supported B-splines.
+        Returns the elements sharing an edge (of positive length) with this element. The adjacency is built by
+        connect_elements, and maintained by Element.split.
 
-        :return:
+        :param side: 0, 1, 2 or 3 for the neighbours across the edge u = u_min, u = u_max, v = v_min or v = v_max
+            only, all neighbours if not given
+        :return: list of neighbouring elements
         """
-        pass
+        if side is not None:
+            return list(self.neighbours[side])
+        return [e for neighbours in self.neighbours for e in neighbours]
 
     def contains(self, u: float, v: float) -> bool:
         """
@@ -118,6 +202,8 @@ class Element(object):
             self.level += 1
             self.v_max = split_value
 
+        self._split_neighbours(new_element, axis)
+
         # Check all supported basis functions if their support has changed.
         supported_basis_to_remove = []
         for basis in self.supported_b_splines:
@@ -130,6 +216,37 @@ class Element(object):
 
         return new_element
 
+    def _split_neighbours(self, new_element: 'Element', axis: int) -> None:
+        """
+        Updates the adjacency after this element was split in direction axis, new_element being the upper half.
+        """
+        # the upper half takes over the neighbours across the upper edge
+        upper = 2 * axis + 1
+        new_element.neighbours[upper] = self.neighbours[upper]
+        for e in new_element.neighbours[upper]:
+            opposite = e.neighbours[upper - 1]
+            opposite[opposite.index(self)] = new_element
+        self.neighbours[upper] = [new_element]
+        new_element.neighbours[upper - 1] = [self]
+
+        # the neighbours across the edges parallel to the axis of the split are shared between the halves
+        for side in (2 * (1 - axis), 2 * (1 - axis) + 1):
+            neighbours = self.neighbours[side]
+            self.neighbours[side] = [e for e in neighbours if _overlaps(self, e, axis)]
+            new_element.neighbours[side] = [e for e in neighbours if _overlaps(new_element, e, axis)]
+            for e in neighbours:
+                opposite = e.neighbours[side ^ 1]
+                if not _overlaps(self, e, axis):
+                    opposite.remove(self)
+                if _overlaps(new_element, e, axis):
+                    opposite.append(new_element)
+
+    def __getstate__(self) -> dict:
+        # the adjacency is rebuilt by LRSpline on unpickling, pickling it recursively could exhaust the stack
+        state = self.__dict__.copy()
+        state['neighbours'] = [[], [], [], []]
+        return state
+
     @property
     def midpoint(self) -> typing.Tuple[float, float]:
         """
@@ -206,3 +323,30 @@ class Element(object):
         for i, b in enumerate(self.supported_b_splines):
             values[i] = b(u, v)
         return values
+
+    def evaluate_basis_matrix(self, u, v, r1=0, r2=0) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates all the supported B-splines (or their partial derivatives of order (r1, r2)) at a batch of points
+        in the element, in one vectorized pass. The univariate B-splines are evaluated once for every distinct local
+        knot vector, and shared among the supported B-splines having that knot vector in u or v.
+
+        :param u: u components of the points, array_like of shape (N, )
+        :param v: v components of the points, array_like of shape (N, )
+        :param r1: derivative in u direction
+        :param r2: derivative in v direction
+        :return: matrix of shape (N, k) with entry [i, j] the j-th supported B-spline at the i-th point, and the ids
+            of the supported B-splines, shape (k, )
+        """
+        u, v = np.broadcast_arrays(np.asarray(u, dtype=np.float64).ravel(), np.asarray(v, dtype=np.float64).ravel())
+        functions = self.supported_b_splines
+        ids = np.array([b.id for b in functions], dtype=np.intp)
+        if not functions:
+            return np.zeros((len(u), 0)), ids
+
+        b = functions[0]
+        Fu = univariate_values(u, np.array([f.knots_u for f in functions]),
+                               np.array([f.end_u for f in functions], dtype=bool), b.degree_u, r1)
+        Fv = univariate_values(v, np.array([f.knots_v for f in functions]),
+                               np.array([f.end_v for f in functions], dtype=bool), b.degree_v, r2)
+        weights = np.array([f.weight for f in functions], dtype=np.float64)
+        return (weights[:, None] * Fu * Fv).T, ids
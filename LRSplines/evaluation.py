@@ -0,0 +1,461 @@
+"""
+Array based batch evaluation of LR-splines, shared by LRSpline and FrozenLRSpline.
+
+The functions operate on a dictionary of flat arrays describing the mesh and the basis:
+
+    element_bounds: (u_min, v_min, u_max, v_max) per element, shape (m, 4)
+    knots_u, knots_v: local knot vectors, shape (n, degree_u + 2) and (n, degree_v + 2)
+    weights, end_u, end_v: per basis function, shape (n, )
+    element_indptr, element_indices: CSR table mapping element k to the positions of its supported B-splines,
+        element_indices[element_indptr[k]:element_indptr[k + 1]]
+
+the point location tables built by location_tables:
+
+    grid_u, grid_v: the unique global knots
+    location_axis: 0 if the domain is cut into strips between consecutive knots of grid_u, 1 for grid_v
+    location_keys, location_elements: sorted keys strip * cells + c, one for every element and every strip it
+        crosses, c being the first cell of the element across the strip and cells the number of cells across the
+        strips, and the elements of the keys
+
+and the univariate tables built by univariate_tables, which let the basis functions of an element share the
+evaluation of equal univariate factors (for d in u, v):
+
+    unique_knots_d, unique_end_d: the distinct pairs of local knot vector and endpoint flag
+    element_knots_d_indptr, element_knots_d: CSR table mapping element k to the distinct univariate factors
+        (rows of unique_knots_d) of its supported B-splines
+    element_slots_d: for every entry of element_indices, the position of its univariate factor among those of
+        the element
+"""
+import math
+import os
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from LRSplines.b_spline import _evaluate_univariate_b_spline_derivatives, _evaluate_univariate_b_splines
+
+
+def locate_elements(arrays: dict, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Returns the indices of the elements containing the points (u[i], v[i]). Points on an interior element
+    boundary are assigned to the element above / to the right, points on the domain boundary to the element
+    inside the domain.
+
+    :param arrays: evaluation arrays
+    :param u: u components, shape (N, )
+    :param v: v components, shape (N, )
+    :return: element indices, shape (N, )
+    """
+    grid_u, grid_v = arrays['grid_u'], arrays['grid_v']
+
+    outside = (u < grid_u[0]) | (u > grid_u[-1]) | (v < grid_v[0]) | (v > grid_v[-1])
+    if np.any(outside):
+        k = np.argmax(outside)
+        raise ValueError('({}, {}) is not in the domain'.format(u[k], v[k]))
+
+    i = np.clip(np.searchsorted(grid_u, u, side='right') - 1, 0, len(grid_u) - 2)
+    j = np.clip(np.searchsorted(grid_v, v, side='right') - 1, 0, len(grid_v) - 2)
+    if int(arrays['location_axis']) == 0:
+        keys = i * (len(grid_v) - 1) + j
+    else:
+        keys = j * (len(grid_u) - 1) + i
+    # the elements crossing a strip partition it, the last one starting at or before the cell contains it
+    return arrays['location_elements'][np.searchsorted(arrays['location_keys'], keys, side='right') - 1]
+
+
+# below this many points per element, evaluate_points_sorted evaluates the B-splines at the points directly
+_POINTS_PER_ELEMENT = 4
+
+LOCATION_ARRAYS = ('grid_u', 'grid_v', 'location_axis', 'location_keys', 'location_elements')
+
+UNIVARIATE_ARRAYS = tuple('{}_{}'.format(key, d) for d in 'uv' for key in
+                          ('unique_knots', 'unique_end', 'element_knots_indptr', 'element_knots', 'element_slots'))
+
+
+def location_tables(arrays: dict) -> typing.Dict[str, np.ndarray]:
+    """
+    Builds the point location tables (see LOCATION_ARRAYS) from the element bounds. Every element is recorded once
+    for every strip it crosses, and the strips run in the direction giving fewer records, so that the tables stay
+    small on locally refined meshes, where a global tensor grid of the knots would grow quadratically.
+
+    :param arrays: evaluation arrays
+    :return: dictionary of the location tables
+    """
+    bounds = np.asarray(arrays['element_bounds'])
+    grids = [np.unique(bounds[:, [0, 2]]), np.unique(bounds[:, [1, 3]])]
+    cells = [np.searchsorted(grids[0], bounds[:, [0, 2]]), np.searchsorted(grids[1], bounds[:, [1, 3]])]
+
+    axis = int(np.sum(np.diff(cells[1])) < np.sum(np.diff(cells[0])))
+    strips, across = cells[axis], cells[1 - axis]
+    counts = strips[:, 1] - strips[:, 0]
+    elements = np.repeat(np.arange(len(bounds)), counts)
+    strip = np.arange(len(elements)) + np.repeat(strips[:, 0] - (np.cumsum(counts) - counts), counts)
+    keys = strip.astype(np.int64) * (len(grids[1 - axis]) - 1) + across[elements, 0]
+
+    order = np.argsort(keys, kind='stable')
+    return {
+        'grid_u': grids[0],
+        'grid_v': grids[1],
+        'location_axis': np.array(axis, dtype=np.intp),
+        'location_keys': keys[order],
+        'location_elements': elements[order].astype(np.intp),
+    }
+
+
+def univariate_tables(arrays: dict) -> typing.Dict[str, np.ndarray]:
+    """
+    Builds the univariate tables (see UNIVARIATE_ARRAYS) from the knot vectors and the element table.
+
+    :param arrays: evaluation arrays
+    :return: dictionary of the univariate tables
+    """
+    indptr = np.asarray(arrays['element_indptr'])
+    entry_element = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    tables = {}
+    for d in 'uv':
+        knots = np.asarray(arrays['knots_' + d])
+        keys, index = np.unique(np.column_stack((knots, arrays['end_' + d])), axis=0, return_inverse=True)
+        a = max(len(keys), 1)
+
+        # distinct univariate factors per element, as sorted keys element * a + factor
+        factors, slots = np.unique(entry_element * a + index.ravel()[arrays['element_indices']], return_inverse=True)
+        knots_indptr = np.zeros(len(indptr), dtype=np.intp)
+        np.cumsum(np.bincount(factors // a, minlength=len(indptr) - 1), out=knots_indptr[1:])
+
+        tables['unique_knots_' + d] = keys[:, :-1]
+        tables['unique_end_' + d] = keys[:, -1].astype(bool)
+        tables['element_knots_indptr_' + d] = knots_indptr
+        tables['element_knots_' + d] = (factors % a).astype(np.intp)
+        tables['element_slots_' + d] = (slots.ravel() - knots_indptr[entry_element]).astype(np.intp)
+    return tables
+
+
+def _expand(indptr: np.ndarray, rows: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Expands the rows of a CSR table. Returns, for every entry of the given rows, the index into rows it belongs to
+    and its position in the CSR data, and the offset of the first entry of every row.
+    """
+    counts = indptr[rows + 1] - indptr[rows]
+    starts = np.cumsum(counts) - counts
+    owners = np.repeat(np.arange(len(rows)), counts)
+    entries = np.repeat(indptr[rows] - starts, counts) + np.arange(len(owners))
+    return owners, entries, starts
+
+
+def _supported_pairs(arrays: dict, u: np.ndarray, v: np.ndarray,
+                     elements: np.ndarray = None) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns all pairs of point indices and positions of basis functions supported on the element containing
+    the point, together with the elements of the points and the positions of the pairs in element_indices.
+    The elements are located unless given.
+    """
+    if elements is None:
+        elements = locate_elements(arrays, u, v)
+    points, entries, _ = _expand(arrays['element_indptr'], elements)
+    return points, arrays['element_indices'][entries], elements, entries
+
+
+def _univariate_factors(arrays: dict, d: str, x: np.ndarray, elements: np.ndarray, points: np.ndarray,
+                        entries: np.ndarray, kernel: typing.Callable) -> np.ndarray:
+    """
+    Evaluates the univariate factors in direction d of the pairs returned by _supported_pairs. Each distinct
+    factor of an element is evaluated once per point, by kernel(x, knots, endpoint), and gathered for the pairs.
+    """
+    owners, factors, starts = _expand(arrays['element_knots_indptr_' + d], elements)
+    knots = arrays['element_knots_' + d][factors]
+    values = kernel(x[owners], arrays['unique_knots_' + d][knots], arrays['unique_end_' + d][knots])
+    return values[..., starts[points] + arrays['element_slots_' + d][entries]]
+
+
+def univariate_values(x: np.ndarray, knots: np.ndarray, end: np.ndarray, degree: int, r=0) -> np.ndarray:
+    """
+    Evaluates k univariate B-splines (or their derivatives of order r), given by the rows of knots and the endpoint
+    flags end, at all N points x. Every distinct pair of knot vector and endpoint flag is evaluated once, and
+    shared among the B-splines, as the basis functions of an element typically share most of their factors.
+
+    :param x: points, shape (N, )
+    :param knots: local knot vectors, shape (k, degree + 2)
+    :param end: endpoint flags, shape (k, )
+    :param degree: polynomial degree
+    :param r: derivative order
+    :return: array of shape (k, N)
+    """
+    keys, inverse = np.unique(np.column_stack((knots, end)), axis=0, return_inverse=True)
+    n = len(x)
+    values = _evaluate_univariate_b_splines(np.tile(x, len(keys)), np.repeat(keys[:, :-1], n, axis=0), degree,
+                                            np.repeat(keys[:, -1].astype(bool), n), r).reshape(len(keys), n)
+    return values[inverse.ravel()]
+
+
+def basis_values(arrays: dict, u: np.ndarray, v: np.ndarray, r1=0, r2=0,
+                 elements: np.ndarray = None) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Evaluates all basis functions that are non-zero at the points (u[i], v[i]), that is, the sparse collocation
+    matrix in coordinate form. The univariate factors shared by several basis functions of an element are only
+    evaluated once per point.
+
+    :param arrays: evaluation arrays
+    :param u: u components, shape (N, )
+    :param v: v components, shape (N, )
+    :param r1: derivative in u direction
+    :param r2: derivative in v direction
+    :param elements: indices of the elements containing the points, located if not given
+    :return: values, point indices and basis function positions, all of equal length
+    """
+    points, functions, elements, entries = _supported_pairs(arrays, u, v, elements)
+
+    degree_u = arrays['knots_u'].shape[1] - 2
+    degree_v = arrays['knots_v'].shape[1] - 2
+    values = arrays['weights'][functions]
+    values *= _univariate_factors(arrays, 'u', u, elements, points, entries,
+                                  lambda x, t, end: _evaluate_univariate_b_splines(x, t, degree_u, end, r1))
+    values *= _univariate_factors(arrays, 'v', v, elements, points, entries,
+                                  lambda x, t, end: _evaluate_univariate_b_splines(x, t, degree_v, end, r2))
+    return values, points, functions
+
+
+def collocation_matrix(arrays: dict, u: np.ndarray, v: np.ndarray, r1=0, r2=0):
+    """
+    Assembles the sparse collocation matrix A[i, j] = B_j(u[i], v[i]) (or its partial derivative of order
+    (r1, r2)), the columns being the positions of the basis functions. Requires scipy.
+
+    :param arrays: evaluation arrays
+    :param u: u components, shape (N, )
+    :param v: v components, shape (N, )
+    :param r1: derivative in u direction
+    :param r2: derivative in v direction
+    :return: scipy.sparse.csr_matrix of shape (N, n)
+    """
+    from scipy.sparse import csr_matrix
+
+    values, points, functions = basis_values(arrays, u, v, r1, r2)
+    return csr_matrix((values, (points, functions)), shape=(len(u), len(arrays['weights'])))
+
+
+def evaluate_points(arrays: dict, u: np.ndarray, v: np.ndarray, coefficients: np.ndarray, r1=0, r2=0,
+                    chunk_size=2 ** 16, elements: np.ndarray = None) -> np.ndarray:
+    """
+    Evaluates the spline with the given coefficients at the flat arrays of points u and v, chunk_size points at
+    a time.
+
+    :param arrays: evaluation arrays
+    :param u: u components, shape (N, )
+    :param v: v components, shape (N, )
+    :param coefficients: coefficients of shape (n, ) or (n, k)
+    :param r1: derivative in u direction
+    :param r2: derivative in v direction
+    :param chunk_size: number of points evaluated at a time
+    :param elements: indices of the elements containing the points, located if not given
+    :return: array of shape (N, ) or (N, k)
+    """
+    result = np.zeros((len(u),) + coefficients.shape[1:])
+    for start in range(0, len(u), chunk_size):
+        stop = min(start + chunk_size, len(u))
+        values, points, functions = basis_values(arrays, u[start:stop], v[start:stop], r1, r2,
+                                                 None if elements is None else elements[start:stop])
+        if coefficients.ndim == 1:
+            result[start:stop] = np.bincount(points, weights=values * coefficients[functions],
+                                             minlength=stop - start)
+        else:
+            for c in range(coefficients.shape[1]):
+                result[start:stop, c] = np.bincount(points, weights=values * coefficients[functions, c],
+                                                    minlength=stop - start)
+    return result
+
+
+def element_polynomials(arrays: dict, elements: np.ndarray, coefficients: np.ndarray) -> np.ndarray:
+    """
+    Returns the spline with the given coefficients restricted to each of the given elements, as a polynomial in the
+    local coordinates s = (u - u_min) / (u_max - u_min) and t = (v - v_min) / (v_max - v_min) of the element. The
+    distinct univariate factors of an element are expanded in Taylor series at its lower left corner, from all
+    their derivatives there (see _evaluate_univariate_b_spline_derivatives).
+
+    :param arrays: evaluation arrays
+    :param elements: element indices, shape (m, )
+    :param coefficients: coefficients of shape (n, ) or (n, k)
+    :return: array of shape (m, degree_u + 1, degree_v + 1) or (m, degree_u + 1, degree_v + 1, k), entry [e, a, b]
+        being the coefficient of s^a t^b
+    """
+    bounds = arrays['element_bounds'][elements]
+    owners, entries, starts = _expand(arrays['element_indptr'], elements)
+    functions = arrays['element_indices'][entries]
+
+    factors = []
+    for d, lower, upper in (('u', bounds[:, 0], bounds[:, 2]), ('v', bounds[:, 1], bounds[:, 3])):
+        degree = arrays['knots_' + d].shape[1] - 2
+        factor_owners, factor_entries, factor_starts = _expand(arrays['element_knots_indptr_' + d], elements)
+        knots = arrays['element_knots_' + d][factor_entries]
+        derivatives = _evaluate_univariate_b_spline_derivatives(
+            lower[factor_owners], arrays['unique_knots_' + d][knots], degree, arrays['unique_end_' + d][knots], degree)
+        r = np.arange(degree + 1)[:, None]
+        taylor = derivatives * (upper - lower)[factor_owners] ** r / np.cumprod(np.maximum(r, 1), axis=0)
+        factors.append(taylor[:, factor_starts[owners] + arrays['element_slots_' + d][entries]].T)
+
+    c = (arrays['weights'][functions] * coefficients[functions].T).T
+    terms = factors[0][:, :, None] * factors[1][:, None, :]
+    terms = terms.reshape(terms.shape + (1,) * (c.ndim - 1)) * c[:, None, None]
+    # the pairs of an element are contiguous, and every element supports at least one B-spline
+    return np.add.reduceat(terms, starts, axis=0)
+
+
+def _differentiate_polynomials(polynomials: np.ndarray, axis: int, order: int, widths: np.ndarray) -> np.ndarray:
+    """
+    Differentiates polynomials in local coordinates (see element_polynomials) `order` times with respect to u
+    (axis 1) or v (axis 2), given the widths of the elements in that direction.
+    """
+    for _ in range(order):
+        degree = polynomials.shape[axis] - 1
+        powers = np.arange(1, degree + 1, dtype=np.float64).reshape((-1,) + (1,) * (polynomials.ndim - axis - 1))
+        derivative = np.zeros_like(polynomials)
+        index = (slice(None),) * axis
+        derivative[index + (slice(0, degree),)] = polynomials[index + (slice(1, None),)] * powers
+        polynomials = derivative / widths.reshape((-1,) + (1,) * (polynomials.ndim - 1))
+    return polynomials
+
+
+def _evaluate_polynomials(polynomials: np.ndarray, s: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """
+    Evaluates polynomials[i] at the local coordinates (s[i], t[i]) by Horner's rule.
+    """
+    result = polynomials[:, -1]
+    for a in range(polynomials.shape[1] - 2, -1, -1):
+        result = polynomials[:, a] + (s * result.T).T
+    value = result[:, -1]
+    for b in range(result.shape[1] - 2, -1, -1):
+        value = result[:, b] + (t * value.T).T
+    return value
+
+
+def evaluate_points_sorted(arrays: dict, u: np.ndarray, v: np.ndarray, coefficients: np.ndarray, r1=0, r2=0,
+                           chunk_size=2 ** 16) -> np.ndarray:
+    """
+    Like evaluate_points, but processes the points grouped by element: the points are located once, and sorted by
+    the element containing them. Every run of points in the same element is then evaluated from the polynomial of
+    the spline on the element (see element_polynomials), and the results are scattered back to the original order.
+    This replaces the recursive evaluation of the B-splines at every point by a Horner scheme, and pays off as soon
+    as the elements hold a few points each; chunks with fewer points per element are evaluated like in
+    evaluate_points, with the located elements. Storing the elements in Morton order (see LRSpline.morton_order)
+    additionally keeps consecutive runs close in the element and basis tables.
+
+    :return: array of shape (N, ) or (N, k)
+    """
+    elements = locate_elements(arrays, u, v)
+    order = np.argsort(elements, kind='stable')
+    u, v, elements = u[order], v[order], elements[order]
+
+    result = np.empty((len(u),) + coefficients.shape[1:])
+    for start in range(0, len(u), chunk_size):
+        stop = min(start + chunk_size, len(u))
+        chunk = elements[start:stop]
+        first = np.r_[True, chunk[1:] != chunk[:-1]]
+        runs = chunk[first]
+        if len(runs) * _POINTS_PER_ELEMENT > stop - start:
+            result[order[start:stop]] = evaluate_points(arrays, u[start:stop], v[start:stop], coefficients, r1, r2,
+                                                        chunk_size, chunk)
+            continue
+
+        bounds = arrays['element_bounds'][runs]
+        polynomials = element_polynomials(arrays, runs, coefficients)
+        polynomials = _differentiate_polynomials(polynomials, 1, r1, bounds[:, 2] - bounds[:, 0])
+        polynomials = _differentiate_polynomials(polynomials, 2, r2, bounds[:, 3] - bounds[:, 1])
+
+        run = np.cumsum(first) - 1
+        s = (u[start:stop] - bounds[run, 0]) / (bounds[run, 2] - bounds[run, 0])
+        t = (v[start:stop] - bounds[run, 1]) / (bounds[run, 3] - bounds[run, 1])
+        result[order[start:stop]] = _evaluate_polynomials(polynomials[run], s, t)
+    return result
+
+
+def morton_codes(x: np.ndarray, y: np.ndarray, x_range, y_range, bits=20) -> np.ndarray:
+    """
+    Returns the Morton (Z-order) codes of the points (x[i], y[i]) in the rectangle x_range times y_range, the
+    coordinates being quantized to `bits` bits each. Sorting by the codes places points that are close in the
+    plane close in the order.
+
+    :return: codes, array of dtype uint64
+    """
+    scale = 2 ** bits - 1
+    xi = np.clip((np.asarray(x) - x_range[0]) / (x_range[1] - x_range[0]) * scale, 0, scale).astype(np.uint64)
+    yi = np.clip((np.asarray(y) - y_range[0]) / (y_range[1] - y_range[0]) * scale, 0, scale).astype(np.uint64)
+    codes = np.zeros(len(xi), dtype=np.uint64)
+    for b in range(bits):
+        b = np.uint64(b)
+        codes |= ((xi >> b) & np.uint64(1)) << (np.uint64(2) * b)
+        codes |= ((yi >> b) & np.uint64(1)) << (np.uint64(2) * b + np.uint64(1))
+    return codes
+
+
+def evaluate_derivatives(arrays: dict, u: np.ndarray, v: np.ndarray, coefficients: np.ndarray, order=2,
+                         chunk_size=2 ** 16) -> np.ndarray:
+    """
+    Evaluates all partial derivatives of total order at most `order` of the spline with the given coefficients,
+    chunk_size points at a time. The elements are located once per point, and the univariate B-splines and all
+    their derivatives are evaluated in one pass per direction (see _evaluate_univariate_b_spline_derivatives).
+
+    The derivatives are ordered by total order m, and within each order by decreasing order in u, that is,
+    (0, 0), (1, 0), (0, 1), (2, 0), (1, 1), (0, 2), ...
+
+    :param arrays: evaluation arrays
+    :param u: u components, shape (N, )
+    :param v: v components, shape (N, )
+    :param coefficients: coefficients of shape (n, ) or (n, k)
+    :param order: highest total order of the derivatives
+    :param chunk_size: number of points evaluated at a time
+    :return: array of shape ((order + 1)(order + 2) / 2, N) or ((order + 1)(order + 2) / 2, N, k)
+    """
+    orders = [(m - r2, r2) for m in range(order + 1) for r2 in range(m + 1)]
+    degree_u = arrays['knots_u'].shape[1] - 2
+    degree_v = arrays['knots_v'].shape[1] - 2
+    coefficients = coefficients.reshape(len(coefficients), -1)
+
+    result = np.zeros((len(orders), len(u), coefficients.shape[1]))
+    for start in range(0, len(u), chunk_size):
+        stop = min(start + chunk_size, len(u))
+        points, functions, elements, entries = _supported_pairs(arrays, u[start:stop], v[start:stop])
+        values_u = _univariate_factors(
+            arrays, 'u', u[start:stop], elements, points, entries,
+            lambda x, t, end: _evaluate_univariate_b_spline_derivatives(x, t, degree_u, end, order))
+        values_v = _univariate_factors(
+            arrays, 'v', v[start:stop], elements, points, entries,
+            lambda x, t, end: _evaluate_univariate_b_spline_derivatives(x, t, degree_v, end, order))
+        weights = arrays['weights'][functions]
+        for d, (r1, r2) in enumerate(orders):
+            values = weights * values_u[r1] * values_v[r2]
+            for c in range(coefficients.shape[1]):
+                result[d, start:stop, c] = np.bincount(points, weights=values * coefficients[functions, c],
+                                                       minlength=stop - start)
+    return result
+
+
+def evaluate_points_parallel(arrays: dict, u: np.ndarray, v: np.ndarray, coefficients: np.ndarray, r1=0, r2=0,
+                             workers: int = None, chunk_size=2 ** 16) -> np.ndarray:
+    """
+    Like evaluate_points, but splits the points across a pool of threads. This relies on NumPy releasing the
+    GIL inside the vectorized kernels.
+
+    :param workers: number of threads, defaults to the number of CPUs
+    :param chunk_size: maximum number of points per task
+    :return: array of shape (N, ) or (N, k)
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = max(workers, int(math.ceil(len(u) / chunk_size)))
+    bounds = np.linspace(0, len(u), tasks + 1).astype(np.intp)
+    result = np.zeros((len(u),) + coefficients.shape[1:])
+
+    def task(start, stop):
+        result[start:stop] = evaluate_points(arrays, u[start:stop], v[start:stop], coefficients, r1, r2, chunk_size)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(task, bounds[:-1], bounds[1:]))
+
+    return result
+
+
+def flatten_points(u, v) -> typing.Tuple[np.ndarray, np.ndarray, tuple]:
+    """
+    Broadcasts u against v, and returns both as flat float arrays together with the broadcast shape.
+    """
+    u, v = np.broadcast_arrays(np.asarray(u, dtype=np.float64), np.asarray(v, dtype=np.float64))
+    return u.ravel(), v.ravel(), u.shape
@@ -0,0 +1,171 @@
+import typing
+
+import numpy as np
+
+from LRSplines.evaluation import LOCATION_ARRAYS, UNIVARIATE_ARRAYS, evaluate_points, evaluate_points_parallel, \
+    evaluate_points_sorted, flatten_points, location_tables, univariate_tables
+
+# arrays making up a frozen LR-spline, see LRSplines.evaluation for their layout.
+FROZEN_ARRAYS = ('element_bounds', 'element_indptr', 'element_indices', 'knots_u', 'knots_v', 'weights', 'end_u',
+                 'end_v', 'coefficients')
+
+# alignment, in bytes, of the arrays placed in a shared memory block.
+_ALIGNMENT = 64
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class FrozenLRSpline(object):
+    """
+    Represents an immutable snapshot of an LRSpline for evaluation, holding only flat NumPy arrays. Created by
+    LRSpline.freeze().
+    """
+
+    def __init__(self, arrays: typing.Dict[str, np.ndarray]) -> None:
+        """
+        Initialize a frozen LR-spline from its arrays. The arrays are exposed as read-only views.
+
+        :param arrays: dictionary containing (at least) the arrays listed in FROZEN_ARRAYS. The point location
+            tables (evaluation.LOCATION_ARRAYS) and the univariate tables (evaluation.UNIVARIATE_ARRAYS) are built if
+            they are not given.
+        """
+        missing = [key for key in FROZEN_ARRAYS if key not in arrays]
+        if missing:
+            raise ValueError('Missing arrays for FrozenLRSpline: {}'.format(', '.join(missing)))
+        for keys, tables in ((LOCATION_ARRAYS, location_tables), (UNIVARIATE_ARRAYS, univariate_tables)):
+            if any(key not in arrays for key in keys):
+                arrays = dict(arrays)
+                arrays.update(tables(arrays))
+        self._arrays = {key: _read_only(np.asarray(arrays[key]))
+                        for key in FROZEN_ARRAYS + LOCATION_ARRAYS + UNIVARIATE_ARRAYS}
+        self._shared_memory = None
+
+    @property
+    def arrays(self) -> typing.Dict[str, np.ndarray]:
+        """
+        The (read-only) arrays of this frozen LR-spline.
+        """
+        return dict(self._arrays)
+
+    @property
+    def degree_u(self) -> int:
+        return self._arrays['knots_u'].shape[1] - 2
+
+    @property
+    def degree_v(self) -> int:
+        return self._arrays['knots_v'].shape[1] - 2
+
+    @property
+    def coefficients(self) -> np.ndarray:
+        return self._arrays['coefficients']
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size of the arrays in bytes.
+        """
+        return sum(a.nbytes for a in self._arrays.values())
+
+    def __len__(self) -> int:
+        """
+        Returns the number of basis functions.
+        """
+        return len(self._arrays['weights'])
+
+    def __getstate__(self) -> dict:
+        # arrays backed by shared memory are pickled by value
+        return {'arrays': {key: np.asarray(a) for key, a in self._arrays.items()}}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['arrays'])
+
+    def __call__(self, u, v):
+        """
+        Evaluates the frozen LR-spline at the point(s) (u, v).
+
+        :param u: first component(s)
+        :param v: second component(s)
+        :return: L(u, v)
+        """
+        return self.evaluate(u, v)
+
+    def evaluate(self, u, v, r1=0, r2=0, chunk_size=2 ** 16, sort_points=False) -> np.ndarray:
+        """
+        Evaluates the frozen LR-spline, or its partial derivative of order (r1, r2), at a batch of points.
+        See LRSpline.evaluate.
+
+        :param u: u components, array_like
+        :param v: v components, array_like, broadcastable against u
+        :param r1: derivative in u direction
+        :param r2: derivative in v direction
+        :param chunk_size: number of points evaluated at a time, bounds the memory use
+        :param sort_points: process the points grouped by element
+        :return: array of shape u.shape for scalar coefficients, or u.shape + (k, ) for vector coefficients
+        """
+        u, v, shape = flatten_points(u, v)
+        coefficients = self._arrays['coefficients']
+        evaluate = evaluate_points_sorted if sort_points else evaluate_points
+        result = evaluate(self._arrays, u, v, coefficients, r1, r2, chunk_size)
+        return result.reshape(shape + coefficients.shape[1:])
+
+    def evaluate_parallel(self, u, v, workers: int = None, r1=0, r2=0, chunk_size=2 ** 16) -> np.ndarray:
+        """
+        Evaluates the frozen LR-spline at a batch of points using a pool of threads. See LRSpline.evaluate_parallel.
+        """
+        u, v, shape = flatten_points(u, v)
+        coefficients = self._arrays['coefficients']
+        result = evaluate_points_parallel(self._arrays, u, v, coefficients, r1, r2, workers, chunk_size)
+        return result.reshape(shape + coefficients.shape[1:])
+
+    def to_shared_memory(self) -> typing.Tuple['multiprocessing.shared_memory.SharedMemory', dict]:
+        """
+        Copies the arrays into a single block of shared memory. The returned handle is a small picklable
+        dictionary, from which worker processes attach to the block with FrozenLRSpline.from_shared_memory,
+        without copying the arrays.
+
+        The caller owns the block, and must close() and unlink() it when the workers are done.
+
+        Requires Python 3.8 or later, for multiprocessing.shared_memory.
+
+        :return: the shared memory block and the handle describing its layout
+        """
+        from multiprocessing import shared_memory
+
+        layout = []
+        offset = 0
+        for key, a in self._arrays.items():
+            offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+            layout.append((key, a.dtype.str, a.shape, offset))
+            offset += a.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for key, dtype, shape, start in layout:
+            target = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)
+            target[...] = self._arrays[key]
+
+        return shm, {'name': shm.name, 'layout': layout}
+
+    @classmethod
+    def from_shared_memory(cls, handle: dict) -> 'FrozenLRSpline':
+        """
+        Attaches to a block created by FrozenLRSpline.to_shared_memory, and returns a frozen LR-spline whose
+        arrays are views into the shared block.
+
+        Requires Python 3.8 or later, for multiprocessing.shared_memory.
+
+        :param handle: handle returned by to_shared_memory
+        :return: frozen LR-spline
+        """
+        from multiprocessing import shared_memory
+
+        shm = shared_memory.SharedMemory(name=handle['name'])
+        arrays = {key: np.ndarray(tuple(shape), dtype=dtype, buffer=shm.buf, offset=start)
+                  for key, dtype, shape, start in handle['layout']}
+        frozen = cls(arrays)
+        # keep the block attached for as long as the arrays are in use
+        frozen._shared_memory = shm
+        return frozen
@@ -0,0 +1,135 @@
+"""
+Optional instrumentation of the refinement routines. An LRSpline reports per-phase timings and event counters
+to the RefinementStats object stored in `LRSpline.stats`. When `stats` is None (the default), the instrumented
+code only pays for a few `is None` checks per call.
+"""
+import time
+import typing
+from collections import defaultdict
+
+
+class _NullPhase(object):
+    """
+    No-op context manager used for phases when instrumentation is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    """
+    Context manager timing a single phase, and reporting the elapsed time to a RefinementStats object.
+    """
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats: 'RefinementStats', name: str) -> None:
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class RefinementStats(object):
+    """
+    Collects per-phase timers and event counters from LRSpline.insert_line, LRSpline.local_split,
+    LRSpline.merge_meshlines and LRSpline.refine.
+
+    Phases (accumulated seconds in `timers`, number of times entered in `calls`):
+
+        insert_line, merge_meshlines, split_basis, split_new_basis, split_elements, support_update,
+        select_element (refine)
+
+    Counters (in `counters`):
+
+        lines_inserted, lines_already_present, meshline_comparisons, meshlines_merged, functions_tested,
+        splits_performed, functions_merged, elements_tested, elements_split, support_pair_tests,
+        cache_invalidations, refinement_steps
+    """
+
+    def __init__(self, callback: typing.Callable[[str, float, 'RefinementStats'], None] = None) -> None:
+        """
+        Initialize an empty set of statistics.
+
+        :param callback: optional function called as callback(phase, seconds, stats) each time a phase ends.
+        """
+        self.callback = callback
+        self.timers = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    def phase(self, name: str) -> _Phase:
+        """
+        Returns a context manager timing the phase `name`.
+
+        :param name: name of the phase
+        :return: context manager
+        """
+        return _Phase(self, name)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """
+        Records `seconds` spent in the phase `name`, and notifies the callback.
+
+        :param name: name of the phase
+        :param seconds: elapsed time
+        """
+        self.timers[name] += seconds
+        self.calls[name] += 1
+        if self.callback is not None:
+            self.callback(name, seconds, self)
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Increments the counter `name` by n.
+
+        :param name: name of the counter
+        :param n: increment
+        """
+        self.counters[name] += n
+
+    def reset(self) -> None:
+        """
+        Clears all timers and counters.
+        """
+        self.timers.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def as_dict(self) -> dict:
+        """
+        Returns the statistics as a plain dictionary, e.g., for serialization.
+
+        :return: dictionary with keys timers, calls and counters
+        """
+        return {'timers': dict(self.timers), 'calls': dict(self.calls), 'counters': dict(self.counters)}
+
+    def __repr__(self):
+        return 'RefinementStats(timers={}, counters={})'.format(dict(self.timers), dict(self.counters))
+
+
+def phase(stats: typing.Optional[RefinementStats], name: str):
+    """
+    Returns a context manager timing the phase `name` on `stats`, or a shared no-op context manager if
+    `stats` is None.
+
+    :param stats: statistics to report to, or None
+    :param name: name of the phase
+    :return: context manager
+    """
+    if stats is None:
+        return _NULL_PHASE
+    return stats.phase(name)
@@ -0,0 +1,163 @@
+"""
+Append-only refinement journal. An LRSpline recording to a journal (see LRSpline.record) appends every meshline
+handed to insert_line or insert_lines, and every refine sweep, to a JSON lines file. Every `checkpoint_every`
+lines the full state is saved with save_lr_spline, so that LRSpline.replay only has to reinsert the lines
+recorded after the nearest checkpoint.
+
+Every append is flushed to disk with fsync, and a checkpoint is flushed to disk before its entry is appended, so
+that the journal survives a crash of the machine, not only of the process, and replay never finds a checkpoint
+entry without its saved state.
+
+Layout of the journal directory:
+
+    journal.jsonl: one JSON object per line, with op one of 'line', 'refine' or 'checkpoint'
+    checkpoints/00000000, checkpoints/00000100, ...: saved states, named by the number of lines recorded
+"""
+import json
+import os
+import typing
+
+from LRSplines.meshline import Meshline
+from LRSplines.storage import _fsync_directory, save_lr_spline
+
+if False:
+    from LRSplines.lr_spline import LRSpline
+
+_JOURNAL = 'journal.jsonl'
+_CHECKPOINTS = 'checkpoints'
+
+
+class RefinementJournal(object):
+    """
+    Append-only journal of the refinement of an LRSpline, with periodic full-state checkpoints.
+    """
+
+    def __init__(self, path: str, checkpoint_every: int = 100) -> None:
+        """
+        Opens the journal in the directory `path`, which is created if it does not exist. An existing journal is
+        appended to.
+
+        :param path: journal directory
+        :param checkpoint_every: number of recorded lines between checkpoints
+        """
+        if checkpoint_every < 1:
+            raise ValueError('checkpoint_every must be positive, got {}'.format(checkpoint_every))
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        os.makedirs(os.path.join(path, _CHECKPOINTS), exist_ok=True)
+        _fsync_directory(path)
+        self._discard_truncated_entry()
+
+        entries = self.entries()
+        self.lines_recorded = sum(1 for e in entries if e['op'] == 'line')
+        self.last_checkpoint = max([e['lines'] for e in entries if e['op'] == 'checkpoint'], default=None)
+
+    def _discard_truncated_entry(self) -> None:
+        """
+        Removes a truncated last entry, left by an interrupted write, so that new entries start on a fresh line.
+        """
+        filename = os.path.join(self.path, _JOURNAL)
+        if not os.path.exists(filename):
+            return
+        with open(filename, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    @staticmethod
+    def line_entry(meshline: Meshline) -> dict:
+        """
+        Returns the journal entry for a meshline.
+
+        :param meshline: meshline to record
+        :return: journal entry
+        """
+        return {'op': 'line', 'start': float(meshline.start), 'stop': float(meshline.stop),
+                'constant_value': float(meshline.constant_value), 'axis': int(meshline.axis),
+                'multiplicity': int(meshline.multiplicity)}
+
+    def _append(self, entries: typing.List[dict]) -> None:
+        filename = os.path.join(self.path, _JOURNAL)
+        created = not os.path.exists(filename)
+        with open(filename, 'a') as f:
+            f.writelines(json.dumps(e) + '\n' for e in entries)
+            f.flush()
+            os.fsync(f.fileno())
+        if created:
+            _fsync_directory(self.path)
+
+    def append_lines(self, entries: typing.List[dict], LR: 'LRSpline') -> None:
+        """
+        Appends the entries of lines inserted into LR, and checkpoints LR if `checkpoint_every` lines have been
+        recorded since the last checkpoint.
+
+        :param entries: entries created by line_entry
+        :param LR: the LR-spline after the lines were inserted
+        """
+        self._append(entries)
+        self.lines_recorded += len(entries)
+        if self.last_checkpoint is None or self.lines_recorded - self.last_checkpoint >= self.checkpoint_every:
+            self.checkpoint(LR)
+
+    def append_refine(self, beta: float, refinement_strategy: str) -> None:
+        """
+        Records the start of a refine sweep. The lines inserted by the sweep are recorded separately, so the entry
+        is informational, and not needed for replay.
+
+        :param beta: growth parameter
+        :param refinement_strategy: refinement strategy
+        """
+        self._append([{'op': 'refine', 'beta': float(beta), 'strategy': refinement_strategy,
+                       'lines': self.lines_recorded}])
+
+    def checkpoint(self, LR: 'LRSpline') -> None:
+        """
+        Saves the full state of LR as a checkpoint at the current number of recorded lines. The checkpoint entry is
+        only appended once the state is completely written and flushed to disk.
+
+        :param LR: the LR-spline
+        """
+        name = '{:08d}'.format(self.lines_recorded)
+        save_lr_spline(LR, os.path.join(self.path, _CHECKPOINTS, name), sync=True)
+        self._append([{'op': 'checkpoint', 'lines': self.lines_recorded, 'path': name}])
+        self.last_checkpoint = self.lines_recorded
+
+    def checkpoint_path(self, checkpoint: dict) -> str:
+        """
+        Returns the directory of a checkpoint entry.
+
+        :param checkpoint: checkpoint entry
+        :return: directory of the saved state
+        """
+        return os.path.join(self.path, _CHECKPOINTS, checkpoint['path'])
+
+    def entries(self) -> typing.List[dict]:
+        """
+        Reads all journal entries. A truncated last entry, left by an interrupted write, is ignored.
+
+        :return: list of entries
+        """
+        try:
+            with open(os.path.join(self.path, _JOURNAL)) as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        # only entries terminated by a newline are complete
+        return [json.loads(line) for line in data.split('\n')[:-1]]
+
+    def lines(self) -> typing.List[Meshline]:
+        """
+        Returns the recorded meshlines, in order of insertion.
+
+        :return: list of meshlines
+        """
+        return [Meshline(start=e['start'], stop=e['stop'], constant_value=e['constant_value'], axis=e['axis'],
+                         multiplicity=e['multiplicity']) for e in self.entries() if e['op'] == 'line']
+
+    def checkpoints(self) -> typing.List[dict]:
+        """
+        Returns the checkpoint entries, each holding the number of lines recorded at the checkpoint.
+
+        :return: list of checkpoint entries
+        """
+        return [e for e in self.entries() if e['op'] == 'checkpoint']
@@ -0,0 +1,224 @@
+"""
+Reading and writing of LR-spline surfaces in the text format used by GoTools and the LRSplines C++ library:
+
+    # LRSPLINE SURFACE
+    #	p1	p2	Nbasis	Nline	Nel	dim	rat
+    	2	2	16	10	9	1	0
+    # Basis functions:
+    0: [0 0 0 1 ] [0 0 0 1 ] 0.5 (1)
+    ...
+    # Mesh lines:
+    [0, 3] x 0 (3)
+    0 x [0, 3] (3)
+    ...
+    # Elements:
+    0 [2] : (0, 0) x (1, 1)    { 0 1 2 4 5 6 8 9 10}
+    ...
+
+A basis function line holds its id, the local knot vectors in u and v, the dim components of its coefficient and
+its weight. A mesh line is written as [start, stop] x v for a line spanning in the u direction (axis=1), and as
+u x [start, stop] for a line spanning in the v direction (axis=0), followed by its multiplicity. An element line
+holds the element id, its corners, and the ids of the basis functions supported on it.
+
+Each section is parsed in bulk into NumPy arrays, and the LR-spline is built directly from the arrays by
+init_lr_spline_from_arrays, without replaying the refinement through LRSpline.insert_line.
+"""
+import io
+import itertools
+import typing
+
+import numpy as np
+
+from LRSplines.lr_spline import LRSpline, init_lr_spline_from_arrays
+
+HEADER = '# LRSPLINE SURFACE'
+
+# delimiters of the format, parsed as whitespace.
+_DELIMITERS = str.maketrans('[](),:{}x', '         ')
+
+# tolerance used when comparing knots to the domain boundary
+_TOL = 1.0e-14
+
+
+def _data_lines(stream: typing.Iterable[str]) -> typing.Iterator[str]:
+    """
+    Yields the non-empty lines of the stream that are not comments.
+    """
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def _parse_numbers(lines: typing.List[str], columns: int = None) -> np.ndarray:
+    """
+    Parses the numbers in the given lines in one pass, ignoring the delimiters of the format.
+
+    :param lines: lines of text
+    :param columns: if given, the result is reshaped to (len(lines), columns)
+    :return: array of floats
+    """
+    values = np.fromstring(' '.join(lines).translate(_DELIMITERS), dtype=np.float64, sep=' ')
+    if columns is None:
+        return values
+    if len(values) != len(lines) * columns:
+        raise ValueError('Malformed LR-spline file: expected {} values per line'.format(columns))
+    return values.reshape(len(lines), columns)
+
+
+def _read_section(lines: typing.Iterator[str], n: int, name: str) -> typing.List[str]:
+    section = list(itertools.islice(lines, n))
+    if len(section) != n:
+        raise ValueError('Malformed LR-spline file: expected {} {}, found {}'.format(n, name, len(section)))
+    return section
+
+
+def read_lr(source: typing.Union[str, typing.TextIO]) -> LRSpline:
+    """
+    Reads an LR-spline surface in the GoTools / LRSplines text format.
+
+    :param source: file name or open text stream
+    :return: the LR-spline
+    """
+    if isinstance(source, str):
+        with open(source, 'r') as f:
+            return read_lr(f)
+
+    lines = _data_lines(source)
+    try:
+        header = next(lines)
+    except StopIteration:
+        raise ValueError('Malformed LR-spline file: missing header')
+    p1, p2, n_basis, n_lines, n_elements, dim, rational = (int(h) for h in header.split())
+    if rational:
+        raise NotImplementedError('Rational LR-splines are not supported')
+
+    # basis functions: id, knots_u, knots_v, coefficient, weight
+    basis = _parse_numbers(_read_section(lines, n_basis, 'basis functions'), 1 + (p1 + 2) + (p2 + 2) + dim + 1)
+    ids = basis[:, 0].astype(np.intp)
+    knots_u = basis[:, 1:p1 + 3]
+    knots_v = basis[:, p1 + 3:p1 + p2 + 5]
+    coefficients = basis[:, p1 + p2 + 5:p1 + p2 + 5 + dim]
+    weights = basis[:, -1]
+
+    # meshlines: [start, stop] x constant (multiplicity) or constant x [start, stop] (multiplicity)
+    section = _read_section(lines, n_lines, 'mesh lines')
+    spans_u = np.array([line.startswith('[') for line in section], dtype=bool)
+    values = _parse_numbers(section, 4)
+    start = np.where(spans_u, values[:, 0], values[:, 1])
+    stop = np.where(spans_u, values[:, 1], values[:, 2])
+    constant = np.where(spans_u, values[:, 2], values[:, 0])
+    multiplicity = values[:, 3].astype(int)
+
+    # elements: id, dimension, corners, {supported basis functions}
+    section = _read_section(lines, n_elements, 'elements')
+    heads, _, tails = zip(*(line.partition('{') for line in section))
+    bounds = _parse_numbers(list(heads), 6)[:, 2:]
+    # the support lists differ in length, so they are separated by a -1 sentinel and parsed in one go
+    support = _parse_numbers([t + ' -1' for t in tails]).astype(np.intp)
+    sentinels = np.flatnonzero(support == -1)
+    indptr = np.concatenate(([0], sentinels - np.arange(len(sentinels))))
+    support = support[support != -1]
+
+    # map the basis function ids of the file to positions
+    order = np.argsort(ids)
+    support = order[np.searchsorted(ids[order], support)]
+
+    u_min, u_max = bounds[:, 0].min(), bounds[:, 2].max()
+    v_min, v_max = bounds[:, 1].min(), bounds[:, 3].max()
+
+    return init_lr_spline_from_arrays({
+        'knots_u': knots_u,
+        'knots_v': knots_v,
+        'weights': weights,
+        'coefficients': coefficients[:, 0] if dim == 1 else coefficients,
+        'end_u': np.abs(knots_u[:, -1] - u_max) < _TOL,
+        'end_v': np.abs(knots_v[:, -1] - v_max) < _TOL,
+        # a basis function is non-zero on an edge of the domain if its knots are repeated p + 1 times there
+        'north': np.abs(knots_v[:, 1] - v_max) < _TOL,
+        'south': np.abs(knots_v[:, -2] - v_min) < _TOL,
+        'east': np.abs(knots_u[:, 1] - u_max) < _TOL,
+        'west': np.abs(knots_u[:, -2] - u_min) < _TOL,
+        'element_bounds': bounds,
+        'element_indptr': indptr,
+        'element_indices': support,
+        'meshlines': np.column_stack([start, stop, constant, np.where(spans_u, 1, 0)]),
+        'multiplicities': multiplicity,
+        'global_knots_u': np.unique(bounds[:, [0, 2]]),
+        'global_knots_v': np.unique(bounds[:, [1, 3]]),
+        'u_range': [u_min, u_max],
+        'v_range': [v_min, v_max],
+    })
+
+
+def _format_numbers(values: np.ndarray) -> typing.List[str]:
+    """
+    Formats the rows of a 2D array as space separated numbers, with enough digits to be read back exactly.
+    """
+    return [' '.join(map(repr, row)) for row in values.tolist()]
+
+
+def write_lr(LR: LRSpline, target: typing.Union[str, typing.TextIO]) -> None:
+    """
+    Writes an LR-spline surface in the GoTools / LRSplines text format.
+
+    :param LR: the LR-spline
+    :param target: file name or open text stream
+    """
+    if isinstance(target, str):
+        with open(target, 'w') as f:
+            write_lr(LR, f)
+        return
+
+    first = LR.S[0]
+    coefficients = LR.coefficients.reshape(len(LR.S), -1)
+    ids = {id(b): k for k, b in enumerate(LR.S)}
+
+    target.write('{}\n'.format(HEADER))
+    target.write('#\tp1\tp2\tNbasis\tNline\tNel\tdim\trat\n')
+    target.write('\t{}\t{}\t{}\t{}\t{}\t{}\t0\n'.format(first.degree_u, first.degree_v, len(LR.S), len(LR.meshlines),
+                                                       len(LR.M), coefficients.shape[1]))
+
+    target.write('# Basis functions:\n')
+    knots_u = _format_numbers(np.array([b.knots_u for b in LR.S]))
+    knots_v = _format_numbers(np.array([b.knots_v for b in LR.S]))
+    coefs = _format_numbers(coefficients)
+    weights = _format_numbers(np.array([[b.weight] for b in LR.S], dtype=np.float64))
+    target.writelines('{}: [{} ] [{} ] {} ({})\n'.format(k, ku, kv, c, w)
+                      for k, (ku, kv, c, w) in enumerate(zip(knots_u, knots_v, coefs, weights)))
+
+    target.write('# Mesh lines:\n')
+    lines = _format_numbers(np.array([(m.start, m.stop, m.constant_value) for m in LR.meshlines], dtype=np.float64))
+    for m, (start, stop, constant) in zip(LR.meshlines, (line.split() for line in lines)):
+        if m.axis == 1:
+            target.write('[{}, {}] x {} ({})\n'.format(start, stop, constant, m.multiplicity))
+        else:
+            target.write('{} x [{}, {}] ({})\n'.format(constant, start, stop, m.multiplicity))
+
+    target.write('# Elements:\n')
+    bounds = _format_numbers(np.array([(e.u_min, e.v_min, e.u_max, e.v_max) for e in LR.M], dtype=np.float64))
+    for k, (e, (u0, v0, u1, v1)) in enumerate(zip(LR.M, (line.split() for line in bounds))):
+        support = ''.join(' {}'.format(ids[id(b)]) for b in e.supported_b_splines)
+        target.write('{} [2] : ({}, {}) x ({}, {})    {{{}}}\n'.format(k, u0, v0, u1, v1, support))
+
+
+def loads_lr(text: str) -> LRSpline:
+    """
+    Reads an LR-spline surface from a string in the GoTools / LRSplines text format.
+
+    :param text: contents of an .lr file
+    :return: the LR-spline
+    """
+    return read_lr(io.StringIO(text))
+
+
+def dumps_lr(LR: LRSpline) -> str:
+    """
+    Writes an LR-spline surface to a string in the GoTools / LRSplines text format.
+
+    :param LR: the LR-spline
+    :return: contents of an .lr file
+    """
+    stream = io.StringIO()
+    write_lr(LR, stream)
+    return stream.getvalue()
@@ -1,14 +1,25 @@
+import heapq
+import inspect
+import itertools
+import threading
 import typing
 from typing import List
 
-import matplotlib.patches as plp
-import matplotlib.pyplot as plt
 import numpy as np
 
+from LRSplines.assembly import overlap_pattern
 from LRSplines.aux_split_functions import split_single_basis_function
-from LRSplines.b_spline import BSpline, _find_knot_interval
-from LRSplines.element import Element
+from LRSplines.b_spline import BSpline, _find_knot_interval, _integrate_univariate_b_splines
+from LRSplines.delta import DeltaTracker, RefinementDelta
+from LRSplines.element import Element, connect_elements, walk_to_point
+from LRSplines.evaluation import basis_values, collocation_matrix, evaluate_derivatives, evaluate_points, \
+    evaluate_points_parallel, evaluate_points_sorted, flatten_points, locate_elements, location_tables, morton_codes, \
+    univariate_tables
+from LRSplines.frozen_lr_spline import FrozenLRSpline
+from LRSplines.instrumentation import RefinementStats, phase
 from LRSplines.meshline import Meshline
+from LRSplines.quasi_interpolation import quasi_interpolate_parallel
+from LRSplines.tiling import evaluate_tiled
 
 Vector = typing.Union[typing.List['float'], np.ndarray]
 
@@ -76,6 +87,66 @@ def init_tensor_product_LR_spline(d1: int, d2: int, ku: Vector, kv: Vector) -> '
     return LRSpline(elements, basis, meshlines, u_range, v_range, unique_ku, unique_kv)
 
 
+def init_lr_spline_from_arrays(arrays: typing.Dict[str, np.ndarray]) -> 'LRSpline':
+    """
+    Builds an LR-spline directly from flat arrays describing its mesh and basis, without replaying the refinement.
+    Used when reading LR-splines from file.
+
+        knots_u, knots_v: local knot vectors, shape (n, degree_u + 2) and (n, degree_v + 2)
+        weights: shape (n, ), coefficients: shape (n, ) or (n, k)
+        end_u, end_v, north, south, east, west: boundary flags, shape (n, )
+        element_bounds: (u_min, v_min, u_max, v_max) per element, shape (m, 4)
+        element_levels: refinement level per element, shape (m, ), optional
+        element_indptr, element_indices: CSR table mapping element k to the positions of its supported B-splines
+        meshlines: (start, stop, constant_value, axis) per meshline, shape (l, 4)
+        multiplicities: multiplicity per meshline, shape (l, )
+        global_knots_u, global_knots_v: the global knots
+        u_range, v_range: parametric domain, shape (2, )
+        basis_ids: ids of the basis functions, shape (n, ), optional, defaults to 0, ..., n - 1
+
+    :param arrays: dictionary of arrays
+    :return: corresponding LR_spline
+    """
+    knots_u = np.asarray(arrays['knots_u'], dtype=np.float64)
+    knots_v = np.asarray(arrays['knots_v'], dtype=np.float64)
+    degree_u, degree_v = knots_u.shape[1] - 2, knots_v.shape[1] - 2
+    coefficients = np.asarray(arrays['coefficients'], dtype=np.float64)
+    flags = np.column_stack([np.asarray(arrays[key], dtype=bool) for key in
+                             ('end_u', 'end_v', 'north', 'south', 'east', 'west')]).tolist()
+
+    basis = []
+    for ku, kv, w, c, (end_u, end_v, north, south, east, west) in zip(knots_u, knots_v, arrays['weights'].tolist(),
+                                                                      coefficients, flags):
+        b = BSpline(degree_u, degree_v, ku, kv, weight=w, end_u=end_u, end_v=end_v, north=north, south=south,
+                    east=east, west=west)
+        b.coefficient = c if coefficients.ndim == 2 else float(c)
+        basis.append(b)
+
+    bounds = np.asarray(arrays['element_bounds'], dtype=np.float64).tolist()
+    levels = arrays.get('element_levels')
+    levels = np.zeros(len(bounds), dtype=int) if levels is None else levels
+    indptr = np.asarray(arrays['element_indptr']).tolist()
+    indices = np.asarray(arrays['element_indices']).tolist()
+
+    elements = []
+    for k, (e, level) in enumerate(zip(bounds, np.asarray(levels).tolist())):
+        element = Element(*e, level=level)
+        element.supported_b_splines = [basis[i] for i in indices[indptr[k]:indptr[k + 1]]]
+        for b in element.supported_b_splines:
+            b.elements_of_support.append(element)
+        elements.append(element)
+
+    meshlines = [Meshline(start=start, stop=stop, constant_value=c, axis=int(axis), multiplicity=multiplicity)
+                 for (start, stop, c, axis), multiplicity in zip(np.asarray(arrays['meshlines']).tolist(),
+                                                                 np.asarray(arrays['multiplicities']).tolist())]
+
+    LR = LRSpline(elements, basis, meshlines, list(np.asarray(arrays['u_range']).tolist()),
+                  list(np.asarray(arrays['v_range']).tolist()), arrays['global_knots_u'], arrays['global_knots_v'])
+    if arrays.get('basis_ids') is not None:
+        LR._restore_ids(arrays['basis_ids'])
+    return LR
+
+
 class LRSpline(object):
     """
     Represents a LRSpline, which is a tuple (M, S), where M is a mesh and S is a set of basis functions
@@ -99,10 +170,86 @@ class LRSpline(object):
         self.meshlines = meshlines
         self.u_range = u_range
         self.v_range = v_range
+        self._local = threading.local()
+        self._lock = threading.Lock()
         self.last_element = None
+        self.stats: typing.Optional[RefinementStats] = None
+        self.journal: typing.Optional['RefinementJournal'] = None
+        self._subscribers: typing.List[typing.Callable[[RefinementDelta], None]] = []
+        self._tracker: typing.Optional[DeltaTracker] = None
+        self._basis_by_id: typing.List[typing.Optional[BSpline]] = []
+        self._free_ids: typing.List[int] = []
+        self._active_ids = None
+        self._arrays = None
+        self._coefficients = None
+        # set when the coefficient of a basis function changes, see coefficients
+        self._coefficients_dirty = False
+        # ids of the overlapping basis functions by id, and the overlap pattern by position, see overlap_pattern
+        self._overlap: typing.Optional[typing.Dict[int, np.ndarray]] = None
+        self._overlap_pattern = None
+        connect_elements(self.M)
         self._element_cache()
         self.update_global_indices()
 
+    def instrument(self, stats: RefinementStats = None) -> RefinementStats:
+        """
+        Enables phase-level instrumentation of insert_line, local_split, merge_meshlines and refine.
+        Set `self.stats = None` to disable it again.
+
+        :param stats: statistics object to report to, a new one is created if not given
+        :return: the statistics object in use
+        """
+        if stats is None:
+            stats = RefinementStats()
+        self.stats = stats
+        return stats
+
+    def record(self, journal: 'RefinementJournal') -> 'RefinementJournal':
+        """
+        Starts recording all meshlines inserted into this LR-spline (and all refine sweeps) to the given journal,
+        which takes periodic checkpoints of the full state. If the journal is empty, the current state is
+        checkpointed first. Set `self.journal = None` to stop recording.
+
+        :param journal: journal to append to
+        :return: the journal
+        """
+        if not journal.checkpoints():
+            journal.checkpoint(self)
+        self.journal = journal
+        return journal
+
+    @staticmethod
+    def replay(journal: typing.Union['RefinementJournal', str], upto: int = None) -> 'LRSpline':
+        """
+        Restores an LR-spline from a journal written through LRSpline.record. The nearest checkpoint at or before
+        line `upto` is loaded, and only the remaining lines are inserted, as a single batch (see insert_lines).
+
+        Coefficients are restored as of the checkpoint, and carried along by the refinement; coefficients changed
+        after the last checkpoint are not recorded.
+
+        :param journal: the journal, or its directory
+        :param upto: number of recorded lines to restore, defaults to all
+        :return: the restored LR-spline
+        """
+        from LRSplines.journal import RefinementJournal
+        from LRSplines.storage import load_lr_spline
+
+        if not isinstance(journal, RefinementJournal):
+            journal = RefinementJournal(journal)
+        lines = journal.lines()
+        upto = len(lines) if upto is None else upto
+        if not 0 <= upto <= len(lines):
+            raise ValueError('The journal holds {} lines, cannot replay up to {}'.format(len(lines), upto))
+
+        checkpoints = [c for c in journal.checkpoints() if c['lines'] <= upto]
+        if not checkpoints:
+            raise ValueError('The journal has no checkpoint at or before line {}'.format(upto))
+        checkpoint = max(checkpoints, key=lambda c: c['lines'])
+
+        LR = load_lr_spline(journal.checkpoint_path(checkpoint))
+        LR.insert_lines(lines[checkpoint['lines']:upto])
+        return LR
+
     def refine_by_element_full(self, e: Element) -> None:
         """
         Refines the LRSpline by finding and inserting a meshline that ensures that all supported BSplines on the
@@ -167,7 +314,7 @@ class LRSpline(object):
         constant_value = e.midpoint[axis]
         return Meshline(longest_start, longest_stop, constant_value, axis)
 
-    def insert_line(self, meshline: Meshline, debug=False) -> None:
+    def insert_line(self, meshline: Meshline, debug=False) -> RefinementDelta:
         """
         Inserts a line in the mesh, splitting where necessary.
         Follows a four step procedure:
@@ -186,15 +333,117 @@ class LRSpline(object):
             Step 4: Make sure that all elements keep track of the basis functions they support, and that all basis
             functions keep track of the elements that support them.
 
+        The returned RefinementDelta, which is also published to the subscribers (see LRSpline.subscribe), describes
+        the changes to the basis and the mesh.
+
         :param meshline: meshline to insert
+        :return: the refinement delta
         """
 
+        journal = self.journal
+        if journal is not None:
+            # recorded before merge_meshlines, which may extend the given meshline
+            entry = journal.line_entry(meshline)
+
+        stats = self.stats
+        self._tracker = tracker = DeltaTracker(self)
+        try:
+            with phase(stats, 'insert_line'):
+                if self._insert_line(meshline, stats):
+                    self._update_support(stats)
+                delta = self._finish_delta(tracker)
+        finally:
+            self._tracker = None
+
+        if journal is not None:
+            journal.append_lines([entry], self)
+        self._publish(delta)
+        return delta
+
+    def insert_lines(self, meshlines: typing.Iterable[Meshline]) -> RefinementDelta:
+        """
+        Inserts several lines in the mesh. Steps 1 to 3 of insert_line are performed line by line, while step 4,
+        the rebuild of the element / basis function supports, is performed once for the whole batch. The result is
+        the same as inserting the lines one by one.
+
+        :param meshlines: meshlines to insert, in order
+        :return: the refinement delta of the whole batch
+        """
+        journal = self.journal
+        meshlines = list(meshlines)
+        if journal is not None:
+            entries = [journal.line_entry(m) for m in meshlines]
+
+        stats = self.stats
+        self._tracker = tracker = DeltaTracker(self)
+        try:
+            with phase(stats, 'insert_lines'):
+                inserted = False
+                for meshline in meshlines:
+                    with phase(stats, 'insert_line'):
+                        inserted |= self._insert_line(meshline, stats)
+                if inserted:
+                    self._update_support(stats)
+                delta = self._finish_delta(tracker)
+        finally:
+            self._tracker = None
+
+        if journal is not None:
+            journal.append_lines(entries, self)
+        self._publish(delta)
+        return delta
+
+    def _finish_delta(self, tracker: DeltaTracker) -> RefinementDelta:
+        """
+        Builds the refinement delta from the tracker, which also assigns ids to the new basis functions.
+        """
+        delta = tracker.finish(self)
+        self._active_ids = None
+        self._overlap_pattern = None
+        if self._overlap is not None:
+            self._update_overlap(delta)
+        return delta
+
+    def subscribe(self, callback: typing.Callable[[RefinementDelta], None]) -> typing.Callable:
+        """
+        Registers a callback, called with the RefinementDelta of every subsequent insertion.
+
+        :param callback: function taking a RefinementDelta
+        :return: the callback
+        """
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: typing.Callable) -> None:
+        """
+        Removes a callback registered with subscribe.
+
+        :param callback: the callback to remove
+        """
+        self._subscribers.remove(callback)
+
+    def _publish(self, delta: RefinementDelta) -> None:
+        for callback in list(self._subscribers):
+            callback(delta)
+
+    def _insert_line(self, meshline: Meshline, stats: typing.Optional[RefinementStats]) -> bool:
+        """
+        Implements steps 0 to 3 of insert_line, reporting to `stats` if it is not None. The supports are left to
+        be rebuilt by _update_support.
+
+        :return: True if the meshline was inserted, False if it was already present
+        """
         # step 0
         # merge any existing meshlines, if the meshline already exists, we are done and can return early.
-        meshline_already_exists, meshline = self.merge_meshlines(meshline)
+        with phase(stats, 'merge_meshlines'):
+            meshline_already_exists, meshline = self.merge_meshlines(meshline)
 
         if meshline_already_exists:
-            return
+            if stats is not None:
+                stats.count('lines_already_present')
+            return False
+        if self._tracker is not None:
+            self._tracker.meshlines.append(meshline)
 
         # update the list of global tensorproduct knots
         if meshline.axis == 0:
@@ -208,83 +457,129 @@ class LRSpline(object):
         # split B-splines against new meshline
         new_functions = []
         functions_to_remove = []
-        for basis in self.S:
-            if meshline.splits_basis(basis):
-                if meshline.number_of_knots_contained(basis) < meshline.multiplicity:
-                    self.local_split(basis, meshline, functions_to_remove, new_functions)
-
-        purged_S = [s for s in self.S if s not in functions_to_remove]
-
-        self.S = purged_S
+        with phase(stats, 'split_basis'):
+            for basis in self.S:
+                if meshline.splits_basis(basis):
+                    if meshline.number_of_knots_contained(basis) < meshline.multiplicity:
+                        self.local_split(basis, meshline, functions_to_remove, new_functions)
+            if stats is not None:
+                stats.count('functions_tested', len(self.S))
+
+            purged_S = []
+            for s in self.S:
+                if s not in functions_to_remove:
+                    purged_S.append(s)
+                elif self._tracker is not None:
+                    self._tracker.remove(s)
+
+            self.S = purged_S
         # step 2
         # split new B-splines against old meshlines
         self.meshlines.append(meshline)
 
-        # for basis in new_functions:
-        while len(new_functions) > 0:
-            basis = new_functions.pop()
-            split_more = False
-            for m in self.meshlines:
-                if m.splits_basis(basis):
-                    if m.number_of_knots_contained(basis) < m.multiplicity:
-                        split_more = True
-                        self.local_split(basis, m, functions_to_remove, new_functions)
-                        break
-            if not split_more:
-                self.S.append(basis)
+        with phase(stats, 'split_new_basis'):
+            functions_tested = 0
+            # for basis in new_functions:
+            while len(new_functions) > 0:
+                basis = new_functions.pop()
+                functions_tested += 1
+                split_more = False
+                for m in self.meshlines:
+                    if m.splits_basis(basis):
+                        if m.number_of_knots_contained(basis) < m.multiplicity:
+                            split_more = True
+                            self.local_split(basis, m, functions_to_remove, new_functions)
+                            break
+                if not split_more:
+                    self.S.append(basis)
+                    if self._tracker is not None:
+                        self._tracker.append(basis)
+            if stats is not None:
+                stats.count('functions_tested', functions_tested)
 
         # step 3
         # split all marked elements against new meshline
-        new_elements = []
-        for element in self.M:
-            if meshline.splits_element(element):
-                new_elements.append(element.split(axis=meshline.axis, split_value=meshline.constant_value))
+        with phase(stats, 'split_elements'):
+            new_elements = []
+            for element in self.M:
+                if meshline.splits_element(element):
+                    if self._tracker is not None:
+                        self._tracker.split_element(element)
+                    new_elements.append(element.split(axis=meshline.axis, split_value=meshline.constant_value))
+            if stats is not None:
+                stats.count('elements_tested', len(self.M))
+                stats.count('elements_split', len(new_elements))
+
+            self.M += new_elements
 
-        self.M += new_elements
+        if stats is not None:
+            stats.count('lines_inserted')
+        return True
 
+    def _update_support(self, stats: typing.Optional[RefinementStats]) -> None:
+        """
+        Implements step 4 of insert_line, and invalidates the cached lookup structures.
+        """
         # step 4
         # clean up, make sure all basis functions points to correct elements
         # make sure all elements point to correct basis functions
         # TODO: This implementation is preliminary, and possibly very slow.
-        for element in self.M:
-            element.supported_b_splines = []
-        for basis in self.S:
-            basis.elements_of_support = []
+        with phase(stats, 'support_update'):
             for element in self.M:
-                if basis.add_to_support_if_intersects(element):
-                    element.add_supported_b_spline(basis)
-
-        # invalidate the element cache
+                element.supported_b_splines = []
+            for basis in self.S:
+                basis.elements_of_support = []
+                for element in self.M:
+                    if basis.add_to_support_if_intersects(element):
+                        element.add_supported_b_spline(basis)
+            if stats is not None:
+                stats.count('support_pair_tests', len(self.S) * len(self.M))
+
+        # invalidate the element cache, new basis functions get their ids once the refinement delta is built
         self.element_cache = None
-        self.update_global_indices()
+        self._arrays = None
+        self._coefficients = None
+        if stats is not None:
+            stats.count('cache_invalidations')
 
     def local_split(self, basis, m, functions_to_remove, new_functions):
-        b1, b2 = split_single_basis_function(m, basis)
-        if self.contains_basis_function(b1):
-            self._update_old_basis_function(b1, self.S)
-        elif b1 in new_functions:
-            self._update_old_basis_function(b1, new_functions)
-        else:
-            new_functions.append(b1)
-        if self.contains_basis_function(b2):
-            self._update_old_basis_function(b2, self.S)
-        elif b2 in new_functions:
-            self._update_old_basis_function(b2, new_functions)
-        else:
-            new_functions.append(b2)
+        b1, b2, alpha_1, alpha_2 = split_single_basis_function(m, basis, return_weights=True)
+        tracker = self._tracker
+        if tracker is not None:
+            tracker.split(basis, b1, b2, alpha_1, alpha_2)
+        merged = 0
+        for b in (b1, b2):
+            if self.contains_basis_function(b):
+                basis_list = self.S
+            elif b in new_functions:
+                basis_list = new_functions
+            else:
+                new_functions.append(b)
+                continue
+            merged += 1
+            if tracker is not None:
+                # recorded before the weights are merged, the tracker reads the old weight of the target
+                tracker.merge(basis_list[basis_list.index(b)], b)
+            self._update_old_basis_function(b, basis_list)
         functions_to_remove.append(basis)
 
+        stats = self.stats
+        if stats is not None:
+            stats.count('splits_performed')
+            stats.count('functions_merged', merged)
+
     @staticmethod
-    def _update_old_basis_function(new_basis, basis_list) -> None:
+    def _update_old_basis_function(new_basis, basis_list) -> BSpline:
         """
         Updates the basis function corresponding to b1 with new weights and coefficients, dependent on
         the basis that was split, and the new basis function.
 
         :param new_basis: the `new basis` originating from splitting `original_basis`, which is already present in self.S
-        :return:
+        :return: the updated basis function in basis_list
         """
         i = basis_list.index(new_basis)
         basis_list[i].update_weights(new_basis)
+        return basis_list[i]
 
     def contains_basis_function(self, B: BSpline) -> bool:
         """
@@ -315,11 +610,11 @@ class LRSpline(object):
 
     def __call__(self, u, v):
         """
-        Evaluates the LRSpline at the point (u, v)
+        Evaluates the LRSpline at the point (u, v). See LRSpline.evaluate for evaluation at many points.
 
         :param u: first component
         :param v: secont component
-        :return: L(u, v)
+        :return: L(u, v), an array of shape (k, ) if the coefficients are vector valued
         """
 
         e = self.find_element_containing_point(u, v)
@@ -329,17 +624,383 @@ class LRSpline(object):
             total += b.coefficient * b(u, v)
         return total
 
-    def find_element_containing_point(self, u, v):
-        if self.last_element and self.last_element.contains(u, v):
-            return self.last_element
-        for e in self.M:
-            if e.contains(u, v):
-                break
-        else:
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['_local']
+        del state['_lock']
+        # callbacks are often closures or bound methods, which do not pickle
+        state['_subscribers'] = []
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        for b in self.S:
+            b.owner = self
+        connect_elements(self.M)
+
+    @property
+    def last_element(self) -> typing.Optional[Element]:
+        """
+        The element found by the previous point location in the current thread. The hint is thread-local, so
+        that concurrent evaluation from several threads does not share (or thrash) it.
+
+        :return: element or None
+        """
+        return getattr(self._local, 'last_element', None)
+
+    @last_element.setter
+    def last_element(self, element: typing.Optional[Element]) -> None:
+        self._local.last_element = element
+
+    def find_element_containing_point(self, u, v, hint: Element = None) -> Element:
+        """
+        Returns an element containing the point (u, v). The element `hint` is tested first, defaulting to the
+        element found by the previous call in the current thread, and the search walks the element adjacency from
+        there (see element.walk_to_point), so that a stream of nearby points only visits a few elements per point.
+
+        :param u: first component
+        :param v: second component
+        :param hint: element to start from
+        :return: element containing (u, v)
+        """
+        if hint is None:
+            hint = self.last_element
+        if hint is not None and hint.contains(u, v):
+            return hint
+        if not self.M:
             raise ValueError('({}, {}) is not in the domain'.format(u, v))
+        e = walk_to_point(hint if hint is not None else self.M[0], u, v)
         self.last_element = e
         return e
 
+    @property
+    def coefficients(self) -> np.ndarray:
+        """
+        The coefficients of the basis functions, as an array of shape (n, ) for a scalar valued LR-spline, or
+        (n, k) for a vector valued LR-spline (e.g., a parametric surface with k = 3). Row i belongs to the basis
+        function self.S[i], whose id is active_ids[i].
+
+        The array is cached and read-only. It is rebuilt after refinement, reordering, or when the coefficient of
+        one of the basis functions is set.
+
+        :return: array of coefficients
+        """
+        coefficients = self._coefficients
+        if coefficients is not None and not self._coefficients_dirty:
+            return coefficients
+        # cleared before reading the basis, so that a coefficient set meanwhile marks the new array stale again
+        self._coefficients_dirty = False
+        coefficients = np.array([b.coefficient for b in self.S], dtype=np.float64)
+        coefficients.flags.writeable = False
+        self._coefficients = coefficients
+        return coefficients
+
+    def _coefficients_changed(self) -> None:
+        """
+        Called by the basis functions when their coefficient is set.
+        """
+        self._coefficients_dirty = True
+
+    @coefficients.setter
+    def coefficients(self, values) -> None:
+        """
+        Sets the coefficients of the basis functions from an array of shape (n, ) or (n, k).
+
+        :param values: array of coefficients, row i belongs to the basis function self.S[i]
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim not in (1, 2) or len(values) != len(self.S):
+            raise ValueError('Expected coefficients of shape ({0}, ) or ({0}, k), got {1}'.format(len(self.S),
+                                                                                                values.shape))
+        for b, c in zip(self.S, values):
+            b.coefficient = c if values.ndim == 2 else float(c)
+        coefficients = values.copy()
+        coefficients.flags.writeable = False
+        self._coefficients = coefficients
+        self._coefficients_dirty = False
+
+    def _evaluation_arrays(self) -> dict:
+        """
+        Returns flat array representations of the mesh and basis used for batch evaluation. The arrays are cached,
+        and rebuilt after the mesh changes.
+
+            element_bounds: (u_min, v_min, u_max, v_max) per element, shape (m, 4)
+            knots_u, knots_v: local knot vectors, shape (n, degree_u + 2) and (n, degree_v + 2)
+            weights, end_u, end_v: per basis function, shape (n, )
+            element_indptr, element_indices: CSR table mapping element k to the positions (in self.S) of its
+                supported B-splines, element_indices[element_indptr[k]:element_indptr[k + 1]]
+
+        together with the point location tables (see evaluation.location_tables) and the tables of distinct
+        univariate factors per element (see evaluation.univariate_tables).
+
+        :return: dictionary of arrays
+        """
+        arrays = self._arrays
+        if arrays is not None:
+            return arrays
+        with self._lock:
+            if self._arrays is None:
+                self._arrays = self._build_evaluation_arrays()
+            return self._arrays
+
+    def _build_evaluation_arrays(self) -> dict:
+        position = {id(b): i for i, b in enumerate(self.S)}
+        counts = np.array([len(e.supported_b_splines) for e in self.M], dtype=np.intp)
+        indptr = np.zeros(len(self.M) + 1, dtype=np.intp)
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.array([position[id(b)] for e in self.M for b in e.supported_b_splines], dtype=np.intp)
+
+        arrays = {
+            'element_bounds': np.array([(e.u_min, e.v_min, e.u_max, e.v_max) for e in self.M],
+                                       dtype=np.float64).reshape(-1, 4),
+            'knots_u': np.array([b.knots_u for b in self.S], dtype=np.float64),
+            'knots_v': np.array([b.knots_v for b in self.S], dtype=np.float64),
+            'weights': np.array([b.weight for b in self.S], dtype=np.float64),
+            'end_u': np.array([b.end_u for b in self.S], dtype=bool),
+            'end_v': np.array([b.end_v for b in self.S], dtype=bool),
+            'element_indptr': indptr,
+            'element_indices': indices,
+        }
+        arrays.update(location_tables(arrays))
+        arrays.update(univariate_tables(arrays))
+        return arrays
+
+    def _locate_elements(self, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """
+        Returns the indices (in self.M) of the elements containing the points (u[i], v[i]).
+        See evaluation.locate_elements.
+        """
+        return locate_elements(self._evaluation_arrays(), u, v)
+
+    def _basis_values(self, u: np.ndarray, v: np.ndarray, r1=0, r2=0) -> typing.Tuple[np.ndarray, np.ndarray,
+                                                                                        np.ndarray]:
+        """
+        Evaluates all basis functions that are non-zero at the points (u[i], v[i]), that is, the sparse collocation
+        matrix in coordinate form (values, point indices, positions in self.S). See evaluation.basis_values.
+        """
+        return basis_values(self._evaluation_arrays(), u, v, r1, r2)
+
+    def evaluate(self, u, v, r1=0, r2=0, chunk_size=2 ** 16, sort_points=False) -> np.ndarray:
+        """
+        Evaluates the LR-spline (or its partial derivative of order (r1, r2)) at a batch of points in a single
+        pass over the basis, for all components of vector valued coefficients at once.
+
+        Apart from building the cached evaluation arrays on first use, this mutates no state of the LR-spline,
+        and may be called concurrently from several threads.
+
+        :param u: u components, array_like
+        :param v: v components, array_like, broadcastable against u
+        :param r1: derivative in u direction
+        :param r2: derivative in v direction
+        :param chunk_size: number of points evaluated at a time, bounds the memory use
+        :param sort_points: process the points grouped by element, see evaluation.evaluate_points_sorted
+        :return: array of shape u.shape for scalar coefficients, or u.shape + (k, ) for vector coefficients
+        """
+        u, v, shape = flatten_points(u, v)
+        coefficients = self.coefficients
+        evaluate = evaluate_points_sorted if sort_points else evaluate_points
+        result = evaluate(self._evaluation_arrays(), u, v, coefficients, r1, r2, chunk_size)
+        return result.reshape(shape + coefficients.shape[1:])
+
+    def evaluate_tiled(self, u, v, out, tile_shape=(1024, 1024), workers: int = 1,
+                       progress: typing.Callable[[int, int], None] = None, resume=False) -> np.ndarray:
+        """
+        Evaluates the LR-spline on the tensor grid u x v tile by tile, writing the values in place to `out`, which
+        may be a np.memmap or the path of a .npy file to create. Only a few tiles are held in memory at a time,
+        which allows rasterizing to grids that do not fit in memory. See tiling.evaluate_tiled.
+
+        :param u: increasing u components, or the number of uniformly spaced points spanning the domain
+        :param v: increasing v components, or the number of uniformly spaced points spanning the domain
+        :param out: output array of shape (N, M), or (N, M, k) for vector coefficients, or path of a .npy file
+        :param tile_shape: maximum number of grid points of a tile in u and v direction
+        :param workers: number of threads evaluating tiles concurrently
+        :param progress: called as progress(tiles_done, tiles_total) after every tile
+        :param resume: continue an interrupted evaluation into the same output, skipping the completed tiles. Raises
+            a ValueError if the grid, tile shape or coefficients differ from those of the interrupted evaluation
+        :return: the output array, entry [i, j] being the value at (u[i], v[j])
+        """
+        return evaluate_tiled(self._evaluation_arrays(), u, v, self.coefficients, out, tile_shape, workers,
+                              progress, resume)
+
+    def evaluate_parallel(self, u, v, workers: int = None, r1=0, r2=0, chunk_size=2 ** 16) -> np.ndarray:
+        """
+        Evaluates the LR-spline at a batch of points like LRSpline.evaluate, splitting the points across a pool
+        of threads. This relies on NumPy releasing the GIL inside the vectorized kernels.
+
+        :param u: u components, array_like
+        :param v: v components, array_like, broadcastable against u
+        :param workers: number of threads, defaults to the number of CPUs
+        :param r1: derivative in u direction
+        :param r2: derivative in v direction
+        :param chunk_size: maximum number of points per task
+        :return: array of shape u.shape for scalar coefficients, or u.shape + (k, ) for vector coefficients
+        """
+        u, v, shape = flatten_points(u, v)
+        coefficients = self.coefficients
+        result = evaluate_points_parallel(self._evaluation_arrays(), u, v, coefficients, r1, r2, workers, chunk_size)
+        return result.reshape(shape + coefficients.shape[1:])
+
+    def derivatives(self, u, v, order=2, chunk_size=2 ** 16) -> typing.Tuple[np.ndarray, ...]:
+        """
+        Evaluates the LR-spline and all its partial derivatives up to the given total order at a batch of points in
+        one pass. The elements are located once, and every univariate B-spline is evaluated together with its
+        derivatives, so the Hessian costs a small factor over the values alone.
+
+        For order 2, this returns the values, the gradients of shape u.shape + (2, ) and the Hessians of shape
+        u.shape + (2, 2). In general, the m-th array holds the symmetric tensors of m-th derivatives, entry
+        [i_1, ..., i_m] being the derivative taken in direction u for each i_j = 0 and v for each i_j = 1. For vector
+        valued coefficients, the component axis of length k comes before the derivative axes.
+
+        :param u: u components, array_like
+        :param v: v components, array_like, broadcastable against u
+        :param order: highest total order of the derivatives
+        :param chunk_size: number of points evaluated at a time, bounds the memory use
+        :return: tuple of order + 1 arrays
+        """
+        u, v, shape = flatten_points(u, v)
+        coefficients = self.coefficients
+        values = evaluate_derivatives(self._evaluation_arrays(), u, v, coefficients, order, chunk_size)
+        values = values.reshape((len(values),) + shape + coefficients.shape[1:])
+
+        result = []
+        for m in range(order + 1):
+            tensor = np.empty(shape + coefficients.shape[1:] + (2,) * m)
+            for index in itertools.product((0, 1), repeat=m):
+                # derivatives of total order m start at position m(m + 1) / 2, ordered by increasing order in v
+                tensor[(Ellipsis,) + index] = values[m * (m + 1) // 2 + sum(index)]
+            result.append(tensor)
+        return tuple(result)
+
+    def quasi_interpolate(self, f: typing.Callable, workers: int = None, chunk_size=2 ** 12) -> np.ndarray:
+        """
+        Sets the coefficients to those of a local quasi-interpolant of f, see LRSplines.quasi_interpolation.
+        Every coefficient is computed from a local least squares fit of samples of f on the support of its basis
+        function, grown where overloaded elements leave the coefficient undetermined, without solving a global
+        system. Polynomials of bidegree (degree_u, degree_v) are reproduced exactly.
+
+        :param f: function of (u, v), vectorized over flat arrays, returning an array of shape (N, ), or (N, k)
+            for vector valued coefficients
+        :param workers: number of threads the basis functions are split across, defaults to the number of CPUs
+        :param chunk_size: maximum number of basis functions per task
+        :return: the new coefficients, of shape (n, ) or (n, k)
+        """
+        coefficients = quasi_interpolate_parallel(self._evaluation_arrays(), f, workers, chunk_size)
+        self.coefficients = coefficients
+        return coefficients
+
+    def greville_points(self) -> np.ndarray:
+        """
+        Returns the knot averages (BSpline.knot_average) of all basis functions, computed from the knot matrices in
+        one pass.
+
+        :return: array of shape (n, 2), row i belongs to the basis function self.S[i]
+        """
+        arrays = self._evaluation_arrays()
+        return np.column_stack((arrays['knots_u'].mean(axis=1), arrays['knots_v'].mean(axis=1)))
+
+    def interpolate_greville(self, f: typing.Callable, solver='direct', tol=1.0e-10) -> np.ndarray:
+        """
+        Sets the coefficients to those of the interpolant of f at the Greville points (see greville_points). The
+        sparse collocation matrix is assembled in one vectorized pass, and factorized by a sparse LU decomposition,
+        or solved by BiCGSTAB preconditioned with an incomplete LU decomposition. Requires scipy.
+
+        :param f: function of (u, v), vectorized over flat arrays, returning an array of shape (n, ), or (n, k)
+            for vector valued coefficients
+        :param solver: 'direct' or 'iterative'
+        :param tol: relative tolerance of the iterative solver
+        :return: the new coefficients, of shape (n, ) or (n, k)
+        """
+        from scipy.sparse.linalg import LinearOperator, bicgstab, spilu, splu
+
+        points = self.greville_points()
+        A = collocation_matrix(self._evaluation_arrays(), points[:, 0], points[:, 1]).tocsc()
+        values = np.asarray(f(points[:, 0], points[:, 1]), dtype=np.float64)
+
+        if solver == 'direct':
+            coefficients = splu(A).solve(values)
+        elif solver == 'iterative':
+            ilu = spilu(A)
+            M = LinearOperator(A.shape, matvec=ilu.solve, dtype=np.float64)
+            # scipy renamed the relative tolerance of the Krylov solvers from tol to rtol
+            tolerance = {'rtol' if 'rtol' in inspect.signature(bicgstab).parameters else 'tol': tol}
+            columns = []
+            for b in values.reshape(len(values), -1).T:
+                x, info = bicgstab(A, b, M=M, atol=0.0, **tolerance)
+                if info != 0:
+                    raise RuntimeError('BiCGSTAB did not converge (info = {})'.format(info))
+                columns.append(x)
+            coefficients = np.column_stack(columns).reshape(values.shape)
+        else:
+            raise ValueError('Unknown solver {}'.format(solver))
+
+        self.coefficients = coefficients
+        return coefficients
+
+    def _integrate_basis(self, rectangle, moment_u: int, moment_v: int) -> np.ndarray:
+        arrays = self._evaluation_arrays()
+        u_min, v_min, u_max, v_max = (None, ) * 4 if rectangle is None else rectangle
+        knots_u, knots_v = arrays['knots_u'], arrays['knots_v']
+        return arrays['weights'] * \
+            _integrate_univariate_b_splines(knots_u, knots_u.shape[1] - 2, u_min, u_max, moment_u) * \
+            _integrate_univariate_b_splines(knots_v, knots_v.shape[1] - 2, v_min, v_max, moment_v)
+
+    def basis_integrals(self, rectangle=None) -> np.ndarray:
+        """
+        Returns the integrals of the (weighted) basis functions, computed from the knot matrices in one pass. Over
+        the whole domain these are weight * (knots_u[-1] - knots_u[0]) / (degree_u + 1) * (knots_v[-1] -
+        knots_v[0]) / (degree_v + 1). For instance, the load vector of a constant right hand side f is
+        f * basis_integrals(), and the lumped mass matrix is diag(basis_integrals()).
+
+        :param rectangle: (u_min, v_min, u_max, v_max) to integrate over, defaults to the whole domain
+        :return: array of shape (n, ), entry i belongs to the basis function self.S[i]
+        """
+        return self._integrate_basis(rectangle, 0, 0)
+
+    def basis_moments(self, rectangle=None) -> np.ndarray:
+        """
+        Returns the first moments of the (weighted) basis functions, the integrals of u * B_i and v * B_i. Over
+        the whole domain, these are the integrals (see basis_integrals) times the knot averages.
+
+        :param rectangle: (u_min, v_min, u_max, v_max) to integrate over, defaults to the whole domain
+        :return: array of shape (n, 2), row i belongs to the basis function self.S[i]
+        """
+        return np.column_stack((self._integrate_basis(rectangle, 1, 0), self._integrate_basis(rectangle, 0, 1)))
+
+    def integral(self, rectangle=None) -> np.ndarray:
+        """
+        Returns the integral of the LR-spline, see basis_integrals.
+
+        :param rectangle: (u_min, v_min, u_max, v_max) to integrate over, defaults to the whole domain
+        :return: a float, or an array of shape (k, ) for vector valued coefficients
+        """
+        return self.basis_integrals(rectangle) @ self.coefficients
+
+    def moments(self, rectangle=None) -> np.ndarray:
+        """
+        Returns the first moments of the LR-spline, the integrals of u * L(u, v) and v * L(u, v), see
+        basis_moments. Divided by the integral, they give the centroid of a non-negative LR-spline.
+
+        :param rectangle: (u_min, v_min, u_max, v_max) to integrate over, defaults to the whole domain
+        :return: array of shape (2, ), or (2, k) for vector valued coefficients
+        """
+        return self.basis_moments(rectangle).T @ self.coefficients
+
+    def freeze(self) -> FrozenLRSpline:
+        """
+        Returns an immutable evaluator for the current state of this LR-spline. It holds only flat NumPy arrays
+        (element bounds, a CSR element to basis table, knot matrices, weights and coefficients), so it pickles
+        cheaply and can be placed in shared memory for process pools (see FrozenLRSpline.to_shared_memory, which
+        requires Python 3.8 or later). Later refinement or changes of the coefficients of this LR-spline do not
+        affect the frozen evaluator.
+
+        :return: frozen evaluator
+        """
+        arrays = dict(self._evaluation_arrays())
+        arrays['coefficients'] = self.coefficients
+        return FrozenLRSpline(arrays)
+
     def merge_meshlines(self, meshline: Meshline) -> typing.Tuple[bool, Meshline]:
         """
         Tests the meshline against all currently stored meshlines, and combines, updates and deletes
@@ -356,6 +1017,9 @@ class LRSpline(object):
         tol = 1.0e-14
         meshlines_to_remove = []
 
+        if self.stats is not None:
+            self.stats.count('meshline_comparisons', len(self.meshlines))
+
         for old_meshline in self.meshlines:
             if not old_meshline._similar(meshline):
                 # the two meshlines are not comparable, continue.
@@ -397,50 +1061,30 @@ class LRSpline(object):
 
         for old_meshline in meshlines_to_remove:
             self.meshlines.remove(old_meshline)
+        if self.stats is not None:
+            self.stats.count('meshlines_merged', len(meshlines_to_remove))
         return False, meshline
 
     def visualize_mesh(self, multiplicity=True, overloading=True, text=True, relative=True, filename=None,
-                       color=False, title=True, axes=False) -> None:
+                       color=False, title=True, axes=False, show=True, label_threshold=400, dpi=None):
         """
         Plots the LR-mesh.
-        """
-        fig = plt.figure()
-        axs = fig.add_subplot(1, 1, 1)
-        for m in self.meshlines:
-            x = (m.start, m.stop)
-            y = (m.constant_value, m.constant_value)
-            if m.axis == 0:
-                axs.plot(y, x, color='black', linewidth=0.5)
-            else:
-                axs.plot(x, y, color='black', linewidth=0.5)
-            if multiplicity:
-                axs.text(m.midpoint[0], m.midpoint[1], '{}'.format(m.multiplicity),
-                         bbox=dict(facecolor='white', alpha=1), ha='center', va='center')
-        for m in self.M:
-            w = m.u_max - m.u_min
-            h = m.v_max - m.v_min
-
-            if overloading:
-                if m.is_overloaded():
-                    axs.add_patch(plp.Rectangle((m.u_min, m.v_min), w, h, fill=True, color='red' if color else 'black',
-                                                alpha=0.2))
-                else:
-                    axs.add_patch(
-                        plp.Rectangle((m.u_min, m.v_min), w, h, fill=True, color='green' if color else 'white',
-                                      alpha=0.2))
-                if text:
-                    axs.text(m.midpoint[0], m.midpoint[1], '{}'.format(len(m.supported_b_splines)), ha='center',
-                             va='center')
-        if title:
-            plt.title('dim(S) = {}'.format(len(self.S)))
 
-        if not axes:
-            plt.axis('off')
+        Meshlines and elements are drawn as one LineCollection and one PolyCollection respectively, so building
+        the figure scales with the size of the mesh arrays rather than with the number of matplotlib artists.
+        Text labels are skipped for meshes with more than `label_threshold` meshlines or elements.
+
+        Plotting is an optional layer: matplotlib is only imported when this method is called.
 
-        if filename:
-            plt.savefig(filename)
+        :param show: if False, the figure is rendered off-screen on an Agg canvas, without pyplot.
+        :param label_threshold: maximum number of labelled meshlines or elements, None for no limit.
+        :param dpi: resolution of raster output written to `filename`.
+        :return: the matplotlib figure
+        """
+        from LRSplines.visualization_utils import plot_mesh
 
-        plt.show()
+        return plot_mesh(self, multiplicity=multiplicity, overloading=overloading, text=text, filename=filename,
+                         color=color, title=title, axes=axes, show=show, label_threshold=label_threshold, dpi=dpi)
 
     def refine(self, beta: float, error_function: typing.Callable, refinement_strategy='minimal') -> None:
         """
@@ -452,19 +1096,26 @@ class LRSpline(object):
         :return: None
         """
 
+        if self.journal is not None:
+            self.journal.append_refine(beta, refinement_strategy)
+
         previous_dim = len(self.S)
         number_of_inserted_lines = 0
+        stats = self.stats
         while len(self.S) <= previous_dim * (1 + beta):
-            element_to_refine = max(self.M, key=error_function)
+            with phase(stats, 'select_element'):
+                element_to_refine = max(self.M, key=error_function)
 
-            if refinement_strategy is 'minimal':
+            if refinement_strategy == 'minimal':
                 m = self.get_minimal_span_meshline(element_to_refine, axis=number_of_inserted_lines % 2)
-            elif refinement_strategy is 'full':
+            elif refinement_strategy == 'full':
                 m = self.get_full_span_meshline(element_to_refine, axis=number_of_inserted_lines % 2)
             else:
-                raise NotImplemented('The requested refinement strategy is not implemented yet')
+                raise NotImplementedError('The requested refinement strategy is not implemented yet')
             self.insert_line(m)
             number_of_inserted_lines += 1
+            if stats is not None:
+                stats.count('refinement_steps')
 
     def mesh_to_array(self, N=20):
         """
@@ -524,11 +1175,13 @@ class LRSpline(object):
     def _element_cache(self):
 
         cache = {}
-        for k, e in enumerate(self.M):
-            i0 = _find_knot_interval(e.u_min, self.global_knots_u, endpoint=False)
-            i1 = _find_knot_interval(e.u_max, self.global_knots_u, endpoint=False)
-            j0 = _find_knot_interval(e.v_min, self.global_knots_v, endpoint=False)
-            j1 = _find_knot_interval(e.v_max, self.global_knots_v, endpoint=False)
+        bounds = np.array([(e.u_min, e.v_min, e.u_max, e.v_max) for e in self.M], dtype=np.float64).reshape(-1, 4)
+        I0 = _find_knot_interval(bounds[:, 0], self.global_knots_u, endpoint=False)
+        J0 = _find_knot_interval(bounds[:, 1], self.global_knots_v, endpoint=False)
+        # the upper bounds are knots, the element ends at the interval before them
+        I1 = np.searchsorted(self.global_knots_u, bounds[:, 2])
+        J1 = np.searchsorted(self.global_knots_v, bounds[:, 3])
+        for e, i0, j0, i1, j1 in zip(self.M, I0.tolist(), J0.tolist(), I1.tolist(), J1.tolist()):
             for i in range(i0, i1):
                 for j in range(j0, j1):
                     cache[(i, j)] = e
@@ -557,5 +1210,187 @@ class LRSpline(object):
         return np.array(idx, dtype=np.int)
 
     def update_global_indices(self):
+        """
+        Renumbers the basis functions densely, b.id being the position of b in self.S, and clears the free list.
+        """
         for i, b in enumerate(self.S):
             b.id = i
+            b.owner = self
+        self._basis_by_id = list(self.S)
+        self._free_ids = []
+        self._active_ids = None
+        self._overlap = None
+        self._overlap_pattern = None
+
+    @property
+    def id_capacity(self) -> int:
+        """
+        One more than the largest id in use (or retired and not yet recycled). Arrays indexed by basis function id
+        need this many entries.
+        """
+        return len(self._basis_by_id)
+
+    @property
+    def active_ids(self) -> np.ndarray:
+        """
+        The ids of the basis functions, in the order of self.S. This is the dense view used by solvers: entry i of
+        the arrays in S order (e.g., LRSpline.coefficients) belongs to the basis function with id active_ids[i].
+
+        :return: array of ids, shape (len(S), )
+        """
+        ids = self._active_ids
+        if ids is None:
+            ids = self._active_ids = np.array([b.id for b in self.S], dtype=np.intp)
+        return ids
+
+    def basis_function(self, i: int) -> BSpline:
+        """
+        Returns the basis function with id i.
+
+        Basis functions keep their id through refinement. Ids of basis functions removed by a refinement are
+        recycled by later refinements, smallest first, see RefinementDelta.
+
+        :param i: id of the basis function
+        :return: basis function
+        """
+        b = self._basis_by_id[i] if 0 <= i < len(self._basis_by_id) else None
+        if b is None:
+            raise KeyError('No basis function with id {}'.format(i))
+        return b
+
+    def overlap_pattern(self) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the symmetric sparsity pattern of the pairs of basis functions supported on a common element, that
+        is, of the mass and stiffness matrices and the Gram matrix, indexed by position in self.S. The pattern can
+        be used to allocate the storage of a global matrix up front, e.g. as
+        scipy.sparse.csr_matrix((np.zeros(len(indices)), indices, indptr)).
+
+        The first call derives the pattern from the element to basis function table in one pass. The overlaps are
+        then kept per basis function id, and updated on refinement for the added basis functions and their
+        neighbours only.
+
+        :return: CSR row pointers, shape (n + 1, ), and column indices, sorted within each row
+        """
+        pattern = self._overlap_pattern
+        if pattern is not None:
+            return pattern
+
+        ids = self.active_ids
+        if self._overlap is None:
+            arrays = self._evaluation_arrays()
+            indptr, indices = overlap_pattern(arrays['element_indptr'], arrays['element_indices'], len(self.S))
+            self._overlap = {i: ids[indices[indptr[k]:indptr[k + 1]]] for k, i in enumerate(ids.tolist())}
+        else:
+            position = np.full(self.id_capacity, -1, dtype=np.intp)
+            position[ids] = np.arange(len(ids))
+            rows = [position[self._overlap[i]] for i in ids.tolist()]
+            counts = np.array([len(r) for r in rows], dtype=np.intp)
+            indptr = np.zeros(len(ids) + 1, dtype=np.intp)
+            np.cumsum(counts, out=indptr[1:])
+            owners = np.repeat(np.arange(len(ids)), counts)
+            indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+            indices = indices[np.lexsort((indices, owners))]
+
+        self._overlap_pattern = (indptr, indices)
+        return self._overlap_pattern
+
+    def _overlapping_ids(self, b: BSpline) -> np.ndarray:
+        return np.unique(np.array([c.id for e in b.elements_of_support for c in e.supported_b_splines],
+                                  dtype=np.intp))
+
+    def _update_overlap(self, delta: RefinementDelta) -> None:
+        """
+        Updates the overlaps by id after a refinement. Only the rows of the added basis functions, and of the
+        basis functions that overlapped a removed or overlap an added one, change.
+        """
+        overlap = self._overlap
+        affected = set()
+        for i in delta.removed.tolist():
+            affected.update(overlap.pop(i).tolist())
+        for i in delta.added.tolist():
+            overlap[i] = self._overlapping_ids(self.basis_function(i))
+            affected.update(overlap[i].tolist())
+        affected.difference_update(delta.removed.tolist())
+        affected.difference_update(delta.added.tolist())
+        for i in affected:
+            overlap[i] = self._overlapping_ids(self.basis_function(i))
+
+    def compact(self) -> np.ndarray:
+        """
+        Renumbers the basis functions densely in the order of self.S, removing the gaps left by retired ids.
+
+        :return: array mapping every old id to its new id, -1 for unused ids, shape (old id_capacity, )
+        """
+        old_to_new = np.full(self.id_capacity, -1, dtype=np.intp)
+        old_to_new[self.active_ids] = np.arange(len(self.S))
+        self.update_global_indices()
+        return old_to_new
+
+    def morton_order(self, basis=True) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Reorders the elements of self.M, and optionally the basis functions of self.S, along a Morton (Z-order)
+        curve through their midpoints and knot averages respectively. Neighbouring elements and basis functions
+        then sit close in the evaluation arrays, which improves the cache locality of batch evaluation,
+        in particular with LRSpline.evaluate(..., sort_points=True).
+
+        The basis functions keep their ids, but the positions of elements and basis functions change, and with them
+        the order of LRSpline.coefficients. Since subscribers (e.g., an AssemblyCache) may refer to elements by
+        position, reordering is refused while there are subscribers.
+
+        :param basis: also reorder the basis functions
+        :return: the old positions of the elements and of the basis functions, in their new order
+        """
+        if self._subscribers:
+            raise ValueError('Cannot reorder the LR-spline while subscribers refer to it by position')
+
+        bounds = self._evaluation_arrays()['element_bounds']
+        elements = np.argsort(morton_codes(0.5 * (bounds[:, 0] + bounds[:, 2]), 0.5 * (bounds[:, 1] + bounds[:, 3]),
+                                           self.u_range, self.v_range), kind='stable')
+        functions = np.arange(len(self.S))
+        if basis:
+            points = self.greville_points()
+            functions = np.argsort(morton_codes(points[:, 0], points[:, 1], self.u_range, self.v_range),
+                                   kind='stable')
+
+        # reorder in place, other objects may hold references to the lists
+        self.M[:] = [self.M[k] for k in elements.tolist()]
+        self.S[:] = [self.S[i] for i in functions.tolist()]
+        self._arrays = None
+        self._coefficients = None
+        self._active_ids = None
+        self._overlap_pattern = None
+        self._element_cache()
+        return elements, functions
+
+    def _allocate_id(self, b: BSpline) -> int:
+        if self._free_ids:
+            i = heapq.heappop(self._free_ids)
+            self._basis_by_id[i] = b
+        else:
+            i = len(self._basis_by_id)
+            self._basis_by_id.append(b)
+        b.id = i
+        b.owner = self
+        return i
+
+    def _release_id(self, i: int) -> None:
+        self._basis_by_id[i].owner = None
+        self._basis_by_id[i] = None
+        heapq.heappush(self._free_ids, i)
+
+    def _restore_ids(self, ids) -> None:
+        """
+        Assigns the given ids to the basis functions in self.S, e.g., after loading from file. Unused ids below the
+        largest one are put on the free list.
+
+        :param ids: ids in the order of self.S
+        """
+        ids = np.asarray(ids, dtype=np.intp)
+        self._basis_by_id = [None] * (int(ids.max()) + 1 if len(ids) else 0)
+        for b, i in zip(self.S, ids.tolist()):
+            b.id = i
+            self._basis_by_id[i] = b
+        self._free_ids = [i for i, b in enumerate(self._basis_by_id) if b is None]
+        self._active_ids = None
+        self._overlap = None
+        self._overlap_pattern = None
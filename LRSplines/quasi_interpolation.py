@@ -0,0 +1,244 @@
+"""
+Local quasi-interpolation of functions by LR-splines, without solving global systems.
+
+The coefficient of every basis function is computed from samples of f on a local domain, initially the support of
+the basis function: f is sampled at a tensor grid of (degree_u + 1)(degree_v + 1) Chebyshev points on every element
+of the domain, and the coefficient is that of the basis function in the local least squares fit (of minimal norm) of
+the samples by all basis functions that are non-zero on the domain.
+
+The samples on an element determine any polynomial of bidegree (degree_u, degree_v) on it, so the fit reproduces
+every spline of the LR-spline space on the domain, and its coefficient is exact as long as the restrictions of the
+local basis functions to the domain determine it. On overloaded elements they are linearly dependent, and this may
+fail even on the whole support. The domains of such basis functions are therefore grown, to the supports of all basis
+functions that are non-zero on them, until the coefficient is determined. In particular, polynomials of bidegree
+(degree_u, degree_v) are reproduced exactly. The blossoms at the local knots would only do so on tensor product
+meshes, as the weights of LR B-splines depend on the refinement history.
+
+Each coefficient is a fixed linear combination of the samples on its domain, so the cost is linear in the number of
+basis functions, and the coefficients can be computed independently.
+
+The functions operate on the evaluation arrays of evaluation.py.
+"""
+import os
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from LRSplines.evaluation import basis_values
+
+Supports = typing.Tuple[np.ndarray, np.ndarray]
+
+
+def _chebyshev_nodes(degree: int) -> np.ndarray:
+    """
+    Returns the degree + 1 Chebyshev points on [0, 1].
+    """
+    k = np.arange(degree + 1)
+    return np.sort(0.5 - 0.5 * np.cos((2 * k + 1) * np.pi / (2 * degree + 2)))
+
+
+def support_elements(arrays: dict) -> Supports:
+    """
+    Returns the elements in the support of every basis function, as a CSR table transposing the element to basis
+    table of the evaluation arrays.
+
+    :param arrays: evaluation arrays
+    :return: indptr and elements, the support of basis function j being elements[indptr[j]:indptr[j + 1]]
+    """
+    indptr, indices = arrays['element_indptr'], arrays['element_indices']
+    entry_element = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+
+    support_indptr = np.zeros(len(arrays['weights']) + 1, dtype=np.intp)
+    np.cumsum(np.bincount(indices, minlength=len(arrays['weights'])), out=support_indptr[1:])
+    return support_indptr, entry_element[order]
+
+
+def quasi_interpolation_points(arrays: dict, elements: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the tensor grids of Chebyshev points of the given elements.
+
+    :param arrays: evaluation arrays
+    :param elements: element indices, shape (m, )
+    :return: u and v components of the sampling points, shape (m, (degree_u + 1)(degree_v + 1))
+    """
+    u_min, v_min, u_max, v_max = arrays['element_bounds'][elements].T
+    degree_u, degree_v = arrays['knots_u'].shape[1] - 2, arrays['knots_v'].shape[1] - 2
+
+    nodes_u = u_min[:, None] + (u_max - u_min)[:, None] * _chebyshev_nodes(degree_u)
+    nodes_v = v_min[:, None] + (v_max - v_min)[:, None] * _chebyshev_nodes(degree_v)
+    u = np.repeat(nodes_u, degree_v + 1, axis=1)
+    v = np.tile(nodes_v, (1, degree_u + 1))
+    return u, v
+
+
+def _element_collocation(arrays: dict, elements: np.ndarray, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Evaluates the B-splines supported on the given elements at their sampling points.
+
+    :return: array of shape (m, (degree_u + 1)(degree_v + 1), c), column k of an element holding its k-th supported
+        B-spline, padded with zeros to the largest number c of supported B-splines
+    """
+    counts = np.diff(arrays['element_indptr'])[elements]
+    values, points, _ = basis_values(arrays, u.ravel(), v.ravel())
+
+    # the sampling points are interior to their element, so the pairs of a point are its element's B-splines in order
+    point_counts = np.repeat(counts, u.shape[1])
+    columns = np.arange(len(points)) - np.repeat(np.cumsum(point_counts) - point_counts, point_counts)
+
+    matrices = np.zeros((len(elements), u.shape[1], counts.max(initial=0)))
+    matrices[points // u.shape[1], points % u.shape[1], columns] = values
+    return matrices
+
+
+def _domain_coefficients(arrays: dict, functions: np.ndarray, indptr: np.ndarray, domains: np.ndarray,
+                         elements: np.ndarray, matrices: np.ndarray,
+                         samples: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Fits the samples on the local domains of the given basis functions. The domain of functions[i] consists of the
+    elements elements[domains[indptr[i]:indptr[i + 1]]], with collocation matrices and samples at the same positions
+    of matrices and samples.
+
+    :return: the coefficients of the basis functions in their local fits, of shape (m, ) or (m, k), and whether the
+        samples determine them, shape (m, )
+    """
+    element_indptr, element_indices = arrays['element_indptr'], arrays['element_indices']
+    n, s = len(arrays['weights']), matrices.shape[1]
+    sizes = np.diff(indptr)
+
+    # every element of a domain (a slot) contributes the columns of its supported B-splines (the pairs)
+    slot_owner = np.repeat(np.arange(len(functions)), sizes)
+    slot_rows = (np.arange(len(domains)) - np.repeat(indptr[:-1], sizes))[:, None] * s + np.arange(s)
+    counts = np.diff(element_indptr)[elements[domains]]
+    pair_slot = np.repeat(np.arange(len(domains)), counts)
+    pair_column = np.arange(len(pair_slot)) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_function = element_indices[element_indptr[elements[domains]][pair_slot] + pair_column]
+
+    # number the B-splines that are non-zero on each domain
+    keys, local = np.unique(slot_owner[pair_slot] * n + pair_function, return_inverse=True)
+    starts = np.searchsorted(keys, np.arange(len(functions) + 1) * n)
+    local = local.ravel() - starts[slot_owner[pair_slot]]
+    targets = np.searchsorted(keys, np.arange(len(functions)) * n + functions) - starts[:-1]
+    widths = np.diff(starts)
+
+    coefficients = np.zeros((len(functions),) + samples.shape[2:])
+    determined = np.zeros(len(functions), dtype=bool)
+    # batch the local least squares problems of equal size, padded with zeros to the widest
+    for size in np.unique(sizes):
+        group = np.nonzero(sizes == size)[0]
+        position = np.full(len(functions), -1)
+        position[group] = np.arange(len(group))
+        slots = np.nonzero(position[slot_owner] >= 0)[0]
+        pairs = np.nonzero(position[slot_owner[pair_slot]] >= 0)[0]
+
+        A = np.zeros((len(group), size * s, widths[group].max()))
+        A[position[slot_owner[pair_slot[pairs]]][:, None], slot_rows[pair_slot[pairs]], local[pairs][:, None]] = \
+            matrices[domains[pair_slot[pairs]], :, pair_column[pairs]]
+        y = np.zeros((len(group), size * s) + samples.shape[2:])
+        y[position[slot_owner[slots]][:, None], slot_rows[slots]] = samples[domains[slots]]
+
+        functionals = np.linalg.pinv(A)[np.arange(len(group)), targets[group]]
+        coefficients[group] = np.einsum('ik,ik...->i...', functionals, y)
+        # the samples determine the coefficient if its unit vector lies in the row space of the local matrix
+        reproduced = np.einsum('ik,ik->i', functionals, A[np.arange(len(group)), :, targets[group]])
+        determined[group] = np.abs(reproduced - 1) < 1.0e-8
+    return coefficients, determined
+
+
+def _grow_domains(arrays: dict, supports: Supports, indptr: np.ndarray,
+                  domains: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Replaces every domain (a CSR table of elements) by the union of the supports of the B-splines that are non-zero
+    on it.
+    """
+    element_indptr, element_indices = arrays['element_indptr'], arrays['element_indices']
+    support_indptr, support = supports
+    n, m = len(arrays['weights']), len(element_indptr) - 1
+
+    owners = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    counts = np.diff(element_indptr)[domains]
+    pair_owner = np.repeat(owners, counts)
+    pair_function = element_indices[np.repeat(element_indptr[domains], counts) +
+                                    np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+    functions = np.unique(pair_owner * n + pair_function)
+
+    counts = np.diff(support_indptr)[functions % n]
+    grown = np.unique(np.repeat(functions // n, counts) * m + support[
+        np.repeat(support_indptr[functions % n], counts) + np.arange(counts.sum()) -
+        np.repeat(np.cumsum(counts) - counts, counts)])
+
+    grown_indptr = np.searchsorted(grown, np.arange(len(indptr)) * m)
+    return grown_indptr, grown % m
+
+
+def quasi_interpolate(arrays: dict, f: typing.Callable, functions: np.ndarray, supports: Supports = None,
+                      max_growth=4) -> np.ndarray:
+    """
+    Computes the quasi-interpolation coefficients of f for the given basis functions.
+
+    :param arrays: evaluation arrays
+    :param f: function of (u, v), vectorized over flat arrays, returning an array of shape (N, ) or (N, k)
+    :param functions: positions of the basis functions, shape (n, )
+    :param supports: the result of support_elements, computed if not given
+    :param max_growth: maximum number of times the domain of a basis function is grown, after which the minimal
+        norm fit is used
+    :return: coefficients of shape (n, ) or (n, k)
+    """
+    support_indptr, support = support_elements(arrays) if supports is None else supports
+    functions = np.asarray(functions, dtype=np.intp)
+    counts = np.diff(support_indptr)[functions]
+    indptr = np.zeros(len(functions) + 1, dtype=np.intp)
+    np.cumsum(counts, out=indptr[1:])
+    domains = support[np.repeat(support_indptr[functions], counts) + np.arange(indptr[-1]) -
+                      np.repeat(indptr[:-1], counts)]
+
+    coefficients = None
+    pending = np.arange(len(functions))
+    for growth in range(max_growth + 1):
+        elements, positions = np.unique(domains, return_inverse=True)
+        u, v = quasi_interpolation_points(arrays, elements)
+        samples = np.asarray(f(u.ravel(), v.ravel()), dtype=np.float64)
+        samples = samples.reshape(u.shape + samples.shape[1:])
+
+        local, determined = _domain_coefficients(arrays, functions[pending], indptr, positions.ravel(), elements,
+                                                 _element_collocation(arrays, elements, u, v), samples)
+        if coefficients is None:
+            coefficients = local
+        else:
+            coefficients[pending] = local
+        if growth == max_growth or np.all(determined):
+            break
+
+        keep = np.repeat(~determined, np.diff(indptr))
+        indptr = np.r_[0, np.cumsum(np.diff(indptr)[~determined])]
+        domains = domains[keep]
+        pending = pending[~determined]
+        indptr, domains = _grow_domains(arrays, (support_indptr, support), indptr, domains)
+    return coefficients
+
+
+def quasi_interpolate_parallel(arrays: dict, f: typing.Callable, workers: int = None,
+                               chunk_size=2 ** 12) -> np.ndarray:
+    """
+    Computes the quasi-interpolation coefficients of f for all basis functions, splitting them into chunks
+    across a pool of threads. Like evaluate_points_parallel, this relies on f and NumPy releasing the GIL.
+
+    :param arrays: evaluation arrays
+    :param f: function of (u, v), vectorized over flat arrays, returning an array of shape (N, ) or (N, k)
+    :param workers: number of threads, defaults to the number of CPUs
+    :param chunk_size: maximum number of basis functions per task
+    :return: coefficients of shape (n, ) or (n, k)
+    """
+    n = len(arrays['weights'])
+    supports = support_elements(arrays)
+    workers = workers or os.cpu_count() or 1
+    bounds = list(range(0, n, chunk_size)) + [n]
+    if workers == 1 or len(bounds) <= 2:
+        return quasi_interpolate(arrays, f, np.arange(n), supports)
+
+    def task(start, stop):
+        return quasi_interpolate(arrays, f, np.arange(start, stop), supports)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return np.concatenate(list(pool.map(task, bounds[:-1], bounds[1:])))
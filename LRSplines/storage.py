@@ -0,0 +1,176 @@
+"""
+Compact binary storage of LR-splines. An LR-spline is saved as a directory holding one .npy file per array and a
+meta.json file with the format version, the bidegree and the list of arrays:
+
+    knots_u, knots_v, weights, coefficients, basis_ids: the basis functions, their coefficients and ids
+    end_u, end_v, north, south, east, west: boundary flags of the basis functions
+    element_bounds, element_levels: the elements
+    element_indptr, element_indices: CSR table of the basis functions supported on each element
+    meshlines, multiplicities: (start, stop, constant_value, axis) and multiplicity of each meshline
+    global_knots_u, global_knots_v, u_range, v_range: the global knots and the domain
+    grid_u, grid_v, location_axis, location_keys, location_elements: the point location tables used for evaluation,
+        see evaluation.location_tables
+    unique_knots_u, ..., element_slots_v: the univariate tables used for evaluation, see evaluation.univariate_tables
+
+Since .npy files can be memory-mapped, load_frozen_lr_spline opens a saved LR-spline for read-only evaluation
+without reading the arrays into memory; pages are only read as the arrays are queried.
+"""
+import json
+import os
+import shutil
+import typing
+import uuid
+
+import numpy as np
+
+from LRSplines.evaluation import LOCATION_ARRAYS, UNIVARIATE_ARRAYS
+from LRSplines.frozen_lr_spline import FROZEN_ARRAYS, FrozenLRSpline
+from LRSplines.lr_spline import LRSpline, init_lr_spline_from_arrays
+
+FORMAT = 'LRSplines'
+VERSION = 1
+
+_META = 'meta.json'
+
+
+def _is_saved_lr_spline(path: str) -> bool:
+    """
+    Returns whether the directory holds nothing but the files of a (possibly incompletely) saved LR-spline.
+    """
+    return all(name == _META or name.endswith('.npy') for name in os.listdir(path))
+
+
+def _fsync_directory(path: str) -> None:
+    """
+    Flushes the entries of a directory (created, removed and renamed files) to disk. Directories cannot be opened
+    on Windows, where this is a no-op.
+    """
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def save_lr_spline(LR: LRSpline, path: str, sync: bool = False) -> None:
+    """
+    Saves the LR-spline to the directory `path`. An LR-spline previously saved to `path` is replaced as a whole:
+    the files are written to a hidden sibling directory, which is renamed into place once complete, so that `path`
+    never holds a mixture of the old and the new arrays, and an interrupted save leaves the old LR-spline loadable.
+    Memory-mapped arrays of the old LR-spline stay valid.
+
+    :param LR: the LR-spline
+    :param path: directory to save to, which must not exist or hold a saved LR-spline
+    :param sync: flush the files and directories to disk before returning, so that the saved LR-spline survives a
+        power loss
+    """
+    path = os.path.abspath(path)
+    if os.path.exists(path) and not (os.path.isdir(path) and _is_saved_lr_spline(path)):
+        raise ValueError('{} exists and is not a saved LR-spline'.format(path))
+
+    arrays = dict(LR._evaluation_arrays())
+    arrays.update({
+        'coefficients': LR.coefficients,
+        'basis_ids': LR.active_ids,
+        'north': np.array([b.north for b in LR.S], dtype=bool),
+        'south': np.array([b.south for b in LR.S], dtype=bool),
+        'east': np.array([b.east for b in LR.S], dtype=bool),
+        'west': np.array([b.west for b in LR.S], dtype=bool),
+        'element_levels': np.array([e.level for e in LR.M], dtype=np.intp),
+        'meshlines': np.array([(m.start, m.stop, m.constant_value, m.axis) for m in LR.meshlines],
+                              dtype=np.float64).reshape(-1, 4),
+        'multiplicities': np.array([m.multiplicity for m in LR.meshlines], dtype=np.intp),
+        'global_knots_u': np.asarray(LR.global_knots_u, dtype=np.float64),
+        'global_knots_v': np.asarray(LR.global_knots_v, dtype=np.float64),
+        'u_range': np.asarray(LR.u_range, dtype=np.float64),
+        'v_range': np.asarray(LR.v_range, dtype=np.float64),
+    })
+
+    parent, name = os.path.split(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, '.{}.{}'.format(name, uuid.uuid4().hex))
+    os.mkdir(staging)
+    try:
+        for key, array in arrays.items():
+            with open(os.path.join(staging, key + '.npy'), 'wb') as f:
+                np.save(f, array, allow_pickle=False)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        meta = {
+            'format': FORMAT,
+            'version': VERSION,
+            'degree_u': int(LR.S[0].degree_u),
+            'degree_v': int(LR.S[0].degree_v),
+            'basis_functions': len(LR.S),
+            'elements': len(LR.M),
+            'arrays': sorted(arrays),
+        }
+        with open(os.path.join(staging, _META), 'w') as f:
+            json.dump(meta, f, indent=2)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        if sync:
+            _fsync_directory(staging)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # a directory cannot be renamed onto a non-empty one, so the old LR-spline is moved aside first
+    old = None
+    if os.path.exists(path):
+        old = staging + '.old'
+        os.replace(path, old)
+    os.replace(staging, path)
+    if sync:
+        _fsync_directory(parent)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(os.path.join(path, _META)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise ValueError('{} is not a saved LR-spline (missing {})'.format(path, _META))
+    if meta.get('format') != FORMAT:
+        raise ValueError('{} is not a saved LR-spline'.format(path))
+    if meta.get('version', 0) > VERSION:
+        raise ValueError('{} was saved in format version {}, only versions up to {} are supported'.format(
+            path, meta['version'], VERSION))
+    return meta
+
+
+def _load_arrays(path: str, keys: typing.Iterable[str], mmap: bool) -> typing.Dict[str, np.ndarray]:
+    return {key: np.load(os.path.join(path, key + '.npy'), mmap_mode='r' if mmap else None, allow_pickle=False)
+            for key in keys}
+
+
+def load_lr_spline(path: str) -> LRSpline:
+    """
+    Loads an LR-spline saved by save_lr_spline. The mesh and basis are built directly from the arrays.
+
+    :param path: directory to load from
+    :return: the LR-spline
+    """
+    meta = _read_meta(path)
+    return init_lr_spline_from_arrays(_load_arrays(path, meta['arrays'], mmap=False))
+
+
+def load_frozen_lr_spline(path: str, mmap: bool = True) -> FrozenLRSpline:
+    """
+    Loads an LR-spline saved by save_lr_spline as a FrozenLRSpline for read-only evaluation. With mmap, the arrays
+    are memory-mapped, so that opening even a huge model is almost free until it is evaluated.
+
+    :param path: directory to load from
+    :param mmap: memory-map the arrays instead of reading them
+    :return: frozen LR-spline
+    """
+    meta = _read_meta(path)
+    # the location and univariate tables are rebuilt if the LR-spline was saved without them
+    keys = FROZEN_ARRAYS + tuple(key for key in LOCATION_ARRAYS + UNIVARIATE_ARRAYS if key in meta['arrays'])
+    return FrozenLRSpline(_load_arrays(path, keys, mmap))
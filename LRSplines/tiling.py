@@ -0,0 +1,218 @@
+"""
+Tiled evaluation of LR-splines on large tensor grids, e.g. to rasterize a surface to a height map that does not fit in
+memory. The grid is split into tiles, which are evaluated independently and written in place to the output array,
+typically a memory mapped .npy file, so that the memory use is bounded by a few tiles.
+
+Within a tile, the points are assigned to elements like in evaluation.locate_elements. Since the grid is a tensor
+grid, the points of an element form a sub-block of the tile, on which the spline is evaluated separably: the
+univariate B-splines are evaluated once per grid line, and the block is a sum of outer products.
+
+Completed tiles are recorded in a state file next to the output, so that an interrupted evaluation can be resumed. The
+state file starts with a header identifying the output shape, the tiling, the grid and the coefficients, and a resumed
+evaluation with any of them changed is refused.
+
+The functions operate on the evaluation arrays of evaluation.py.
+"""
+import hashlib
+import json
+import os
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from LRSplines.evaluation import univariate_values
+
+Tile = typing.Tuple[int, int, int, int]
+
+
+def grid_tiles(shape: typing.Tuple[int, int], tile_shape: typing.Tuple[int, int]) -> typing.List[Tile]:
+    """
+    Splits a grid of the given shape into tiles, in row major order.
+
+    :param shape: number of grid points in u and v direction
+    :param tile_shape: maximum number of grid points of a tile in u and v direction
+    :return: list of tiles (i0, i1, j0, j1), covering the grid points [i0, i1) x [j0, j1)
+    """
+    return [(i, min(i + tile_shape[0], shape[0]), j, min(j + tile_shape[1], shape[1]))
+            for i in range(0, shape[0], tile_shape[0]) for j in range(0, shape[1], tile_shape[1])]
+
+
+def _grid_cells(grid: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """
+    Returns the cells of the global knots containing the points x, as in locate_elements.
+    """
+    return np.clip(np.searchsorted(grid, x, side='right') - 1, 0, len(grid) - 2)
+
+
+def evaluate_grid_tile(arrays: dict, u: np.ndarray, v: np.ndarray, coefficients: np.ndarray) -> np.ndarray:
+    """
+    Evaluates the spline with the given coefficients on the tensor grid u x v, element by element, visiting only
+    the elements intersecting the grid.
+
+    :param arrays: evaluation arrays
+    :param u: increasing u components, shape (N, )
+    :param v: increasing v components, shape (M, )
+    :param coefficients: coefficients of shape (n, ) or (n, k)
+    :return: array of shape (N, M) or (N, M, k), entry [i, j] being the value at (u[i], v[j])
+    """
+    result = np.zeros((len(u), len(v)) + coefficients.shape[1:])
+    if len(u) == 0 or len(v) == 0:
+        return result
+
+    grid_u, grid_v = arrays['grid_u'], arrays['grid_v']
+    cells_u, cells_v = _grid_cells(grid_u, u), _grid_cells(grid_v, v)
+    # the elements overlapping the cells of the tile
+    bounds = arrays['element_bounds']
+    elements = np.nonzero((bounds[:, 0] <= grid_u[cells_u[-1]]) & (bounds[:, 2] > grid_u[cells_u[0]]) &
+                          (bounds[:, 1] <= grid_v[cells_v[-1]]) & (bounds[:, 3] > grid_v[cells_v[0]]))[0]
+
+    degree_u = arrays['knots_u'].shape[1] - 2
+    degree_v = arrays['knots_v'].shape[1] - 2
+    indptr, indices = arrays['element_indptr'], arrays['element_indices']
+    for e in elements.tolist():
+        u_min, v_min, u_max, v_max = arrays['element_bounds'][e]
+        # the points of the element are those in its cells, a sub-block of the sorted grid
+        i0, i1 = np.searchsorted(cells_u, np.searchsorted(grid_u, [u_min, u_max]))
+        j0, j1 = np.searchsorted(cells_v, np.searchsorted(grid_v, [v_min, v_max]))
+        if i0 == i1 or j0 == j1:
+            continue
+
+        functions = indices[indptr[e]:indptr[e + 1]]
+        Bu = univariate_values(u[i0:i1], arrays['knots_u'][functions], arrays['end_u'][functions], degree_u)
+        Bv = univariate_values(v[j0:j1], arrays['knots_v'][functions], arrays['end_v'][functions], degree_v)
+        c = (arrays['weights'][functions] * coefficients[functions].T).T
+        if c.ndim == 1:
+            result[i0:i1, j0:j1] = (Bu.T * c) @ Bv
+        else:
+            for k in range(c.shape[1]):
+                result[i0:i1, j0:j1, k] = (Bu.T * c[:, k]) @ Bv
+    return result
+
+
+def _grid_axis(x, domain: np.ndarray) -> np.ndarray:
+    """
+    Returns the grid coordinates given as an increasing array, or as a number of uniformly spaced points spanning the
+    domain.
+    """
+    if np.ndim(x) == 0:
+        return np.linspace(domain[0], domain[-1], int(x))
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim != 1 or np.any(np.diff(x) < 0):
+        raise ValueError('Expected an increasing one-dimensional array of grid coordinates')
+    if len(x) and (x[0] < domain[0] or x[-1] > domain[-1]):
+        raise ValueError('The grid [{}, {}] is not in the domain [{}, {}]'.format(x[0], x[-1], domain[0],
+                                                                                 domain[-1]))
+    return x
+
+
+def _state_header(shape: tuple, tile_shape: typing.Tuple[int, int], u: np.ndarray, v: np.ndarray,
+                  coefficients: np.ndarray) -> str:
+    """
+    Returns the header line of a state file, identifying the output shape, the tiling and a digest of the grid and
+    the coefficients.
+    """
+    digest = hashlib.sha256()
+    for array in (u, v, coefficients):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return json.dumps({'shape': list(shape), 'tile_shape': list(tile_shape), 'digest': digest.hexdigest()})
+
+
+def _read_state(path: str) -> typing.Tuple[str, typing.Set[int]]:
+    """
+    Returns the header and the completed tiles of a state file.
+    """
+    with open(path) as f:
+        lines = f.read().split('\n')
+    # the last line is incomplete if the evaluation was interrupted while writing it
+    return lines[0], {int(line) for line in lines[1:-1]}
+
+
+def evaluate_tiled(arrays: dict, u, v, coefficients: np.ndarray, out, tile_shape=(1024, 1024), workers: int = 1,
+                   progress: typing.Callable[[int, int], None] = None, resume=False, state: str = None):
+    """
+    Evaluates the spline on the tensor grid u x v tile by tile (see evaluate_grid_tile), writing every tile in
+    place to `out`. Tiles are flushed to disk as they complete, and recorded in the state file, which is removed
+    once the whole grid is written.
+
+    :param arrays: evaluation arrays
+    :param u: increasing u components, or the number of uniformly spaced points spanning the domain
+    :param v: increasing v components, or the number of uniformly spaced points spanning the domain
+    :param coefficients: coefficients of shape (n, ) or (n, k)
+    :param out: output array (e.g. a np.memmap) of shape (N, M) or (N, M, k), or the path of a .npy file, which is
+        created as a memory mapped array
+    :param tile_shape: maximum number of grid points of a tile in u and v direction
+    :param workers: number of threads evaluating tiles concurrently
+    :param progress: called as progress(tiles_done, tiles_total) after every tile
+    :param resume: skip the tiles recorded in the state file by a previous, interrupted call with the same output,
+        which must have had the same grid, tile shape and coefficients
+    :param state: path of the state file, defaults to the output path with '.tiles' appended
+    :return: the output array
+    """
+    u = _grid_axis(u, arrays['grid_u'])
+    v = _grid_axis(v, arrays['grid_v'])
+    shape = (len(u), len(v)) + coefficients.shape[1:]
+
+    if isinstance(out, (str, os.PathLike)):
+        path = os.fspath(out)
+        if state is None:
+            state = path + '.tiles'
+        opened = resume and os.path.exists(path)
+        out = np.lib.format.open_memmap(path, mode='r+' if opened else 'w+', dtype=np.float64, shape=shape)
+    elif state is None and getattr(out, 'filename', None) is not None:
+        state = os.fspath(out.filename) + '.tiles'
+    if out.shape != shape:
+        raise ValueError('Expected an output array of shape {}, got {}'.format(shape, out.shape))
+
+    tiles = grid_tiles(shape[:2], tile_shape)
+    done = set()
+    log = None
+    if state is not None:
+        header = _state_header(shape, tile_shape, u, v, coefficients)
+        if resume and os.path.exists(state):
+            found, done = _read_state(state)
+            if found != header:
+                raise ValueError('The state file {} was written for a different output shape, tiling, grid or '
+                                 'coefficients'.format(state))
+            log = open(state, 'a')
+        else:
+            log = open(state, 'w')
+            log.write(header + '\n')
+            log.flush()
+    lock = threading.Lock()
+    flush = getattr(out, 'flush', None)
+
+    def task(t):
+        i0, i1, j0, j1 = tiles[t]
+        out[i0:i1, j0:j1] = evaluate_grid_tile(arrays, u[i0:i1], v[j0:j1], coefficients)
+        with lock:
+            if flush is not None:
+                flush()
+            if log is not None:
+                log.write('{}\n'.format(t))
+                log.flush()
+
+    remaining = [t for t in range(len(tiles)) if t not in done]
+    try:
+        if progress is not None:
+            progress(len(tiles) - len(remaining), len(tiles))
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            futures = [pool.submit(task, t) for t in remaining]
+            try:
+                for count, future in enumerate(as_completed(futures)):
+                    future.result()
+                    if progress is not None:
+                        progress(len(tiles) - len(remaining) + count + 1, len(tiles))
+            except BaseException:
+                # leave the pending tiles to a resumed call
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        if log is not None:
+            log.close()
+
+    if state is not None:
+        os.remove(state)
+    return out
@@ -1,57 +1,163 @@
+"""
+Plotting utilities. This module is the only part of the package that depends on matplotlib, and is imported
+lazily by LRSpline.visualize_mesh. Pyplot is only imported when a figure is to be shown interactively.
+"""
 import matplotlib.patches as plp
-import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
 
-from LRSplines import init_tensor_product_LR_spline, Meshline, np
+from LRSplines.b_spline import _evaluate_univariate_b_spline
 
 
-def plot_basis_function(LR, basis_function):
-    N = 30
-    fig = plt.figure()
+def _new_figure(show: bool) -> Figure:
+    """
+    Creates a figure. If the figure is not to be shown, it is attached directly to an Agg canvas, so that no
+    pyplot state or interactive backend is involved (headless batch rendering).
+
+    :param show: whether the figure is going to be shown interactively
+    :return: matplotlib figure
+    """
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.figure()
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _finish_figure(fig: Figure, filename=None, dpi=None, show=True) -> Figure:
+    """
+    Saves the figure to `filename` (if given) and shows it (if requested).
+
+    :param fig: figure to finish
+    :param filename: optional output file, the format is deduced from the extension
+    :param dpi: resolution used for raster output
+    :param show: whether to show the figure
+    :return: the figure
+    """
+    if filename:
+        fig.savefig(filename, dpi=dpi)
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return fig
+
+
+def _meshline_segments(meshlines) -> np.ndarray:
+    """
+    Returns the meshlines as an array of line segments of shape (len(meshlines), 2, 2), suitable for a LineCollection.
+
+    :param meshlines: list of meshlines
+    :return: np.ndarray
+    """
+    lines = np.array([(m.start, m.stop, m.constant_value, m.axis) for m in meshlines], dtype=np.float64).reshape(-1, 4)
+    start, stop, constant_value, axis = lines.T
+    vertical = axis == 0
+
+    segments = np.empty((len(lines), 2, 2))
+    segments[:, 0, 0] = np.where(vertical, constant_value, start)
+    segments[:, 0, 1] = np.where(vertical, start, constant_value)
+    segments[:, 1, 0] = np.where(vertical, constant_value, stop)
+    segments[:, 1, 1] = np.where(vertical, stop, constant_value)
+    return segments
+
+
+def _element_polygons(elements) -> np.ndarray:
+    """
+    Returns the elements as an array of rectangles of shape (len(elements), 4, 2), suitable for a PolyCollection.
+
+    :param elements: list of elements
+    :return: np.ndarray
+    """
+    bounds = np.array([(e.u_min, e.v_min, e.u_max, e.v_max) for e in elements], dtype=np.float64).reshape(-1, 4)
+    return bounds[:, [[0, 1], [2, 1], [2, 3], [0, 3]]]
+
+
+def plot_mesh(LR, multiplicity=True, overloading=True, text=True, filename=None, color=False, title=True,
+              axes=False, show=True, label_threshold=400, dpi=None) -> Figure:
+    """
+    Plots the LR-mesh of the given LR-spline. See LRSpline.visualize_mesh.
+    """
+    fig = _new_figure(show)
+    axs = fig.add_subplot(1, 1, 1)
+
+    # rasterize the collections of large meshes, so vector output stays small.
+    rasterized = label_threshold is not None and len(LR.M) > label_threshold
+
+    axs.add_collection(LineCollection(_meshline_segments(LR.meshlines), colors='black', linewidths=0.5,
+                                      rasterized=rasterized))
+    if multiplicity and (label_threshold is None or len(LR.meshlines) <= label_threshold):
+        for m in LR.meshlines:
+            axs.text(m.midpoint[0], m.midpoint[1], '{}'.format(m.multiplicity),
+                     bbox=dict(facecolor='white', alpha=1), ha='center', va='center')
+
+    if overloading:
+        overloaded = np.array([e.is_overloaded() for e in LR.M], dtype=bool)
+        face_colors = np.where(overloaded, 'red' if color else 'black', 'green' if color else 'white')
+        axs.add_collection(PolyCollection(_element_polygons(LR.M), facecolors=face_colors,
+                                          edgecolors='none', alpha=0.2, rasterized=rasterized))
+        if text and (label_threshold is None or len(LR.M) <= label_threshold):
+            for m in LR.M:
+                axs.text(m.midpoint[0], m.midpoint[1], '{}'.format(len(m.supported_b_splines)), ha='center',
+                         va='center')
+    axs.autoscale_view()
+
+    if title:
+        axs.set_title('dim(S) = {}'.format(len(LR.S)))
+
+    if not axes:
+        axs.axis('off')
+
+    return _finish_figure(fig, filename, dpi, show)
+
+
+def plot_basis_function(LR, basis_function, N=30, show=True, filename=None, dpi=None):
+    fig = _new_figure(show)
     axs = fig.add_subplot(1, 1, 1, projection='3d')
 
     x = np.linspace(LR.u_range[0], LR.u_range[1], N)
     y = np.linspace(LR.v_range[0], LR.v_range[1], N)
-    z = np.zeros((N, N))
 
     X, Y = np.meshgrid(x, y)
 
-    for i in range(N):
-        for j in range(N):
-            z[i, j] = basis_function(x[i], y[j])
+    # the basis function is a tensor product, so only 2N univariate evaluations are needed for the N x N grid.
+    b = basis_function
+    bu = np.array([_evaluate_univariate_b_spline(s, b.knots_u, b.degree_u, b.end_u) for s in x], dtype=np.float64)
+    bv = np.array([_evaluate_univariate_b_spline(t, b.knots_v, b.degree_v, b.end_v) for t in y], dtype=np.float64)
+    z = b.weight * np.outer(bv, bu)
+
     axs.set_zlim3d(0, 1)
     axs.plot_surface(X, Y, z)
-    plt.show()
+    return _finish_figure(fig, filename, dpi, show)
 
 
-def plot_basis_support(LR, basis_function, axis=False, hatch='//'):
-    fig = plt.figure()
+def plot_basis_support(LR, basis_function, axis=False, hatch='//', show=True, filename=None, dpi=None):
+    fig = _new_figure(show)
     axs = fig.add_subplot(1, 1, 1)
-    for meshline in LR.meshlines:
-        x = meshline.start, meshline.stop
-        y = meshline.constant_value, meshline.constant_value
-
-        if meshline.axis == 0:
-            axs.plot(y, x, c='black')
-        else:
-            axs.plot(x, y, c='black')
-
-        xy = basis_function.knots_u[0], basis_function.knots_v[0]
-        w = basis_function.knots_u[-1] - basis_function.knots_u[0]
-        h = basis_function.knots_v[-1] - basis_function.knots_v[0]
-
-        if basis_function.end_v or basis_function.end_u:
-            c = 'red'
-        else:
-            c = 'green'
-        basis_patch = plp.Rectangle(xy, w, h, hatch=hatch, fill=True, linewidth=0.2, color=c)
-
-        axs.add_patch(basis_patch)
+    axs.add_collection(LineCollection(_meshline_segments(LR.meshlines), colors='black'))
+
+    xy = basis_function.knots_u[0], basis_function.knots_v[0]
+    w = basis_function.knots_u[-1] - basis_function.knots_u[0]
+    h = basis_function.knots_v[-1] - basis_function.knots_v[0]
+
+    if basis_function.end_v or basis_function.end_u:
+        c = 'red'
+    else:
+        c = 'green'
+    basis_patch = plp.Rectangle(xy, w, h, hatch=hatch, fill=True, linewidth=0.2, color=c)
+
+    axs.add_patch(basis_patch)
+    axs.autoscale_view()
     if not axis:
-        plt.axis('off')
-    plt.show()
+        axs.axis('off')
+    return _finish_figure(fig, filename, dpi, show)
 
 
 if __name__ == '__main__':
+    from LRSplines import init_tensor_product_LR_spline, Meshline
+
     LR = init_tensor_product_LR_spline(2, 2, [0, 0, 0, 1, 2, 3, 3, 3], [0, 0, 0, 1, 2, 3, 3, 3])
     m1 = Meshline(start=0, stop=2, constant_value=1.5, axis=0)
     m2 = Meshline(start=1, stop=3, constant_value=1.5, axis=1)
@@ -0,0 +1,396 @@
+"""
+Benchmark suite for LRSplines.
+
+Every benchmark is a function of a problem size `n`, which does its setup and returns the callable to be timed.
+The callable is timed `repeat` times, each time on a fresh setup, and the best and median wall clock times are
+recorded. For every benchmark a scaling exponent is fitted to the (size, best time) curve in log-log scale, which
+makes it easy to verify complexity claims (an exponent of 1 is linear scaling).
+
+Usage:
+
+    python profiling/benchmarks.py [--quick] [--filter SUBSTRING] [--output results.json]
+                                   [--compare baseline.json] [--tolerance 0.25] [--plot curves.png]
+
+With `--compare`, the run exits with status 1 if any benchmark is slower than the baseline by more than the
+given relative tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from LRSplines import init_tensor_product_LR_spline, Meshline
+from LRSplines.b_spline import _evaluate_univariate_b_spline
+from LRSplines.lr_spline import init_lr_spline_from_arrays
+from LRSplines.storage import load_lr_spline, save_lr_spline
+
+BENCHMARKS = []
+
+
+def benchmark(sizes, quick_sizes=None, repeat=3):
+    """
+    Registers a benchmark, run for each of the given problem sizes.
+
+    :param sizes: problem sizes for a full run
+    :param quick_sizes: problem sizes for a quick run, defaults to the two smallest sizes
+    :param repeat: number of timed repetitions per size
+    """
+
+    def decorator(f):
+        BENCHMARKS.append({
+            'name': f.__name__.replace('bench_', '', 1),
+            'function': f,
+            'sizes': list(sizes),
+            'quick_sizes': list(quick_sizes or sizes[:2]),
+            'repeat': repeat,
+        })
+        return f
+
+    return decorator
+
+
+def _open_knots(n, d):
+    """
+    Open knot vector on [0, n] with n uniform knot intervals and degree d.
+    """
+    return [0] * (d + 1) + list(range(1, n)) + [n] * (d + 1)
+
+
+def _tensor_product(n, d=2):
+    k = _open_knots(n, d)
+    return init_tensor_product_LR_spline(d, d, k, k)
+
+
+def _points(n, N):
+    rng = np.random.RandomState(0)
+    return rng.uniform(0, n, N), rng.uniform(0, n, N)
+
+
+def _corner_error(e):
+    # a refinement indicator concentrated towards the origin, so that refinement is local
+    return e.area / (1 + e.midpoint[0] ** 2 + e.midpoint[1] ** 2)
+
+
+@benchmark(sizes=[4, 8, 12, 16], quick_sizes=[4, 8])
+def bench_init_tensor_product(n):
+    """Biquadratic tensor product initialization, n knot intervals per direction."""
+    k = _open_knots(n, 2)
+    return lambda: init_tensor_product_LR_spline(2, 2, k, k)
+
+
+@benchmark(sizes=[4, 8, 12, 16], quick_sizes=[4, 8])
+def bench_insert_line(n):
+    """A single full-span vertical meshline inserted into an n x n biquadratic mesh."""
+    LR = _tensor_product(n)
+    m = Meshline(start=0, stop=n, constant_value=n / 2 + 0.5, axis=0)
+    return lambda: LR.insert_line(m)
+
+
+@benchmark(sizes=[4, 6, 8, 10], quick_sizes=[4, 6])
+def bench_refine_minimal(n):
+    """Refinement by 10% of dim(S) with minimal span meshlines, starting from an n x n biquadratic mesh."""
+    LR = _tensor_product(n)
+    return lambda: LR.refine(0.1, _corner_error, refinement_strategy='minimal')
+
+
+@benchmark(sizes=[4, 6, 8, 10], quick_sizes=[4, 6])
+def bench_refine_full(n):
+    """Refinement by 10% of dim(S) with full span meshlines, starting from an n x n biquadratic mesh."""
+    LR = _tensor_product(n)
+    return lambda: LR.refine(0.1, _corner_error, refinement_strategy='full')
+
+
+@benchmark(sizes=[250, 500, 1000, 2000], quick_sizes=[250, 500])
+def bench_evaluate_scalar(N):
+    """N random points evaluated one at a time on an 8 x 8 biquadratic mesh."""
+    LR = _tensor_product(8)
+    u, v = _points(8, N)
+
+    def run():
+        for x, y in zip(u, v):
+            LR(x, y)
+
+    return run
+
+
+@benchmark(sizes=[250, 500, 1000, 2000], quick_sizes=[250, 500])
+def bench_evaluate_batch(N):
+    """N random points evaluated as a batch on an 8 x 8 biquadratic mesh."""
+    LR = _tensor_product(8)
+    u, v = _points(8, N)
+    return lambda: LR.evaluate(u, v)
+
+
+@benchmark(sizes=[10000, 100000, 1000000], quick_sizes=[10000, 100000])
+def bench_evaluate_parallel(N):
+    """N random points evaluated by a pool of 4 threads on an 8 x 8 biquadratic mesh."""
+    LR = _tensor_product(8)
+    u, v = _points(8, N)
+    return lambda: LR.evaluate_parallel(u, v, workers=4)
+
+
+def _shuffled_tensor_product(n):
+    # element and basis order scrambled, as after heavy local refinement
+    LR = _tensor_product(n)
+    rng = np.random.RandomState(0)
+    rng.shuffle(LR.M)
+    rng.shuffle(LR.S)
+    LR._arrays = None
+    return LR
+
+
+@benchmark(sizes=[16, 32, 48], quick_sizes=[16, 32])
+def bench_evaluate_shuffled(n):
+    """100000 random points evaluated on an n x n biquadratic mesh stored in scrambled order."""
+    LR = _shuffled_tensor_product(n)
+    LR._evaluation_arrays()
+    u, v = _points(n, 100000)
+    return lambda: LR.evaluate(u, v)
+
+
+@benchmark(sizes=[16, 32, 48], quick_sizes=[16, 32])
+def bench_evaluate_morton(n):
+    """100000 random points in random order, on an n x n biquadratic mesh reordered along a Morton curve."""
+    LR = _shuffled_tensor_product(n)
+    LR.morton_order()
+    LR._evaluation_arrays()
+    u, v = _points(n, 100000)
+    return lambda: LR.evaluate(u, v)
+
+
+@benchmark(sizes=[16, 32, 48], quick_sizes=[16, 32])
+def bench_evaluate_sorted(n):
+    """100000 random points sorted by element, on an n x n biquadratic mesh stored in scrambled order."""
+    LR = _shuffled_tensor_product(n)
+    LR._evaluation_arrays()
+    u, v = _points(n, 100000)
+    return lambda: LR.evaluate(u, v, sort_points=True)
+
+
+@benchmark(sizes=[16, 32, 48], quick_sizes=[16, 32])
+def bench_evaluate_morton_sorted(n):
+    """100000 random points sorted by element, on an n x n biquadratic mesh reordered along a Morton curve."""
+    LR = _shuffled_tensor_product(n)
+    LR.morton_order()
+    LR._evaluation_arrays()
+    u, v = _points(n, 100000)
+    return lambda: LR.evaluate(u, v, sort_points=True)
+
+
+def _tensor_product_arrays(n, d=2):
+    """
+    The arrays of init_lr_spline_from_arrays for an n x n tensor product mesh of degree d, with elements and basis
+    functions in scrambled order. Unlike init_tensor_product_LR_spline, this takes linear time.
+    """
+    rng = np.random.RandomState(0)
+    knots = np.array(_open_knots(n, d), dtype=np.float64)
+    k = n + d
+    i, j = np.divmod(np.arange(k * k), k)
+    a, b = np.divmod(np.arange(n * n), n)
+    # element (a, b) supports the functions (a + s, b + t) for 0 <= s, t <= d
+    s, t = np.divmod(np.arange((d + 1) ** 2), d + 1)
+    supported = (a[:, None] + s) * k + b[:, None] + t
+
+    elements, functions = rng.permutation(n * n), rng.permutation(k * k)
+    position = np.argsort(functions)
+    lines = np.arange(n + 1, dtype=np.float64)
+    segments = np.column_stack((np.tile(lines[:-1], n + 1), np.tile(lines[1:], n + 1), np.repeat(lines, n)))
+    multiplicities = np.where((segments[:, 2] == 0) | (segments[:, 2] == n), d + 1, 1)
+    return {
+        'knots_u': knots[i[functions, None] + np.arange(d + 2)],
+        'knots_v': knots[j[functions, None] + np.arange(d + 2)],
+        'weights': np.ones(k * k),
+        'coefficients': rng.uniform(-1, 1, k * k),
+        'end_u': knots[i[functions] + d + 1] == n,
+        'end_v': knots[j[functions] + d + 1] == n,
+        'north': j[functions] == k - 1,
+        'south': j[functions] == 0,
+        'east': i[functions] == k - 1,
+        'west': i[functions] == 0,
+        'element_bounds': np.column_stack((a, b, a + 1, b + 1))[elements].astype(np.float64),
+        'element_indptr': np.arange(n * n + 1) * (d + 1) ** 2,
+        'element_indices': position[supported[elements]].ravel(),
+        'meshlines': np.vstack((np.column_stack((segments, np.zeros(len(segments)))),
+                                np.column_stack((segments, np.ones(len(segments)))))),
+        'multiplicities': np.tile(multiplicities, 2),
+        'global_knots_u': lines,
+        'global_knots_v': lines,
+        'u_range': np.array([0, n], dtype=np.float64),
+        'v_range': np.array([0, n], dtype=np.float64),
+    }
+
+
+def _saved_model(n):
+    """
+    Path of an n x n biquadratic tensor product model stored in scrambled order, saved on first use.
+    """
+    path = os.path.join(tempfile.gettempdir(), 'LRSplines-benchmarks', 'tensor-product-{}'.format(n))
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        save_lr_spline(init_lr_spline_from_arrays(_tensor_product_arrays(n)), path)
+    return path
+
+
+@benchmark(sizes=[100, 316], quick_sizes=[100], repeat=2)
+def bench_evaluate_saved_shuffled(n):
+    """1000000 random points evaluated on a saved n x n biquadratic model (about 10^5 elements for n = 316),
+    stored in scrambled order."""
+    LR = load_lr_spline(_saved_model(n))
+    LR._evaluation_arrays()
+    u, v = _points(n, 1000000)
+    return lambda: LR.evaluate(u, v)
+
+
+@benchmark(sizes=[100, 316], quick_sizes=[100], repeat=2)
+def bench_evaluate_saved_morton_sorted(n):
+    """1000000 random points sorted by element, on a saved n x n biquadratic model (about 10^5 elements for
+    n = 316), reordered along a Morton curve."""
+    LR = load_lr_spline(_saved_model(n))
+    LR.morton_order()
+    LR._evaluation_arrays()
+    u, v = _points(n, 1000000)
+    return lambda: LR.evaluate(u, v, sort_points=True)
+
+
+@benchmark(sizes=[1000, 10000, 100000], quick_sizes=[1000, 10000])
+def bench_memoize_hit(N):
+    """N repeated univariate evaluations served from the memoize cache."""
+    knots = np.array([0, 1, 2, 3], dtype=np.float64)
+    _evaluate_univariate_b_spline(1.5, knots, 2)
+
+    def run():
+        for _ in range(N):
+            _evaluate_univariate_b_spline(1.5, knots, 2)
+
+    return run
+
+
+def _fit_exponent(sizes, times):
+    """
+    Least squares slope of log(time) against log(size).
+    """
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(times), 1)[0])
+
+
+def run_benchmarks(quick=False, name_filter=None, stream=sys.stdout) -> dict:
+    """
+    Runs the registered benchmarks.
+
+    :param quick: use the reduced set of problem sizes
+    :param name_filter: only run benchmarks whose name contains this substring
+    :param stream: where to write progress, None for silence
+    :return: machine readable results
+    """
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'timestamp': time.time(),
+        'benchmarks': {},
+    }
+    for bench in BENCHMARKS:
+        if name_filter and name_filter not in bench['name']:
+            continue
+        sizes = bench['quick_sizes'] if quick else bench['sizes']
+        runs = []
+        for n in sizes:
+            times = []
+            for _ in range(bench['repeat']):
+                f = bench['function'](n)
+                t0 = time.perf_counter()
+                f()
+                times.append(time.perf_counter() - t0)
+            runs.append({'size': n, 'best': min(times), 'median': float(np.median(times)), 'times': times})
+            if stream is not None:
+                stream.write('{:<24} n={:<8} best={:.6f}s\n'.format(bench['name'], n, min(times)))
+        results['benchmarks'][bench['name']] = {
+            'runs': runs,
+            'exponent': _fit_exponent([r['size'] for r in runs], [r['best'] for r in runs]),
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance=0.25) -> list:
+    """
+    Compares the best times of `results` against a `baseline` result set.
+
+    :param results: results of the current run
+    :param baseline: results of a previous run
+    :param tolerance: relative slowdown tolerated before reporting a regression
+    :return: list of regressions as (name, size, ratio)
+    """
+    regressions = []
+    for name, bench in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+        previous = {r['size']: r['best'] for r in baseline['benchmarks'][name]['runs']}
+        for run in bench['runs']:
+            if run['size'] in previous:
+                ratio = run['best'] / previous[run['size']]
+                if ratio > 1 + tolerance:
+                    regressions.append((name, run['size'], ratio))
+    return regressions
+
+
+def plot_curves(results: dict, filename: str) -> None:
+    """
+    Writes the scaling curves of all benchmarks to `filename`, in log-log scale.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    axs = fig.add_subplot(1, 1, 1)
+    for name, bench in results['benchmarks'].items():
+        sizes = [r['size'] for r in bench['runs']]
+        best = [r['best'] for r in bench['runs']]
+        exponent = bench['exponent']
+        label = name if exponent is None else '{} (~n^{:.2f})'.format(name, exponent)
+        axs.loglog(sizes, best, marker='o', label=label)
+    axs.set_xlabel('problem size')
+    axs.set_ylabel('seconds')
+    axs.legend(fontsize='small')
+    fig.savefig(filename)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='run the reduced set of problem sizes')
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this substring')
+    parser.add_argument('--output', default=None, help='write results as JSON to this file')
+    parser.add_argument('--compare', default=None, help='baseline JSON file to check for regressions')
+    parser.add_argument('--tolerance', default=0.25, type=float, help='relative slowdown tolerated by --compare')
+    parser.add_argument('--plot', default=None, help='write log-log scaling curves to this image file')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick, name_filter=args.filter)
+
+    for name, bench in results['benchmarks'].items():
+        if bench['exponent'] is not None:
+            print('{:<24} scaling exponent {:.2f}'.format(name, bench['exponent']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.plot:
+        plot_curves(results, args.plot)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, size, ratio in regressions:
+            print('REGRESSION {} n={}: {:.2f}x slower than baseline'.format(name, size, ratio))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Measures the time it takes to `import LRSplines` in a fresh interpreter, and lists the top level packages the
+import pulls in. Fails if a plotting (or other optional) package is loaded as a side effect of the import.
+
+Usage: python profiling/import_time.py [repeats]
+"""
+import json
+import os
+import subprocess
+import sys
+
+FORBIDDEN = ('matplotlib', 'mpl_toolkits', 'scipy')
+
+_SCRIPT = """
+import json, sys, time
+before = set(sys.modules)
+t0 = time.perf_counter()
+import LRSplines
+elapsed = time.perf_counter() - t0
+loaded = sorted({name.split('.')[0] for name in set(sys.modules) - before if not name.startswith('_')})
+print(json.dumps({'seconds': elapsed, 'packages': loaded}))
+"""
+
+
+def measure_import(repeats=5) -> dict:
+    """
+    Imports LRSplines `repeats` times, each in a fresh interpreter.
+
+    :param repeats: number of fresh interpreters to measure
+    :return: dictionary with the best and median import time, and the packages loaded by the import
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.check_output([sys.executable, '-c', _SCRIPT], env=env, cwd=root)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    times = sorted(run['seconds'] for run in runs)
+    packages = runs[-1]['packages']
+    return {
+        'best': times[0],
+        'median': times[len(times) // 2],
+        'packages': packages,
+        'forbidden': [p for p in packages if p in FORBIDDEN],
+    }
+
+
+if __name__ == '__main__':
+    result = measure_import(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    print(json.dumps(result, indent=2))
+    if result['forbidden']:
+        sys.exit('import LRSplines loaded optional packages: {}'.format(', '.join(result['forbidden'])))
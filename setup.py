@@ -8,5 +8,6 @@ setup(
     license='',
     author='Ivar Stangeby',
     author_email='istangeby@gmail.com',
-    description='', install_requires=['numpy', 'pytest', 'matplotlib']
+    description='', install_requires=['numpy', 'pytest'],
+    extras_require={'plotting': ['matplotlib'], 'sparse': ['scipy']}
 )
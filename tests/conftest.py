@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from LRSplines.lr_spline import init_tensor_product_LR_spline
+
+
+def _refine(LR, lines=12, seed=42):
+    np.random.seed(seed)
+    for k in range(lines):
+        LR.insert_line(LR.get_minimal_span_meshline(np.random.choice(LR.M), axis=k % 2))
+
+
+@pytest.fixture
+def refine():
+    """
+    Returns the refinement of `refined_biquadratic`, to refine a given LR-spline in place.
+    """
+    return _refine
+
+
+@pytest.fixture
+def refined_biquadratic():
+    """
+    Returns a factory of refined biquadratic LR-splines on [0, 6] x [0, 6], with knots [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+    in both directions. The given number of minimal span meshlines are inserted in random elements, alternating
+    between the axes, after seeding the random number generator. If a coefficient range is given, the coefficients are
+    drawn uniformly from it after the refinement.
+    """
+    def factory(seed=42, lines=12, coefficients=None):
+        ku = [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+        LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+        _refine(LR, lines, seed)
+        if coefficients is not None:
+            LR.coefficients = np.random.uniform(*coefficients, len(LR.S))
+        return LR
+
+    return factory
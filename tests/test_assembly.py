@@ -0,0 +1,87 @@
+import numpy as np
+
+from LRSplines.assembly import AssemblyCache, load_vector, mass_matrix, stiffness_matrix
+from LRSplines.meshline import Meshline
+
+
+def test_local_matrices(refined_biquadratic, refine):
+    LR = refined_biquadratic(lines=0)
+    refine(LR, lines=10, seed=3)
+    cache = AssemblyCache(LR, mass_matrix, load_vector(lambda u, v: np.ones_like(u)))
+    M = cache.matrix(dense=True).toarray()
+
+    # the basis is a partition of unity on [0, 6] x [0, 6]
+    np.testing.assert_allclose(M, M.T, atol=1.0e-14)
+    np.testing.assert_allclose(M.sum(), 36)
+    np.testing.assert_allclose(M.sum(axis=1), cache.vector(dense=True))
+
+    # gradients of a partition of unity sum to zero
+    K = AssemblyCache(LR, stiffness_matrix).matrix(dense=True).toarray()
+    np.testing.assert_allclose(K.sum(axis=1), 0, atol=1.0e-12)
+    assert np.all(np.linalg.eigvalsh(K) > -1.0e-12)
+
+
+def test_incremental_assembly_matches_full_assembly(refined_biquadratic, refine):
+    LR = refined_biquadratic(lines=0)
+    f = load_vector(lambda u, v: np.sin(u) * v)
+    cache = AssemblyCache(LR, stiffness_matrix, f)
+    cache.matrix()
+    assert cache.elements_recomputed == len(LR.M)
+
+    for seed in range(3):
+        refine(LR, lines=4, seed=seed)
+        full = AssemblyCache(LR, stiffness_matrix, f)
+        for dense in (False, True):
+            np.testing.assert_allclose(cache.matrix(dense).toarray(), full.matrix(dense).toarray(), atol=1.0e-13)
+            np.testing.assert_allclose(cache.vector(dense), full.vector(dense), atol=1.0e-13)
+        full.close()
+    assert cache.matrix().shape == (LR.id_capacity, LR.id_capacity)
+
+
+def test_incremental_assembly_is_local(refined_biquadratic):
+    LR = refined_biquadratic(lines=0)
+    cache = AssemblyCache(LR, mass_matrix)
+    cache.matrix()
+
+    before = len(LR.M)
+    LR.insert_line(Meshline(0, 2, constant_value=0.5, axis=0))
+    dirty = cache.dirty_elements
+    assert 0 < len(dirty) < len(LR.M)
+    assert set(range(before, len(LR.M))) <= set(dirty)
+    assert cache.update() == len(dirty)
+
+    # an insertion that changes nothing leaves the cache clean
+    LR.insert_line(Meshline(0, 2, constant_value=0.5, axis=0))
+    assert cache.dirty_elements == []
+
+    cache.close()
+    LR.insert_line(Meshline(0, 2, constant_value=0.5, axis=1))
+    assert cache.dirty_elements == []
+
+
+def test_overlap_pattern(refined_biquadratic, refine):
+    LR = refined_biquadratic(lines=0)
+    refine(LR, lines=4, seed=3)
+    indptr, indices = LR.overlap_pattern()
+    assert indptr.shape == (len(LR.S) + 1, )
+
+    expected = AssemblyCache(LR, mass_matrix).matrix(dense=True).toarray() != 0
+    pattern = np.zeros_like(expected)
+    pattern[np.repeat(np.arange(len(LR.S)), np.diff(indptr)), indices] = True
+    np.testing.assert_array_equal(pattern, expected)
+
+
+def test_overlap_pattern_incremental_update(refined_biquadratic, refine):
+    LR = refined_biquadratic(lines=0)
+    LR.overlap_pattern()
+    refine(LR, lines=8, seed=3)
+    LR.morton_order()
+    indptr, indices = LR.overlap_pattern()
+
+    fresh = refined_biquadratic(lines=0)
+    refine(fresh, lines=8, seed=3)
+    fresh.morton_order()
+    fresh_indptr, fresh_indices = fresh.overlap_pattern()
+    np.testing.assert_array_equal(indptr, fresh_indptr)
+    np.testing.assert_array_equal(indices, fresh_indices)
+    assert all(np.all(np.diff(indices[a:b]) > 0) for a, b in zip(indptr[:-1], indptr[1:]))
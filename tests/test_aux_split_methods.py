@@ -20,3 +20,21 @@ def test_aux_split_methods():
     assert (b2.weight - 1 / 3) < eps
     assert np.allclose(b1.knots_u, [0, 1, 2, 3])
     assert np.allclose(b2.knots_u, [1, 2, 3, 4])
+
+
+def test_split_transfers_coefficient_and_end_flags():
+    B = BSpline(2, 2, [1, 2, 3, 3], [0, 1, 2, 3], end_u=True)
+    B.coefficient = np.array([1.0, 2.0])
+
+    m = Meshline(0, 3, constant_value=2.5, axis=0)
+    b1, b2 = split_single_basis_function(m, B)
+
+    assert np.allclose(b1.knots_u, [1, 2, 2.5, 3]) and np.allclose(b2.knots_u, [2, 2.5, 3, 3])
+    assert b1.end_u and b2.end_u
+    assert np.allclose(b1.coefficient, [1, 2]) and np.allclose(b2.coefficient, [1, 2])
+    assert b1.coefficient is not B.coefficient
+
+    B = BSpline(2, 2, [0, 1, 2, 3], [0, 1, 2, 3], end_u=True)
+    m = Meshline(0, 3, constant_value=1.5, axis=0)
+    b1, b2 = split_single_basis_function(m, B)
+    assert not b1.end_u and b2.end_u
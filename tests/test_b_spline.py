@@ -2,7 +2,8 @@ import numpy as np
 import pytest
 
 from LRSplines import init_tensor_product_LR_spline
-from LRSplines.b_spline import BSpline, _evaluate_univariate_b_spline, _find_knot_interval
+from LRSplines.b_spline import BSpline, _evaluate_univariate_b_spline, _evaluate_univariate_b_spline_derivatives, \
+    _evaluate_univariate_b_splines, _find_knot_interval, _integrate_univariate_b_splines
 from LRSplines.element import Element
 
 
@@ -154,6 +155,29 @@ def test_endpoint_find_index():
     assert _find_knot_interval(x, k, endpoint=True) == 5
 
 
+@pytest.mark.parametrize('endpoint', [False, True])
+def test_find_knot_interval_semantics(endpoint):
+    k = np.array([0, 0, 0, 1, 2, 2, 3, 4, 4])
+    x = [-1, 0, 0.5, 1, 1.5, 2, 2.5, 3.5, 4, 5]
+    expected = [-1, 2, 2, 3, 3, 5, 5, 6, 7 if endpoint else -1, -1]
+
+    assert [_find_knot_interval(X, k, endpoint=endpoint) for X in x] == expected
+    assert all(isinstance(_find_knot_interval(X, k, endpoint=endpoint), int) for X in x)
+
+    computed = _find_knot_interval(np.array(x), k, endpoint=endpoint)
+    np.testing.assert_array_equal(computed, expected)
+    assert _find_knot_interval(np.array(x).reshape(2, 5), k, endpoint=endpoint).shape == (2, 5)
+
+
+def test_find_knot_interval_endpoint_last_interval():
+    # with endpoint, the whole last non-empty interval is assigned to index len(knots) - 2
+    k = np.array([0, 1, 2, 3])
+    assert _find_knot_interval(2.5, k, endpoint=True) == 2
+    assert _find_knot_interval(3, k, endpoint=True) == 2
+    assert _find_knot_interval(1.5, k, endpoint=True) == 1
+    assert _find_knot_interval(3, k, endpoint=False) == -1
+
+
 def test_cached_univariate():
     B = BSpline(2, 2, [0.75, 0.875, 1, 1], [0, 1, 1, 1], end_v=True)
 
@@ -247,3 +271,87 @@ def test_bivariate_derivative_gradient():
     expected_gradient = [d_exact(X, Y) for X in x for Y in y]
 
     np.testing.assert_allclose(computed_gradient, expected_gradient)
+
+
+@pytest.mark.parametrize('d', [0, 1, 2, 3])
+def test_evaluate_univariate_b_splines_matches_scalar(d):
+    rng = np.random.RandomState(d)
+    for _ in range(20):
+        k = np.sort(rng.choice([0, 0.5, 1, 2, 3, 3.5, 4], d + 2))
+        if k[0] == k[-1]:
+            continue
+        x = np.concatenate([np.linspace(k[0] - 0.5, k[-1] + 0.5, 17), k])
+        for endpoint in [False, True]:
+            for r in range(d + 1):
+                if endpoint and r > 0 and k[-2] == k[-1]:
+                    # the batch kernel returns the derivative from the left at a repeated end knot
+                    continue
+                expected = [_evaluate_univariate_b_spline(X, k, d, endpoint=endpoint, r=r) for X in x]
+                computed = _evaluate_univariate_b_splines(x, np.tile(k, (len(x), 1)), d, endpoint, r)
+                np.testing.assert_allclose(computed, expected, atol=1.0e-14)
+
+
+def test_evaluate_univariate_b_splines_rows():
+    x = np.array([0.5, 1.0, 1.0])
+    knots = np.array([[0, 1, 2], [0, 1, 1], [0, 1, 1]])
+    endpoint = np.array([False, False, True])
+
+    np.testing.assert_allclose(_evaluate_univariate_b_splines(x, knots, 1, endpoint), [0.5, 0, 1])
+    np.testing.assert_allclose(_evaluate_univariate_b_splines(x, knots, 1, endpoint, r=1), [1, 0, 1])
+
+
+@pytest.mark.parametrize('d', [0, 1, 2, 3])
+def test_evaluate_univariate_b_spline_derivatives(d):
+    rng = np.random.RandomState(d)
+    x = rng.uniform(-0.5, 4.5, 50)
+    knots = np.sort(rng.choice([0, 0.5, 1, 2, 3, 3.5, 4], (50, d + 2)), axis=1)
+    endpoint = rng.uniform(size=50) < 0.5
+
+    computed = _evaluate_univariate_b_spline_derivatives(x, knots, d, endpoint, order=d + 1)
+    assert computed.shape == (d + 2, 50)
+    for r in range(d + 2):
+        np.testing.assert_allclose(computed[r], _evaluate_univariate_b_splines(x, knots, d, endpoint, r))
+
+
+@pytest.mark.parametrize('d', [0, 1, 2, 3])
+def test_integrate_univariate_b_splines(d):
+    rng = np.random.RandomState(d)
+    knots = np.sort(rng.choice([0, 0.5, 1, 2, 3, 3.5, 4], (20, d + 2)), axis=1)
+
+    # midpoint rule on a fine grid
+    x = np.linspace(-1, 5, 60001)
+    x = 0.5 * (x[1:] + x[:-1])
+    values = _evaluate_univariate_b_splines(np.tile(x, len(knots)), np.repeat(knots, len(x), axis=0), d)
+    values = values.reshape(len(knots), len(x)) * 1.0e-4
+
+    for moment in [0, 1]:
+        full = _integrate_univariate_b_splines(knots, d, moment=moment)
+        np.testing.assert_allclose(full, (values * x ** moment).sum(axis=1), atol=1.0e-6)
+        np.testing.assert_allclose(_integrate_univariate_b_splines(knots, d, -1, 5, moment), full, atol=1.0e-13)
+
+        inside = (x > 0.7) & (x < 2.6)
+        np.testing.assert_allclose(_integrate_univariate_b_splines(knots, d, 0.7, 2.6, moment),
+                                   (values * x ** moment)[:, inside].sum(axis=1), atol=1.0e-6)
+
+
+def test_vector_coefficient_update_weights():
+    b1 = BSpline(1, 1, [0, 1, 2], [0, 1, 2], weight=0.5)
+    b2 = BSpline(1, 1, [0, 1, 2], [0, 1, 2], weight=0.25)
+    b1.coefficient = np.array([1.0, 2.0, 3.0])
+    b2.coefficient = np.array([4.0, 5.0, 6.0])
+
+    b1.update_weights(b2)
+
+    assert b1.weight == 0.75
+    np.testing.assert_allclose(b1.coefficient, [2.0, 3.0, 4.0])
+
+
+def test_memoize_cache_hit():
+    _evaluate_univariate_b_spline.cache_clear()
+    k = np.array([0, 1, 2, 3])
+
+    first = _evaluate_univariate_b_spline(1.5, k, 2)
+    second = _evaluate_univariate_b_spline(1.5, [0.0, 1.0, 2.0, 3.0], 2)
+
+    assert first == second
+    assert _evaluate_univariate_b_spline.cache_info().hits == 1
@@ -1,5 +1,7 @@
+import numpy as np
+
 from LRSplines.lr_spline import init_tensor_product_LR_spline
-from LRSplines.element import Element
+from LRSplines.element import Element, connect_elements
 
 
 def test_element_init():
@@ -37,6 +39,25 @@ def test_element_split():
     assert e2.u_min == 0.5 and e2.v_min == 0 and e2.u_max == 1 and e2.v_max == 1
 
 
+def test_element_split_neighbours():
+    elements = [Element(0, 0, 1, 1), Element(1, 0, 2, 1), Element(0, 1, 2, 2)]
+    connect_elements(elements)
+    left, right, top = elements
+
+    assert left.fetch_neighbours(1) == [right] and top.fetch_neighbours(2) == [left, right]
+
+    middle = top.split(0, 1.5)
+    assert top.fetch_neighbours(2) == [left, right] and middle.fetch_neighbours(2) == [right]
+    assert right.fetch_neighbours(3) == [top, middle] and left.fetch_neighbours(3) == [top]
+    assert top.fetch_neighbours(1) == [middle] and middle.fetch_neighbours(0) == [top]
+
+    upper = right.split(1, 0.5)
+    assert right.fetch_neighbours(3) == [upper] and upper.fetch_neighbours(3) == [top, middle]
+    assert top.fetch_neighbours(2) == [left, upper] and middle.fetch_neighbours(2) == [upper]
+    assert left.fetch_neighbours(1) == [right, upper]
+    assert sorted(map(id, right.fetch_neighbours())) == sorted(map(id, [left, upper]))
+
+
 def test_element_invalid():
     e1 = Element(0, 0, 1, 1)
     e2 = e1.split(0, 1)
@@ -91,3 +112,21 @@ def test_element_overloaded():
     e.add_supported_b_spline(LR.S[2])
 
     assert e.is_overloaded()
+
+
+def test_element_evaluate_basis_matrix():
+    LR = init_tensor_product_LR_spline(2, 2, [0, 0, 0, 1, 2, 3, 3, 3], [0, 0, 0, 1, 2, 3, 3, 3])
+    for k in range(6):
+        LR.insert_line(LR.get_minimal_span_meshline(LR.M[k], axis=k % 2))
+
+    for e in LR.M:
+        u = np.append(np.random.uniform(e.u_min, e.u_max, 10), e.u_max)
+        v = np.append(np.random.uniform(e.v_min, e.v_max, 10), e.v_max)
+        values, ids = e.evaluate_basis_matrix(u, v)
+        assert values.shape == (11, len(e.supported_b_splines))
+        np.testing.assert_array_equal(ids, [b.id for b in e.supported_b_splines])
+        np.testing.assert_allclose(values, [e.evaluate_basis(x, y) for x, y in zip(u, v)], atol=1.0e-14)
+
+        derivatives, _ = e.evaluate_basis_matrix(u[:-1], v[:-1], r1=1, r2=1)
+        expected = [[b(x, y, r1=1, r2=1) for b in e.supported_b_splines] for x, y in zip(u[:-1], v[:-1])]
+        np.testing.assert_allclose(derivatives, expected, atol=1.0e-12)
@@ -0,0 +1,82 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from LRSplines.frozen_lr_spline import FrozenLRSpline
+
+
+def test_frozen_lr_spline_matches_lr_spline(refined_biquadratic):
+    LR = refined_biquadratic(coefficients=(-3, 3))
+    frozen = LR.freeze()
+
+    u = np.append(np.random.uniform(0, 6, 100), [0, 6, 6])
+    v = np.append(np.random.uniform(0, 6, 100), [6, 0, 6])
+
+    assert len(frozen) == len(LR.S)
+    assert frozen.degree_u == 2 and frozen.degree_v == 2
+    np.testing.assert_allclose(frozen(u, v), LR.evaluate(u, v), atol=1.0e-14)
+    np.testing.assert_allclose(frozen.evaluate(u, v, r1=1), LR.evaluate(u, v, r1=1), atol=1.0e-13)
+    np.testing.assert_allclose(frozen.evaluate_parallel(u, v, workers=2), LR.evaluate(u, v), atol=1.0e-14)
+
+
+def test_frozen_lr_spline_is_a_snapshot(refined_biquadratic):
+    LR = refined_biquadratic(coefficients=(-3, 3))
+    frozen = LR.freeze()
+    before = frozen(2.5, 3.5)
+
+    LR.coefficients = np.zeros(len(LR.S))
+    LR.insert_line(LR.get_minimal_span_meshline(LR.M[0], axis=0))
+
+    assert frozen(2.5, 3.5) == before
+    with pytest.raises(ValueError):
+        frozen.coefficients[0] = 1
+
+
+def test_frozen_lr_spline_vector_coefficients(refined_biquadratic):
+    LR = refined_biquadratic(coefficients=(-3, 3))
+    LR.coefficients = np.random.uniform(-1, 1, (len(LR.S), 3))
+    frozen = LR.freeze()
+
+    u, v = np.meshgrid(np.linspace(0, 6, 5), np.linspace(0, 6, 4))
+    assert frozen(u, v).shape == (4, 5, 3)
+    np.testing.assert_allclose(frozen(u, v), LR.evaluate(u, v), atol=1.0e-14)
+
+
+def test_frozen_lr_spline_pickle(refined_biquadratic):
+    frozen = refined_biquadratic(coefficients=(-3, 3)).freeze()
+    copy = pickle.loads(pickle.dumps(frozen))
+
+    u = np.random.uniform(0, 6, 20)
+    np.testing.assert_array_equal(copy(u, u[::-1]), frozen(u, u[::-1]))
+
+
+def test_frozen_lr_spline_shared_memory(refined_biquadratic):
+    # multiprocessing.shared_memory is new in Python 3.8
+    pytest.importorskip('multiprocessing.shared_memory')
+    frozen = refined_biquadratic(coefficients=(-3, 3)).freeze()
+    shm, handle = frozen.to_shared_memory()
+    try:
+        attached = FrozenLRSpline.from_shared_memory(pickle.loads(pickle.dumps(handle)))
+        u = np.random.uniform(0, 6, 50)
+        np.testing.assert_array_equal(attached(u, u[::-1]), frozen(u, u[::-1]))
+
+        # pickling an attached spline copies the arrays out of the shared block
+        copy = pickle.loads(pickle.dumps(attached))
+        np.testing.assert_array_equal(copy(u, u[::-1]), frozen(u, u[::-1]))
+        del attached
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_frozen_lr_spline_builds_univariate_tables(refined_biquadratic):
+    from LRSplines.frozen_lr_spline import FROZEN_ARRAYS
+
+    LR = refined_biquadratic(coefficients=(-3, 3))
+    arrays = LR.freeze().arrays
+    frozen = FrozenLRSpline({key: arrays[key] for key in FROZEN_ARRAYS})
+
+    u, v = np.random.uniform(0, 6, 100), np.random.uniform(0, 6, 100)
+    assert set(frozen.arrays) == set(arrays)
+    np.testing.assert_allclose(frozen(u, v), LR.evaluate(u, v), atol=1.0e-14)
@@ -0,0 +1,11 @@
+import json
+import subprocess
+import sys
+
+
+def test_import_does_not_load_plotting_stack():
+    script = 'import json, sys, LRSplines; print(json.dumps(sorted(sys.modules)))'
+    modules = json.loads(subprocess.check_output([sys.executable, '-c', script]).decode())
+
+    assert 'numpy' in modules
+    assert not [m for m in modules if m.split('.')[0] in ('matplotlib', 'mpl_toolkits')]
@@ -0,0 +1,54 @@
+from LRSplines.instrumentation import RefinementStats, phase
+from LRSplines.lr_spline import init_tensor_product_LR_spline
+from LRSplines.meshline import Meshline
+
+
+def test_instrumentation_disabled_by_default():
+    LR = init_tensor_product_LR_spline(1, 1, [0, 0, 1, 2, 2], [0, 0, 1, 2, 2])
+    assert LR.stats is None
+
+    LR.insert_line(Meshline(0, 2, constant_value=0.5, axis=0))
+    assert LR.stats is None
+
+
+def test_instrumentation_insert_line():
+    LR = init_tensor_product_LR_spline(1, 1, [0, 1, 2, 3], [0, 1, 2])
+    stats = LR.instrument()
+
+    LR.insert_line(Meshline(0, 2, constant_value=0.5, axis=1))
+
+    for name in ['insert_line', 'merge_meshlines', 'split_basis', 'split_new_basis', 'split_elements',
+                 'support_update']:
+        assert stats.calls[name] == 1
+        assert stats.timers[name] >= 0
+
+    assert stats.counters['lines_inserted'] == 1
+    assert stats.counters['splits_performed'] == 1
+    assert stats.counters['elements_split'] == 2
+    assert stats.counters['support_pair_tests'] == len(LR.S) * len(LR.M)
+    assert stats.counters['cache_invalidations'] == 1
+
+    # inserting the same line again is detected while merging
+    LR.insert_line(Meshline(0, 2, constant_value=0.5, axis=1))
+    assert stats.counters['lines_already_present'] == 1
+    assert stats.counters['lines_inserted'] == 1
+
+
+def test_instrumentation_callback_and_refine():
+    events = []
+    LR = init_tensor_product_LR_spline(2, 2, [0, 0, 0, 1, 2, 3, 3, 3], [0, 0, 0, 1, 2, 3, 3, 3])
+    stats = LR.instrument(RefinementStats(callback=lambda name, seconds, s: events.append(name)))
+
+    LR.refine(0.2, lambda e: e.area)
+
+    assert stats.counters['refinement_steps'] == stats.calls['insert_line'] > 0
+    assert stats.calls['select_element'] == stats.counters['refinement_steps']
+    assert events.count('insert_line') == stats.calls['insert_line']
+
+    stats.reset()
+    assert stats.as_dict() == {'timers': {}, 'calls': {}, 'counters': {}}
+
+
+def test_null_phase():
+    with phase(None, 'anything'):
+        pass
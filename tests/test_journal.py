@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pytest
+
+from LRSplines.journal import RefinementJournal
+from LRSplines.lr_spline import LRSpline
+from LRSplines.meshline import Meshline
+
+
+def _assert_same(LR, other):
+    assert len(LR.S) == len(other.S)
+    assert len(LR.M) == len(other.M)
+    u = np.random.uniform(0, 6, 50)
+    v = np.random.uniform(0, 6, 50)
+    np.testing.assert_allclose(other.evaluate(u, v), LR.evaluate(u, v), atol=1.0e-13)
+
+
+def test_insert_lines_matches_insert_line(refined_biquadratic):
+    LR = refined_biquadratic(lines=0, coefficients=(-3, 3))
+    lines = []
+    np.random.seed(1)
+    for k in range(12):
+        m = LR.get_minimal_span_meshline(np.random.choice(LR.M), axis=k % 2)
+        # insert_line may extend the meshline while merging, so a copy is kept
+        lines.append(Meshline(m.start, m.stop, m.constant_value, m.axis))
+        LR.insert_line(m)
+
+    other = refined_biquadratic(lines=0, coefficients=(-3, 3))
+    stats = other.instrument()
+    other.insert_lines(lines)
+    assert stats.counters['lines_inserted'] == 12
+    assert stats.counters['cache_invalidations'] == 1
+
+    assert sorted(b.knot_average for b in LR.S) == sorted(b.knot_average for b in other.S)
+    _assert_same(LR, other)
+    for e in other.M:
+        assert sum(b.intersects(e) for b in other.S) == len(e.supported_b_splines)
+
+
+def test_journal_replay(tmpdir, refined_biquadratic, refine):
+    path = str(tmpdir.join('journal'))
+    LR = refined_biquadratic(lines=0, coefficients=(-3, 3))
+    journal = LR.record(RefinementJournal(path, checkpoint_every=5))
+    refine(LR, lines=12, seed=1)
+
+    assert journal.lines_recorded == 12
+    assert [c['lines'] for c in journal.checkpoints()] == [0, 5, 10]
+
+    _assert_same(LR, LRSpline.replay(journal))
+    _assert_same(LR, LRSpline.replay(path))
+
+    partial = refined_biquadratic(lines=0, coefficients=(-3, 3))
+    refine(partial, lines=7, seed=1)
+    _assert_same(partial, LRSpline.replay(journal, upto=7))
+
+    with pytest.raises(ValueError):
+        LRSpline.replay(journal, upto=13)
+
+
+def test_journal_refine_and_resume(tmpdir, refined_biquadratic):
+    path = str(tmpdir.join('journal'))
+    LR = refined_biquadratic(lines=0, coefficients=(-3, 3))
+    LR.record(RefinementJournal(path, checkpoint_every=3))
+    LR.refine(0.2, lambda e: e.area)
+
+    entries = RefinementJournal(path).entries()
+    assert entries[1] == {'op': 'refine', 'beta': 0.2, 'strategy': 'minimal', 'lines': 0}
+
+    # a truncated entry left by an interrupted write is discarded when the journal is reopened
+    with open(os.path.join(path, 'journal.jsonl'), 'a') as f:
+        f.write('{"op": "li')
+    journal = RefinementJournal(path, checkpoint_every=3)
+
+    restored = LRSpline.replay(journal)
+    _assert_same(LR, restored)
+
+    # recording continues where the journal left off
+    restored.record(journal)
+    restored.insert_line(restored.get_minimal_span_meshline(restored.M[0], axis=0))
+    LR.journal = None
+    LR.insert_line(LR.get_minimal_span_meshline(LR.M[0], axis=0))
+    _assert_same(LR, LRSpline.replay(path))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc to name the synced files')
+def test_journal_is_flushed_to_disk(tmpdir, monkeypatch, refined_biquadratic, refine):
+    synced = []
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        synced.append(os.readlink('/proc/self/fd/{}'.format(fd)))
+        fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', recording_fsync)
+    path = os.path.realpath(str(tmpdir.join('journal')))
+    LR = refined_biquadratic(lines=0)
+    journal = LR.record(RefinementJournal(path, checkpoint_every=5))
+    refine(LR, lines=6, seed=1)
+
+    # every entry is synced as it is appended
+    appends = [i for i, name in enumerate(synced) if name == os.path.join(path, 'journal.jsonl')]
+    assert len(appends) == len(journal.entries())
+
+    # the saved state of a checkpoint, and its directory entry, are synced before the checkpoint entry
+    checkpoints = [i for i, name in enumerate(synced) if name == os.path.join(path, 'checkpoints')]
+    assert len(checkpoints) == len(journal.checkpoints()) == 2
+    for i in checkpoints:
+        assert i + 1 in appends
+        state = synced[max([a for a in appends if a < i], default=-1) + 1:i]
+        assert [os.path.basename(name) for name in state if name.endswith('.json')] == ['meta.json']
+        saved = os.listdir(journal.checkpoint_path(journal.checkpoints()[0]))
+        assert len([name for name in state if name.endswith('.npy')]) == len(saved) - 1
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from LRSplines.lr_reader import dumps_lr, loads_lr, read_lr, write_lr
+
+# a bilinear tensor product surface on [0, 1]^2 with a single interior knot at u = 0.5, as written by GoTools.
+BILINEAR = """# LRSPLINE SURFACE
+#	p1	p2	Nbasis	Nline	Nel	dim	rat
+	1	1	6	5	2	1	0
+# Basis functions:
+0: [0 0 0.5 ] [0 0 1 ] 0 (1)
+1: [0 0.5 1 ] [0 0 1 ] 0.5 (1)
+2: [0.5 1 1 ] [0 0 1 ] 1 (1)
+3: [0 0 0.5 ] [0 1 1 ] 2 (1)
+4: [0 0.5 1 ] [0 1 1 ] 2.5 (1)
+5: [0.5 1 1 ] [0 1 1 ] 3 (1)
+# Mesh lines:
+0 x [0, 1] (2)
+0.5 x [0, 1] (1)
+1 x [0, 1] (2)
+[0, 1] x 0 (2)
+[0, 1] x 1 (2)
+# Elements:
+0 [2] : (0, 0) x (0.5, 1)    { 0 1 3 4}
+1 [2] : (0.5, 0) x (1, 1)    { 1 2 4 5}
+"""
+
+
+def test_read_lr_bilinear():
+    LR = loads_lr(BILINEAR)
+
+    assert len(LR.S) == 6
+    assert len(LR.M) == 2
+    assert len(LR.meshlines) == 5
+    assert [m.axis for m in LR.meshlines] == [0, 0, 0, 1, 1]
+    assert [m.multiplicity for m in LR.meshlines] == [2, 1, 2, 2, 2]
+    np.testing.assert_array_equal(LR.global_knots_u, [0, 0.5, 1])
+    np.testing.assert_array_equal(LR.global_knots_v, [0, 1])
+
+    assert [b.west for b in LR.S] == [True, False, False, True, False, False]
+    assert [b.east for b in LR.S] == [False, False, True, False, False, True]
+    assert [b.end_u for b in LR.S] == [False, True, True, False, True, True]
+    assert all(b.end_v for b in LR.S)
+    assert all(len(b.elements_of_support) == (1 if b.west or b.east else 2) for b in LR.S)
+
+    # the coefficients are u + 2v, which is reproduced exactly by the bilinear basis
+    u = np.array([0, 0.25, 0.5, 0.75, 1])
+    v = np.array([1, 0.5, 0.2, 0, 1])
+    np.testing.assert_allclose(LR.evaluate(u, v), u + 2 * v, atol=1.0e-14)
+
+
+def test_lr_round_trip(refined_biquadratic):
+    LR = refined_biquadratic(coefficients=(-3, 3))
+    copy = loads_lr(dumps_lr(LR))
+
+    assert len(copy.S) == len(LR.S)
+    assert len(copy.M) == len(LR.M)
+    for b, c in zip(LR.S, copy.S):
+        assert b == c
+        assert (b.end_u, b.end_v, b.north, b.south, b.east, b.west) == \
+               (c.end_u, c.end_v, c.north, c.south, c.east, c.west)
+        assert b.weight == c.weight
+        assert len(b.elements_of_support) == len(c.elements_of_support)
+    # the file numbers the basis functions by position
+    positions = {id(b): k for k, b in enumerate(LR.S)}
+    for e, f in zip(LR.M, copy.M):
+        assert e == f
+        assert [positions[id(b)] for b in e.supported_b_splines] == [b.id for b in f.supported_b_splines]
+
+    u = np.append(np.random.uniform(0, 6, 50), [0, 6])
+    v = np.append(np.random.uniform(0, 6, 50), [6, 0])
+    np.testing.assert_array_equal(copy.evaluate(u, v), LR.evaluate(u, v))
+    np.testing.assert_array_equal(copy.evaluate(u, v, r2=1), LR.evaluate(u, v, r2=1))
+
+    # the copy can be refined further
+    copy.insert_line(copy.get_minimal_span_meshline(copy.M[0], axis=0))
+    np.testing.assert_allclose(copy.evaluate(u, v), LR.evaluate(u, v), atol=1.0e-13)
+
+
+def test_lr_round_trip_file_vector_coefficients(tmpdir, refined_biquadratic):
+    LR = refined_biquadratic(lines=4, coefficients=(-3, 3))
+    LR.coefficients = np.random.uniform(-1, 1, (len(LR.S), 3))
+    filename = str(tmpdir.join('surface.lr'))
+
+    write_lr(LR, filename)
+    copy = read_lr(filename)
+
+    np.testing.assert_array_equal(copy.coefficients, LR.coefficients)
+
+
+def test_read_lr_malformed():
+    with pytest.raises(ValueError):
+        loads_lr(BILINEAR.replace('6\t5\t2', '7\t5\t2'))
+    with pytest.raises(NotImplementedError):
+        loads_lr(BILINEAR.replace('1\t0\n', '1\t1\n', 1))
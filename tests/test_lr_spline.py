@@ -1,9 +1,10 @@
 from collections import Counter
 
 import numpy as np
+import pytest
 
 from LRSplines.b_spline import BSpline
-from LRSplines.element import Element
+from LRSplines.element import Element, connect_elements
 from LRSplines.lr_spline import init_tensor_product_LR_spline, LRSpline, _at_end
 from LRSplines.meshline import Meshline
 
@@ -198,3 +199,175 @@ def test_lr_spline_global_knot_vector():
 
 def test_lr_spline_edge_functions():
     pass
+
+
+def test_lr_spline_pickle():
+    import pickle
+
+    LR = init_tensor_product_LR_spline(1, 1, [0, 0, 1, 2, 2], [0, 0, 1, 2, 2])
+    LR.insert_line(Meshline(0, 2, constant_value=0.5, axis=0))
+    LR(0.25, 0.25)
+
+    copy = pickle.loads(pickle.dumps(LR))
+
+    assert len(copy.S) == len(LR.S) and len(copy.M) == len(LR.M)
+    assert copy.last_element is None
+    assert [len(e.fetch_neighbours()) for e in copy.M] == [len(e.fetch_neighbours()) for e in LR.M]
+    np.testing.assert_allclose(copy.evaluate([0.25, 1.5], [0.25, 1.5]), LR.evaluate([0.25, 1.5], [0.25, 1.5]))
+
+
+def test_lr_spline_point_location_hint():
+    LR = init_tensor_product_LR_spline(1, 1, [0, 0, 1, 2, 2], [0, 0, 1, 2, 2])
+    e = LR.M[-1]
+
+    assert LR.find_element_containing_point(1.5, 1.5, hint=e) is e
+    assert LR.find_element_containing_point(0.5, 0.5, hint=e).contains(0.5, 0.5)
+
+
+def test_lr_spline_neighbours_after_refinement(refined_biquadratic):
+    LR = refined_biquadratic(seed=3)
+
+    def adjacency(elements):
+        return [[sorted(id(n) for n in e.neighbours[side]) for side in range(4)] for e in elements]
+
+    maintained = adjacency(LR.M)
+    connect_elements(LR.M)
+    assert maintained == adjacency(LR.M)
+
+    for e in LR.M:
+        for n in e.fetch_neighbours():
+            assert n is not e and not e.intersects(n)
+            assert id(e) in map(id, n.fetch_neighbours())
+
+
+def test_lr_spline_point_location_walk():
+    ku = [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    LR.insert_line(Meshline(0, 6, 2.5, 0))
+    LR.insert_line(Meshline(1, 4, 1.5, 1))
+
+    np.random.seed(0)
+    for u, v in np.random.uniform(0, 6, (100, 2)):
+        e = LR.find_element_containing_point(u, v)
+        assert e.contains(u, v) and e is LR.last_element
+    for start in LR.M:
+        assert LR.find_element_containing_point(6, 6, hint=start).contains(6, 6)
+    with pytest.raises(ValueError):
+        LR.find_element_containing_point(6.5, 3)
+
+
+def _coefficients_by_id(LR):
+    c = np.zeros((LR.id_capacity,) + LR.coefficients.shape[1:])
+    c[LR.active_ids] = LR.coefficients
+    return c
+
+
+def test_lr_spline_refinement_delta():
+    ku = [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    deltas = []
+    LR.subscribe(deltas.append)
+    np.random.seed(3)
+    LR.coefficients = np.random.uniform(-1, 1, (len(LR.S), 2))
+
+    for k in range(8):
+        old_coefficients = _coefficients_by_id(LR)
+        old_functions = {b.id: b for b in LR.S}
+        old_M = [(e.u_min, e.v_min, e.u_max, e.v_max) for e in LR.M]
+        delta = LR.insert_line(LR.get_minimal_span_meshline(np.random.choice(LR.M), axis=k % 2))
+
+        assert deltas[-1] is delta
+        assert delta.old_dimension == len(old_functions) and delta.new_dimension == len(LR.S)
+        assert delta.new_capacity == LR.id_capacity
+        np.testing.assert_allclose(delta.transfer(old_coefficients), _coefficients_by_id(LR), atol=1.0e-14)
+        T = delta.transfer_matrix()
+        np.testing.assert_allclose(T.sum(axis=1)[LR.active_ids], 1)
+        np.testing.assert_allclose(T @ old_coefficients, _coefficients_by_id(LR), atol=1.0e-14)
+
+        # ids are stable, and retired ids are not recycled by the same insertion
+        assert not set(delta.removed) & set(delta.added)
+        for i, b in old_functions.items():
+            if i in delta.removed:
+                assert b not in LR.S
+            else:
+                assert LR.basis_function(i) is b
+        for i in delta.added:
+            assert LR.basis_function(i) not in old_functions.values()
+        assert len(delta.removed) + len(delta.added) > 0
+
+        new_elements = list(delta.new_elements)
+        assert new_elements == list(range(len(old_M), len(LR.M)))
+        assert len(delta.split_elements) == len(new_elements)
+        for k in delta.split_elements:
+            assert LR.M[k].area < (old_M[k][2] - old_M[k][0]) * (old_M[k][3] - old_M[k][1])
+
+    # inserting an existing line changes nothing
+    delta = LR.insert_line(delta.meshlines[0])
+    assert not delta.changed
+    np.testing.assert_array_equal(delta.transfer(_coefficients_by_id(LR)), _coefficients_by_id(LR))
+
+
+def test_lr_spline_refinement_delta_merged_functions():
+    ku = [0, 0, 0, 1, 2, 3, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    np.random.seed(0)
+    LR.coefficients = np.random.uniform(-1, 1, len(LR.S))
+
+    modified = 0
+    for k in range(10):
+        old_coefficients = _coefficients_by_id(LR)
+        e = max(LR.M, key=lambda e: e.area / (1 + e.midpoint[0] + e.midpoint[1]))
+        delta = LR.insert_line(LR.get_minimal_span_meshline(e, axis=k % 2))
+        modified += len(delta.modified)
+        np.testing.assert_allclose(delta.transfer(old_coefficients), _coefficients_by_id(LR), atol=1.0e-14)
+    assert modified > 0
+
+
+def test_lr_spline_refinement_delta_batch():
+    ku = [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    np.random.seed(4)
+    LR.coefficients = np.random.uniform(-1, 1, len(LR.S))
+    old_coefficients = _coefficients_by_id(LR)
+    lines = [Meshline(0, 6, constant_value=0.5, axis=0), Meshline(0, 2, constant_value=1.5, axis=1),
+             Meshline(1, 2, constant_value=0.25, axis=1)]
+
+    delta = LR.insert_lines(lines)
+    np.testing.assert_allclose(delta.transfer(old_coefficients), _coefficients_by_id(LR), atol=1.0e-14)
+    assert len(delta.meshlines) == 3
+
+
+def test_lr_spline_stable_ids():
+    ku = [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    np.testing.assert_array_equal(LR.active_ids, np.arange(len(LR.S)))
+
+    first = LR.insert_line(Meshline(0, 6, constant_value=0.5, axis=0))
+    assert list(first.added) == list(range(first.old_capacity, LR.id_capacity))
+    assert sorted(LR.active_ids) == sorted(set(range(LR.id_capacity)) - set(first.removed))
+
+    # the ids retired by the first insertion are recycled, smallest first
+    second = LR.insert_line(Meshline(0, 6, constant_value=1.5, axis=0))
+    assert list(second.added[:len(first.removed)]) == list(first.removed)
+    for i, b in zip(LR.active_ids, LR.S):
+        assert LR.basis_function(i) is b
+    with pytest.raises(KeyError):
+        LR.basis_function(LR.id_capacity)
+
+    u = np.random.uniform(0, 6, 20)
+    before = LR.evaluate(u, u[::-1])
+    functions = list(LR.S)
+    old_ids = LR.active_ids.copy()
+    old_to_new = LR.compact()
+    np.testing.assert_array_equal(LR.active_ids, np.arange(len(LR.S)))
+    np.testing.assert_array_equal(old_to_new[old_ids], np.arange(len(LR.S)))
+    assert LR.S == functions
+    np.testing.assert_array_equal(LR.evaluate(u, u[::-1]), before)
+
+
+def test_get_element_containing_point():
+    LR = init_tensor_product_LR_spline(2, 2, [0, 0, 0, 1, 2, 3, 3, 3], [0, 0, 0, 1, 2, 4, 4, 4])
+
+    for u, v in [(0.5, 0.5), (2.5, 3.5), (1, 2), (0, 3.9)]:
+        e = LR.get_element_containing_point(u, v)
+        assert e.u_min <= u < e.u_max and e.v_min <= v < e.v_max
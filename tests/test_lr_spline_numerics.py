@@ -1,7 +1,9 @@
 import numpy as np
 import pytest
 
+from LRSplines import evaluation
 from LRSplines.lr_spline import init_tensor_product_LR_spline
+from LRSplines.meshline import Meshline
 
 
 @pytest.mark.parametrize("N", [2, 4, 6, 8])
@@ -157,3 +159,312 @@ def test_lr_spline_at_end_vs_knots_refined():
             assert ku[-1] in b.knots_u
         if b.end_v:
             assert kv[-1] in b.knots_v
+
+
+def test_lr_spline_batch_evaluation_matches_pointwise(refined_biquadratic):
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, len(LR.S))
+
+    u = np.append(np.random.uniform(0, 6, 50), [0, 6, 6, 2])
+    v = np.append(np.random.uniform(0, 6, 50), [6, 0, 6, 2])
+
+    expected = [LR(x, y) for x, y in zip(u, v)]
+    np.testing.assert_allclose(LR.evaluate(u, v), expected, atol=1.0e-14)
+
+
+def test_lr_spline_batch_partition_of_unity(refined_biquadratic):
+    LR = refined_biquadratic()
+    X, Y = np.meshgrid(np.linspace(0, 6, 13), np.linspace(0, 6, 13))
+
+    z = LR.evaluate(X, Y)
+    assert z.shape == X.shape
+    np.testing.assert_allclose(z, 1)
+    np.testing.assert_allclose(LR.evaluate(X, Y, r1=1), 0, atol=1.0e-13)
+
+
+def test_lr_spline_batch_derivatives(refined_biquadratic):
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, len(LR.S))
+    u = np.random.uniform(0, 6, 30)
+    v = np.random.uniform(0, 6, 30)
+
+    for r1, r2 in [(1, 0), (0, 1), (1, 1), (2, 0)]:
+        expected = [sum(b.coefficient * b(x, y, r1=r1, r2=r2) for b in
+                        LR.find_element_containing_point(x, y).supported_b_splines) for x, y in zip(u, v)]
+        np.testing.assert_allclose(LR.evaluate(u, v, r1=r1, r2=r2), expected, atol=1.0e-12)
+
+
+def test_lr_spline_vector_coefficients(refined_biquadratic):
+    LR = refined_biquadratic(lines=6)
+    C = np.random.uniform(-3, 3, (len(LR.S), 3))
+    LR.coefficients = C
+    np.testing.assert_allclose(LR.coefficients, C)
+
+    u = np.random.uniform(0, 6, 40)
+    v = np.random.uniform(0, 6, 40)
+    values = LR.evaluate(u, v)
+    assert values.shape == (40, 3)
+
+    for k in range(3):
+        LR.coefficients = C[:, k]
+        np.testing.assert_allclose(LR.evaluate(u, v), values[:, k], atol=1.0e-14)
+
+    LR.coefficients = C
+    np.testing.assert_allclose(LR(u[0], v[0]), values[0], atol=1.0e-14)
+
+    # refinement transfers all components of the coefficients, leaving the surface unchanged
+    for k in range(6):
+        m = LR.get_minimal_span_meshline(np.random.choice(LR.M), axis=k % 2)
+        LR.insert_line(m)
+    assert LR.coefficients.shape == (len(LR.S), 3)
+    np.testing.assert_allclose(LR.evaluate(u, v), values, atol=1.0e-12)
+
+
+def test_lr_spline_coefficients_cached(refined_biquadratic):
+    LR = refined_biquadratic(lines=6)
+    C = np.random.uniform(-3, 3, len(LR.S))
+    LR.coefficients = C
+    C[0] = 10
+    assert LR.coefficients is LR.coefficients
+    assert LR.coefficients[0] != 10
+    with pytest.raises(ValueError):
+        LR.coefficients[0] = 10
+
+    # writes to single B-splines invalidate the cached array, of their own LR-spline only
+    other = refined_biquadratic(lines=2)
+    cached = other.coefficients
+    LR.S[1].coefficient = 7
+    assert LR.coefficients[1] == 7
+    assert other.coefficients is cached
+
+    previous = LR.coefficients
+    m = LR.get_minimal_span_meshline(LR.M[0], axis=0)
+    LR.insert_line(m)
+    assert LR.coefficients is not previous
+    assert LR.coefficients.shape == (len(LR.S),)
+    assert other.coefficients is cached
+
+    # vector valued coefficients are replaced, not changed in place
+    LR.coefficients = np.random.uniform(-3, 3, (len(LR.S), 2))
+    with pytest.raises(ValueError):
+        LR.S[0].coefficient[0] = 10
+    LR.S[0].coefficient = np.array([10, 11])
+    np.testing.assert_array_equal(LR.coefficients[0], [10, 11])
+
+
+def test_lr_spline_evaluate_outside_domain(refined_biquadratic):
+    LR = refined_biquadratic(lines=0)
+    with pytest.raises(ValueError):
+        LR.evaluate([1, 7], [1, 1])
+
+
+def test_lr_spline_location_tables_on_diagonal_refinement():
+    ku = [0, 0, 0, 1, 2, 3, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    for level in range(2):
+        LR.refine(beta=0.5, error_function=lambda e: e.area * np.exp(-10 * abs(e.midpoint[0] - e.midpoint[1])))
+    arrays = LR._evaluation_arrays()
+    # every local line adds a row or column to the global tensor grid, but only a few records to the tables
+    assert (len(arrays['grid_u']) - 1) * (len(arrays['grid_v']) - 1) > 4 * len(LR.M)
+    assert len(arrays['location_keys']) < 3 * len(LR.M)
+
+    np.random.seed(0)
+    u = np.r_[np.random.uniform(0, 6, 500), np.random.choice(arrays['grid_u'], 200)]
+    v = np.r_[np.random.choice(arrays['grid_v'], 200), np.random.uniform(0, 6, 500)]
+    elements = LR._locate_elements(u, v)
+    for x, y, k in zip(u, v, elements):
+        e = LR.M[k]
+        assert e.u_min <= x <= e.u_max and e.v_min <= y <= e.v_max
+        # points on interior element boundaries belong to the element above / to the right
+        assert (x < e.u_max or x == 6) and (y < e.v_max or y == 6)
+
+
+def test_lr_spline_evaluate_parallel(refined_biquadratic):
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, (len(LR.S), 2))
+    u = np.random.uniform(0, 6, 1000)
+    v = np.random.uniform(0, 6, 1000)
+
+    expected = LR.evaluate(u, v)
+    np.testing.assert_allclose(LR.evaluate_parallel(u, v, workers=4, chunk_size=64), expected)
+    np.testing.assert_allclose(LR.evaluate_parallel(u, v, workers=3, r1=1), LR.evaluate(u, v, r1=1))
+
+    with pytest.raises(ValueError):
+        LR.evaluate_parallel([1, 7], [1, 1], workers=2)
+
+
+def test_lr_spline_concurrent_pointwise_evaluation(refined_biquadratic):
+    from concurrent.futures import ThreadPoolExecutor
+
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, len(LR.S))
+    points = np.random.uniform(0, 6, (4, 200, 2))
+    expected = [[LR(x, y) for x, y in p] for p in points]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        computed = list(pool.map(lambda p: [LR(x, y) for x, y in p], points))
+
+    np.testing.assert_allclose(computed, expected)
+
+
+def test_lr_spline_greville_points(refined_biquadratic):
+    LR = refined_biquadratic()
+    expected = np.array([b.knot_average for b in LR.S])
+    np.testing.assert_allclose(LR.greville_points(), expected)
+
+
+@pytest.mark.parametrize("solver", ['direct', 'iterative'])
+def test_lr_spline_interpolate_greville(solver):
+    ku = [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    LR.insert_line(Meshline(0, 6, 2.5, 0))
+    LR.insert_line(Meshline(0, 6, 3.5, 1))
+
+    np.random.seed(1)
+    expected = np.random.uniform(-1, 1, (len(LR.S), 2))
+    LR.coefficients = expected
+    frozen = LR.freeze()
+
+    LR.coefficients = np.zeros(len(LR.S))
+    np.testing.assert_allclose(LR.interpolate_greville(frozen, solver=solver), expected, atol=1.0e-8)
+    np.testing.assert_allclose(LR.coefficients, expected, atol=1.0e-8)
+
+    with pytest.raises(ValueError):
+        LR.interpolate_greville(frozen, solver='unknown')
+
+
+def test_lr_spline_derivatives(refined_biquadratic):
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, len(LR.S))
+    u = np.append(np.random.uniform(0, 6, (10, 20)), np.full((1, 20), 6), axis=0)
+    v = np.random.uniform(0, 6, (11, 20))
+
+    values, gradient, hessian = LR.derivatives(u, v)
+    assert gradient.shape == u.shape + (2, ) and hessian.shape == u.shape + (2, 2)
+    np.testing.assert_allclose(values, LR.evaluate(u, v), atol=1.0e-13)
+    np.testing.assert_allclose(gradient[..., 0], LR.evaluate(u, v, r1=1), atol=1.0e-12)
+    np.testing.assert_allclose(gradient[..., 1], LR.evaluate(u, v, r2=1), atol=1.0e-12)
+    np.testing.assert_allclose(hessian[..., 0, 0], LR.evaluate(u, v, r1=2), atol=1.0e-11)
+    np.testing.assert_allclose(hessian[..., 0, 1], LR.evaluate(u, v, r1=1, r2=1), atol=1.0e-11)
+    np.testing.assert_allclose(hessian[..., 1, 0], hessian[..., 0, 1])
+    np.testing.assert_allclose(hessian[..., 1, 1], LR.evaluate(u, v, r2=2), atol=1.0e-11)
+
+
+def test_lr_spline_derivatives_vector_valued(refined_biquadratic):
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, (len(LR.S), 3))
+    u, v = np.random.uniform(0, 6, 50), np.random.uniform(0, 6, 50)
+
+    derivatives = LR.derivatives(u, v, order=3, chunk_size=16)
+    assert [d.shape for d in derivatives] == [(50, 3), (50, 3, 2), (50, 3, 2, 2), (50, 3, 2, 2, 2)]
+    np.testing.assert_allclose(derivatives[1][..., 1], LR.evaluate(u, v, r2=1), atol=1.0e-12)
+    np.testing.assert_allclose(derivatives[3][..., 0, 1, 0], LR.evaluate(u, v, r1=2, r2=1), atol=1.0e-10)
+    np.testing.assert_allclose(derivatives[3][..., 1, 1, 1], 0, atol=1.0e-10)
+
+
+def test_lr_spline_univariate_tables(refined_biquadratic):
+    from LRSplines.evaluation import univariate_tables
+
+    LR = refined_biquadratic()
+    arrays = LR._evaluation_arrays()
+    tables = univariate_tables(arrays)
+    indptr, indices = arrays['element_indptr'], arrays['element_indices']
+    for d in 'uv':
+        knots_indptr, knots = tables['element_knots_indptr_' + d], tables['element_knots_' + d]
+        slots = tables['element_slots_' + d]
+        assert len(tables['unique_knots_' + d]) < len(LR.S)
+        assert len(knots) < len(indices)
+        for k in range(len(LR.M)):
+            factors = knots[knots_indptr[k]:knots_indptr[k + 1]]
+            for entry in range(indptr[k], indptr[k + 1]):
+                factor, i = factors[slots[entry]], indices[entry]
+                np.testing.assert_array_equal(tables['unique_knots_' + d][factor], arrays['knots_' + d][i])
+                assert tables['unique_end_' + d][factor] == arrays['end_' + d][i]
+
+    # evaluation with the shared univariate factors matches the pointwise evaluation
+    LR.coefficients = np.random.uniform(-3, 3, len(LR.S))
+    u = np.append(np.random.uniform(0, 6, 50), [0, 6, 6])
+    v = np.append(np.random.uniform(0, 6, 50), [6, 0, 6])
+    np.testing.assert_allclose(LR.evaluate(u, v), [LR(x, y) for x, y in zip(u, v)], atol=1.0e-13)
+
+
+def test_lr_spline_morton_order(monkeypatch, refined_biquadratic):
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, len(LR.S))
+    u, v = np.random.uniform(0, 6, 500), np.random.uniform(0, 6, 500)
+    expected = LR.evaluate(u, v)
+    elements, coefficients = list(LR.M), LR.coefficients
+    ids = LR.active_ids.copy()
+
+    element_order, basis_order = LR.morton_order()
+    assert [id(e) for e in LR.M] == [id(elements[k]) for k in element_order]
+    np.testing.assert_array_equal(LR.active_ids, ids[basis_order])
+    np.testing.assert_array_equal(LR.coefficients, coefficients[basis_order])
+
+    # the elements follow a Z-order curve, which visits the lower left quadrant first
+    midpoints = np.array([e.midpoint for e in LR.M])
+    assert np.all(midpoints[:len(LR.M) // 8] <= 3)
+
+    np.testing.assert_allclose(LR.evaluate(u, v), expected, atol=1.0e-13)
+    np.testing.assert_allclose(LR.evaluate(u, v, sort_points=True, chunk_size=64), expected, atol=1.0e-13)
+    np.testing.assert_allclose(LR.freeze().evaluate(u, v, sort_points=True), expected, atol=1.0e-13)
+
+    # the sorted evaluation locates the points once, and hands the elements to the kernel
+    located = []
+    locate_elements = evaluation.locate_elements
+    monkeypatch.setattr(evaluation, 'locate_elements', lambda *args: located.append(1) or locate_elements(*args))
+    np.testing.assert_allclose(LR.evaluate(u, v, sort_points=True, chunk_size=64), expected, atol=1.0e-13)
+    assert len(located) == 1
+
+    LR.subscribe(lambda delta: None)
+    with pytest.raises(ValueError):
+        LR.morton_order()
+
+
+def test_lr_spline_sorted_evaluation_by_element_polynomials(refined_biquadratic):
+    LR = refined_biquadratic()
+    LR.coefficients = np.random.uniform(-3, 3, (len(LR.S), 2))
+    # enough points per element for the polynomial kernel, and points on the element boundaries
+    u = np.append(np.random.uniform(0, 6, 2000), [0, 6, 6, 2, 4])
+    v = np.append(np.random.uniform(0, 6, 2000), [6, 0, 6, 2, 1])
+
+    for r1, r2 in [(0, 0), (1, 0), (0, 1), (1, 1), (2, 0), (0, 2)]:
+        np.testing.assert_allclose(LR.evaluate(u, v, r1, r2, sort_points=True), LR.evaluate(u, v, r1, r2),
+                                   atol=1.0e-12)
+
+    # the polynomial of an element interpolates the spline at its corners
+    arrays = LR._evaluation_arrays()
+    polynomials = evaluation.element_polynomials(arrays, np.arange(len(LR.M)), LR.coefficients)
+    assert polynomials.shape == (len(LR.M), 3, 3, 2)
+    e = LR.M[5]
+    np.testing.assert_allclose(polynomials[5].sum(axis=(0, 1)), LR(e.u_max - 1.0e-14, e.v_max - 1.0e-14),
+                               atol=1.0e-12)
+    np.testing.assert_allclose(polynomials[5, 0, 0], LR(e.u_min, e.v_min), atol=1.0e-12)
+
+
+def test_lr_spline_integrals(refined_biquadratic):
+    LR = refined_biquadratic(seed=7, lines=10)
+
+    # partition of unity
+    np.testing.assert_allclose(LR.basis_integrals().sum(), 36)
+    np.testing.assert_allclose(LR.basis_integrals((1, 0.5, 2.5, 5)).sum(), 6.75)
+    np.testing.assert_allclose(LR.basis_moments().sum(axis=0), [108, 108])
+
+    LR.coefficients = np.random.uniform(-1, 1, (len(LR.S), 2))
+    x, w = np.polynomial.legendre.leggauss(3)
+    grid = np.unique(np.concatenate([LR.global_knots_u, [0.5, 1.5, 2.5, 3.5, 4.5, 5.5]]))
+    h = 0.5 * np.diff(grid)
+    points = (grid[:-1, None] + h[:, None] * (x + 1)).ravel()
+    weights = (h[:, None] * w).ravel()
+    U, V = np.meshgrid(points, points, indexing='ij')
+    values = LR.evaluate(U, V)
+
+    np.testing.assert_allclose(LR.integral(), np.einsum('i,j,ijk->k', weights, weights, values), atol=1.0e-12)
+    np.testing.assert_allclose(LR.moments(), [np.einsum('i,j,ij,ijk->k', weights, weights, U, values),
+                                              np.einsum('i,j,ij,ijk->k', weights, weights, V, values)],
+                               atol=1.0e-11)
+
+    inside = (points > 1.5) & (points < 4.5)
+    np.testing.assert_allclose(LR.integral((1.5, 1.5, 4.5, 4.5)),
+                               np.einsum('i,j,ijk->k', weights[inside], weights[inside],
+                                         values[inside][:, inside]), atol=1.0e-12)
@@ -0,0 +1,96 @@
+import numpy as np
+from scipy.sparse.linalg import cg, spsolve
+
+from LRSplines.assembly import AssemblyCache, mass_matrix, stiffness_matrix
+from LRSplines.lr_spline import init_tensor_product_LR_spline
+from LRSplines.multigrid import MultigridSolver, RefinementHierarchy
+
+
+def _hierarchy(levels=3):
+    ku = [0, 0, 0, 1, 2, 3, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    hierarchy = RefinementHierarchy(LR)
+    np.random.seed(0)
+    LR.coefficients = np.random.uniform(-1, 1, len(LR.S))
+    coarse = LR.coefficients.copy()
+    for level in range(levels):
+        # refine towards the corner (0, 0), preferring large elements
+        LR.refine(beta=0.5, error_function=lambda e: e.area / (1 + e.midpoint[0] + e.midpoint[1]))
+        hierarchy.mark_level()
+    return LR, hierarchy, coarse
+
+
+def test_prolongation_is_exact():
+    LR, hierarchy, coarse = _hierarchy()
+    assert hierarchy.levels == 4
+    assert hierarchy.dimensions[-1] == len(LR.S)
+
+    P = hierarchy.prolongation(0)
+    assert P.shape == (len(LR.S), hierarchy.dimensions[0])
+    np.testing.assert_allclose(P @ coarse, LR.coefficients, atol=1.0e-13)
+    # the prolongations preserve the partition of unity
+    for P in hierarchy.prolongations:
+        np.testing.assert_allclose(P @ np.ones(P.shape[1]), 1, atol=1.0e-14)
+    np.testing.assert_allclose(hierarchy.prolongation(1, 3).toarray(),
+                               (hierarchy.prolongations[2] @ hierarchy.prolongations[1]).toarray())
+
+
+def _system(LR):
+    return (AssemblyCache(LR, stiffness_matrix).matrix(dense=True) +
+            AssemblyCache(LR, mass_matrix).matrix(dense=True)).tocsr()
+
+
+def test_multigrid():
+    LR, hierarchy, _ = _hierarchy()
+    A = _system(LR)
+    b = np.random.uniform(-1, 1, len(LR.S))
+    x = spsolve(A.tocsc(), b)
+
+    solver = MultigridSolver(A, hierarchy.prolongations)
+    residuals = []
+    y, info = solver.solve(b, tol=1.0e-10, callback=residuals.append)
+    assert info == 0
+    assert len(residuals) < 20
+    np.testing.assert_allclose(y, x, atol=1.0e-8)
+
+    preconditioned = []
+    cg(A, b, M=solver.aslinearoperator(), callback=lambda _: preconditioned.append(1))
+    plain = []
+    cg(A, b, callback=lambda _: plain.append(1))
+    assert len(preconditioned) < len(plain)
+
+
+def test_multigrid_contraction_rate_is_bounded_across_levels():
+    LR, hierarchy, _ = _hierarchy()
+    A = _system(LR)
+    finest = MultigridSolver(A, hierarchy.prolongations)
+
+    rates = []
+    for level in range(1, hierarchy.levels):
+        A_l = finest.operators[level]
+        b = np.random.uniform(-1, 1, A_l.shape[0])
+        residuals = []
+        _, info = MultigridSolver(A_l, hierarchy.prolongations[:level]).solve(
+            b, tol=1.0e-10, callback=lambda r: residuals.append(np.linalg.norm(r)))
+        assert info == 0
+        rates.append((residuals[-1] / np.linalg.norm(b)) ** (1 / len(residuals)))
+
+    assert max(rates) < 0.3
+    # the rate on the finest level is no worse than the coarsest, up to the fluctuation between right hand sides
+    assert rates[-1] < rates[0] + 0.1
+
+
+def test_multigrid_reports_non_convergence():
+    LR, hierarchy, _ = _hierarchy()
+    A = _system(LR)
+    b = np.random.uniform(-1, 1, len(LR.S))
+    solver = MultigridSolver(A, hierarchy.prolongations)
+
+    residuals = []
+    x, info = solver.solve(b, tol=1.0e-14, maxiter=2, callback=residuals.append)
+    assert info == 2
+    assert len(residuals) == 2
+    np.testing.assert_allclose(b - A @ x, residuals[-1], atol=1.0e-10)
+
+    _, info = solver.solve(b, x=spsolve(A.tocsc(), b), tol=1.0e-10)
+    assert info == 0
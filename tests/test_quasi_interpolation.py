@@ -0,0 +1,55 @@
+import numpy as np
+
+from LRSplines.lr_spline import init_tensor_product_LR_spline
+
+
+def _polynomial(u, v):
+    return 1 - 2 * u + 0.5 * u ** 2 * v ** 2 + 0.25 * u * v ** 2
+
+
+def test_quasi_interpolation_reproduces_polynomials(refined_biquadratic):
+    LR = refined_biquadratic()
+    coefficients = LR.quasi_interpolate(_polynomial)
+    np.testing.assert_allclose(coefficients, LR.coefficients)
+
+    u, v = np.random.uniform(0, 6, 200), np.random.uniform(0, 6, 200)
+    np.testing.assert_allclose(LR.evaluate(u, v), _polynomial(u, v), atol=1.0e-9)
+
+
+def test_quasi_interpolation_reproduces_quadratics_on_overloaded_elements(refined_biquadratic):
+    LR = refined_biquadratic(seed=3, lines=60)
+    assert any(b.overloaded for b in LR.S)
+
+    coefficients = LR.quasi_interpolate(_polynomial)
+    np.testing.assert_allclose(coefficients, LR.coefficients)
+
+    u, v = np.random.uniform(0, 6, 500), np.random.uniform(0, 6, 500)
+    np.testing.assert_allclose(LR.evaluate(u, v), _polynomial(u, v), atol=1.0e-9)
+
+
+def test_quasi_interpolation_reproduces_tensor_product_splines():
+    ku = [0, 0, 0, 1, 2, 4, 5, 6, 6, 6]
+    LR = init_tensor_product_LR_spline(2, 2, ku, ku)
+    np.random.seed(0)
+    expected = np.random.uniform(-1, 1, len(LR.S))
+    LR.coefficients = expected
+    frozen = LR.freeze()
+
+    np.testing.assert_allclose(LR.quasi_interpolate(frozen), expected, atol=1.0e-12)
+
+
+def test_quasi_interpolation_vector_valued_and_parallel(refined_biquadratic):
+    LR = refined_biquadratic()
+
+    def f(u, v):
+        return np.column_stack((u, v, np.sin(u) * np.cos(v)))
+
+    serial = LR.quasi_interpolate(f, workers=1)
+    assert serial.shape == (len(LR.S), 3)
+    np.testing.assert_allclose(LR.quasi_interpolate(f, workers=3, chunk_size=7), serial, atol=1.0e-12)
+
+    u, v = np.random.uniform(0, 6, 100), np.random.uniform(0, 6, 100)
+    values = LR.evaluate(u, v)
+    np.testing.assert_allclose(values[:, 0], u, atol=1.0e-12)
+    np.testing.assert_allclose(values[:, 1], v, atol=1.0e-12)
+    assert np.max(np.abs(values[:, 2] - np.sin(u) * np.cos(v))) < 0.1
@@ -0,0 +1,105 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from LRSplines.storage import load_frozen_lr_spline, load_lr_spline, save_lr_spline
+
+
+def test_save_load_lr_spline(tmpdir, refined_biquadratic):
+    LR = refined_biquadratic(coefficients=(-3, 3))
+    path = str(tmpdir.join('model'))
+    save_lr_spline(LR, path)
+    copy = load_lr_spline(path)
+
+    assert len(copy.S) == len(LR.S)
+    assert len(copy.M) == len(LR.M)
+    assert len(copy.meshlines) == len(LR.meshlines)
+    for b, c in zip(LR.S, copy.S):
+        assert b == c
+        assert (b.end_u, b.end_v, b.north, b.south, b.east, b.west) == \
+               (c.end_u, c.end_v, c.north, c.south, c.east, c.west)
+    assert [e.level for e in LR.M] == [e.level for e in copy.M]
+    np.testing.assert_array_equal(copy.active_ids, LR.active_ids)
+    assert copy.id_capacity == LR.id_capacity
+    np.testing.assert_array_equal(copy.global_knots_u, LR.global_knots_u)
+
+    u = np.random.uniform(0, 6, 50)
+    v = np.random.uniform(0, 6, 50)
+    np.testing.assert_array_equal(copy.evaluate(u, v), LR.evaluate(u, v))
+
+    # the loaded LR-spline can be refined further
+    copy.insert_line(copy.get_minimal_span_meshline(copy.M[0], axis=1))
+    np.testing.assert_allclose(copy.evaluate(u, v), LR.evaluate(u, v), atol=1.0e-13)
+
+
+def test_load_frozen_lr_spline_memory_mapped(tmpdir, refined_biquadratic):
+    LR = refined_biquadratic(coefficients=(-3, 3))
+    LR.coefficients = np.random.uniform(-1, 1, (len(LR.S), 2))
+    path = str(tmpdir.join('model'))
+    save_lr_spline(LR, path)
+
+    frozen = load_frozen_lr_spline(path)
+    base = frozen.coefficients
+    while base.base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert isinstance(base, np.memmap)
+
+    u = np.random.uniform(0, 6, 50)
+    v = np.random.uniform(0, 6, 50)
+    np.testing.assert_array_equal(frozen(u, v), LR.evaluate(u, v))
+    np.testing.assert_array_equal(load_frozen_lr_spline(path, mmap=False)(u, v), LR.evaluate(u, v))
+
+
+def test_load_lr_spline_version_check(tmpdir, refined_biquadratic):
+    path = str(tmpdir.join('model'))
+    with pytest.raises(ValueError):
+        load_lr_spline(path)
+
+    save_lr_spline(refined_biquadratic(lines=2, coefficients=(-3, 3)), path)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    meta['version'] += 1
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError):
+        load_frozen_lr_spline(path)
+
+
+def test_save_lr_spline_replaces_atomically(tmpdir, monkeypatch, refined_biquadratic):
+    path = str(tmpdir.join('model'))
+    old = refined_biquadratic(lines=2, coefficients=(-3, 3))
+    save_lr_spline(old, path)
+    frozen = load_frozen_lr_spline(path)
+    u = np.random.uniform(0, 6, 50)
+    v = np.random.uniform(0, 6, 50)
+
+    # a save interrupted after some of the arrays leaves the old LR-spline intact
+    new = refined_biquadratic(coefficients=(-1, 1))
+    saved = []
+
+    def interrupted_save(file, array, **kwargs):
+        if len(saved) == 5:
+            raise KeyboardInterrupt
+        saved.append(file)
+        np.lib.format.write_array(file, array)
+
+    with monkeypatch.context() as m:
+        m.setattr(np, 'save', interrupted_save)
+        with pytest.raises(KeyboardInterrupt):
+            save_lr_spline(new, path)
+    assert os.listdir(str(tmpdir)) == ['model']
+    np.testing.assert_array_equal(load_lr_spline(path).evaluate(u, v), old.evaluate(u, v))
+
+    save_lr_spline(new, path)
+    assert os.listdir(str(tmpdir)) == ['model']
+    np.testing.assert_array_equal(load_lr_spline(path).evaluate(u, v), new.evaluate(u, v))
+    # arrays memory-mapped from the replaced files stay valid
+    np.testing.assert_array_equal(frozen(u, v), old.evaluate(u, v))
+
+    # directories not holding a saved LR-spline are not replaced
+    other = tmpdir.mkdir('other')
+    other.join('notes.txt').write('')
+    with pytest.raises(ValueError):
+        save_lr_spline(new, str(other))
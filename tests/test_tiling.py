@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from LRSplines.tiling import grid_tiles
+
+
+def test_grid_tiles():
+    tiles = grid_tiles((5, 3), (2, 2))
+    assert tiles == [(0, 2, 0, 2), (0, 2, 2, 3), (2, 4, 0, 2), (2, 4, 2, 3), (4, 5, 0, 2), (4, 5, 2, 3)]
+
+
+def test_evaluate_tiled_matches_evaluate(refined_biquadratic):
+    LR = refined_biquadratic(seed=5, lines=10, coefficients=(-1, 1))
+    u = np.linspace(0, 6, 37)
+    v = np.concatenate([[0, 1, 2, 2.5], np.linspace(3, 6, 20)])
+    expected = LR.evaluate(*np.meshgrid(u, v, indexing='ij'))
+
+    out = np.zeros((len(u), len(v)))
+    assert LR.evaluate_tiled(u, v, out, tile_shape=(8, 5)) is out
+    np.testing.assert_allclose(out, expected, atol=1.0e-13)
+
+    out = np.zeros((len(u), len(v)))
+    LR.evaluate_tiled(u, v, out, tile_shape=(4, 7), workers=3)
+    np.testing.assert_allclose(out, expected, atol=1.0e-13)
+
+    LR.coefficients = np.column_stack((LR.coefficients, -LR.coefficients))
+    out = np.zeros((30, 30, 2))
+    LR.evaluate_tiled(30, 30, out, tile_shape=(16, 16))
+    grid = np.linspace(0, 6, 30)
+    np.testing.assert_allclose(out, LR.evaluate(*np.meshgrid(grid, grid, indexing='ij')), atol=1.0e-13)
+
+    with pytest.raises(ValueError):
+        LR.evaluate_tiled(u, v, np.zeros((len(u), len(v))))
+    with pytest.raises(ValueError):
+        LR.evaluate_tiled(u + 1, v, np.zeros((len(u), len(v), 2)))
+
+
+def test_evaluate_tiled_resume(tmpdir, refined_biquadratic):
+    LR = refined_biquadratic(seed=5, lines=10, coefficients=(-1, 1))
+    path = str(tmpdir.join('raster.npy'))
+    reports = []
+
+    def interrupt(done, total):
+        reports.append((done, total))
+        if done == 5:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        LR.evaluate_tiled(41, 23, path, tile_shape=(10, 10), progress=interrupt)
+    assert reports[0] == (0, 15) and os.path.exists(path + '.tiles')
+
+    reports = []
+    out = LR.evaluate_tiled(41, 23, path, tile_shape=(10, 10), progress=lambda *a: reports.append(a), resume=True)
+    # a tile already running when interrupted still completes
+    assert 5 <= reports[0][0] < 15 and reports[-1] == (15, 15)
+    assert not os.path.exists(path + '.tiles')
+
+    u, v = np.linspace(0, 6, 41), np.linspace(0, 6, 23)
+    expected = LR.evaluate(*np.meshgrid(u, v, indexing='ij'))
+    np.testing.assert_allclose(out, expected, atol=1.0e-13)
+    np.testing.assert_allclose(np.load(path), expected, atol=1.0e-13)
+
+
+def test_evaluate_tiled_resume_refuses_a_different_layout(tmpdir, refined_biquadratic):
+    LR = refined_biquadratic(seed=5, lines=10, coefficients=(-1, 1))
+    path = str(tmpdir.join('raster.npy'))
+
+    def interrupt(done, total):
+        if done == 5:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        LR.evaluate_tiled(41, 23, path, tile_shape=(10, 10), progress=interrupt)
+
+    # the same shape, on a different grid, with a different tiling or with different coefficients
+    with pytest.raises(ValueError):
+        LR.evaluate_tiled(np.linspace(1, 5, 41), 23, path, tile_shape=(10, 10), resume=True)
+    with pytest.raises(ValueError):
+        LR.evaluate_tiled(41, 23, path, tile_shape=(8, 8), resume=True)
+    LR.coefficients = 2 * LR.coefficients
+    with pytest.raises(ValueError):
+        LR.evaluate_tiled(41, 23, path, tile_shape=(10, 10), resume=True)
+    assert os.path.exists(path + '.tiles')
+
+    # a fresh evaluation overwrites the state
+    u = np.linspace(1, 5, 41)
+    out = LR.evaluate_tiled(u, 23, path, tile_shape=(10, 10))
+    expected = LR.evaluate(*np.meshgrid(u, np.linspace(0, 6, 23), indexing='ij'))
+    np.testing.assert_allclose(out, expected, atol=1.0e-13)
+    assert not os.path.exists(path + '.tiles')
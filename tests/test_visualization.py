@@ -0,0 +1,51 @@
+from matplotlib.collections import LineCollection, PolyCollection
+
+from LRSplines.lr_spline import init_tensor_product_LR_spline
+from LRSplines.meshline import Meshline
+from LRSplines.visualization_utils import plot_basis_function, plot_basis_support
+
+
+def test_visualize_mesh_collections():
+    LR = init_tensor_product_LR_spline(2, 2, [0, 0, 0, 1, 2, 3, 3, 3], [0, 0, 0, 1, 2, 3, 3, 3])
+    LR.insert_line(Meshline(start=0, stop=2, constant_value=1.5, axis=0))
+
+    fig = LR.visualize_mesh(show=False)
+    axs = fig.axes[0]
+
+    lines = [c for c in axs.collections if isinstance(c, LineCollection)]
+    polygons = [c for c in axs.collections if isinstance(c, PolyCollection)]
+
+    assert len(lines) == 1 and len(lines[0].get_segments()) == len(LR.meshlines)
+    assert len(polygons) == 1 and len(polygons[0].get_paths()) == len(LR.M)
+    assert len(axs.texts) == len(LR.meshlines) + len(LR.M)
+
+
+def test_visualize_mesh_level_of_detail():
+    LR = init_tensor_product_LR_spline(1, 1, [0, 0, 1, 2, 3, 4, 4], [0, 0, 1, 2, 3, 4, 4])
+
+    fig = LR.visualize_mesh(show=False, label_threshold=len(LR.M) - 1)
+    axs = fig.axes[0]
+
+    assert len(axs.texts) == 0
+    assert all(c.get_rasterized() for c in axs.collections)
+
+
+def test_visualize_mesh_raster_output(tmpdir):
+    LR = init_tensor_product_LR_spline(1, 1, [0, 0, 1, 2, 2], [0, 0, 1, 2, 2])
+    filename = str(tmpdir.join('mesh.png'))
+
+    LR.visualize_mesh(show=False, filename=filename, dpi=50)
+
+    assert tmpdir.join('mesh.png').size() > 0
+
+
+def test_plot_basis_headless(tmpdir):
+    LR = init_tensor_product_LR_spline(1, 1, [0, 0, 1, 2, 2], [0, 0, 1, 2, 2])
+    b = LR.S[4]
+
+    fig = plot_basis_support(LR, b, show=False, filename=str(tmpdir.join('support.png')))
+    assert len(fig.axes[0].collections) == 1
+    assert len(fig.axes[0].patches) == 1
+
+    fig = plot_basis_function(LR, b, N=5, show=False)
+    assert len(fig.axes) == 1